@@ -0,0 +1,224 @@
+import weakref
+import numpy as np
+import pandas as pd
+from station_cube import load_station_data, MONTH_SEASON, POLLUTANTS
+from scenario_simulator import individual_aqi, aqi_category, AQI_CATEGORIES, CONCENTRATION_BREAKPOINTS
+from normalization import GroupedNormalizer, grouped_statistics, SCHEME_SUFFIX
+
+# 城市数据 add_visual_fields 中按AQI达标率划分的污染等级
+POLLUTION_LEVELS = [(0.95, "优秀"), (0.85, "良好"), (0.70, "一般")]
+LOWEST_LEVEL = "较差"
+# 派生字段缓存：以DataFrame对象id为键，对象被回收时自动删除（新版pandas每次访问都会新建访问器实例）
+_CACHES = {}
+
+
+def _same_buffer(left, right):
+    """两列是否共用同一底层数组：扩展数组（如字符串列）比较数组对象本身，NumPy列比较数据地址
+    （两个数组同时存活，地址不会被复用）
+    """
+    a, b = left.array, right.array
+    if not isinstance(a, pd.arrays.NumpyExtensionArray):
+        return a is b
+    a, b = np.asarray(a), np.asarray(b)
+    return a.shape == b.shape and a.__array_interface__['data'][0] == b.__array_interface__['data'][0]
+
+
+@pd.api.extensions.register_dataframe_accessor("airq")
+class AirQualityAccessor:
+    """空气质量派生字段访问器：import airq_accessor 后，对 load_station_data / load_city_data 读入的DataFrame使用
+        df.airq.season, df.airq.aqi, df.airq.mom('PM2.5'), df.airq.normalized('PM2.5', 'zscore', '城市')
+
+    直接 pd.read_csv 读入的预处理CSV没有'年份'列，且时间字段都以2021开头，依赖年份的字段会报错，
+    需先用上述函数读取或自行添加'年份'列（如 df.assign(年份=2023)）
+
+    各字段首次访问时才计算，结果按所依赖列的内容哈希缓存，数据未变时重复访问直接返回缓存；
+    缓存挂在DataFrame对象上，随对象回收。缓存同时持有所依赖列的视图：写时复制下对这些列的任何修改
+    都会换成新的底层数组，重复访问时只比较底层数组地址，地址变化时才重新计算哈希
+    """
+
+    def __init__(self, pandas_obj):
+        if '时间' not in pandas_obj.columns:
+            raise AttributeError("airq访问器需要'时间'列（YYYY-MM）")
+        self._obj = pandas_obj
+        key = id(pandas_obj)
+        if key not in _CACHES:
+            _CACHES[key] = {}
+            weakref.finalize(pandas_obj, _CACHES.pop, key, None)
+        self._cache = _CACHES[key]
+
+    def _version(self, columns):
+        """所依赖列的内容哈希（含索引），列被修改或重新赋值后哈希随之改变"""
+        frame = self._obj[list(columns)]
+        return (tuple(columns), len(frame), int(pd.util.hash_pandas_object(frame, index=True).sum()))
+
+    def _views(self, columns):
+        """所依赖列的视图与索引；缓存持有它们，使对原DataFrame这些列的写入必然复制出新数组"""
+        return (self._obj.index,) + tuple(self._obj[column] for column in columns)
+
+    def _unchanged(self, views, columns):
+        """快速判断：索引对象相同且各列底层数组地址未变"""
+        if views[0] is not self._obj.index:
+            return False
+        return all(_same_buffer(self._obj[column], view) for column, view in zip(columns, views[1:]))
+
+    def _memo(self, key, columns, compute):
+        cached = self._cache.get(key)
+        if cached is not None and self._unchanged(cached[2], columns):
+            return cached[1]
+        version = self._version(columns)
+        if cached is not None and cached[0] == version:
+            result = cached[1]
+        else:
+            result = compute()
+        self._cache[key] = (version, result, self._views(columns))
+        return result
+
+    @property
+    def entity_column(self):
+        """序列的实体列：子站数据为监测子站名称，城市数据为城市"""
+        return '监测子站名称' if '监测子站名称' in self._obj.columns else '城市'
+
+    def _time_columns(self):
+        return ['时间', '年份'] if '年份' in self._obj.columns else ['时间']
+
+    @property
+    def month(self):
+        return self._memo('month', ['时间'], lambda: self._obj['时间'].astype(str).str[5:7].astype(int)
+                          .rename('月份'))
+
+    @property
+    def year(self):
+        """年份：取'年份'列；各年份预处理脚本写出的时间字段都以2021开头，不能从时间推断年份"""
+        if '年份' not in self._obj.columns:
+            raise ValueError("缺少'年份'列：预处理CSV的时间字段都以2021开头，无法确定真实年份。"
+                             "请用 station_cube.load_station_data / load_city_data 读取，或先添加'年份'列")
+        return self._memo('year', ['年份'], lambda: self._obj['年份'].astype(int).rename('年份'))
+
+    @property
+    def season(self):
+        return self._memo('season', ['时间'], lambda: self.month.map(MONTH_SEASON).rename('季节'))
+
+    @property
+    def period(self):
+        """真实年月 'YYYY-MM'，同一实体的序列按它排序"""
+        return self._memo('period', self._time_columns(), lambda: (
+            self.year.astype(str) + '-' + self.month.astype(str).str.zfill(2)).rename('年月'))
+
+    def _lag_position(self, years_back, months_back):
+        """每行在同一实体中 years_back年months_back月之前那条记录的行位置，没有时为-1"""
+        month_index = self.year.to_numpy() * 12 + self.month.to_numpy() - 1
+        entity = self._obj[self.entity_column].to_numpy()
+        keys = pd.MultiIndex.from_arrays([entity, month_index])
+        target = pd.MultiIndex.from_arrays([entity, month_index - years_back * 12 - months_back])
+        if keys.has_duplicates:
+            raise ValueError(f"{self.entity_column}×月份存在重复记录，无法计算环比/同比")
+        return keys.get_indexer(target)
+
+    def _change(self, column, years_back, months_back, name):
+        def compute():
+            position = self._lag_position(years_back, months_back)
+            values = self._obj[column].to_numpy(dtype=float)
+            previous = np.append(values, np.nan)[position]
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return pd.Series((values - previous) / previous * 100, index=self._obj.index, name=name)
+        columns = self._time_columns() + [self.entity_column, column]
+        return self._memo((name, column), columns, compute)
+
+    def mom(self, column):
+        """环比变化率(%)：与同一实体上一个月比较，上月缺失时为NaN（不填0）"""
+        return self._change(column, 0, 1, f"{column}_环比变化率(%)")
+
+    def yoy(self, column):
+        """同比变化率(%)：与同一实体上一年同月比较"""
+        return self._change(column, 1, 0, f"{column}_同比变化率(%)")
+
+    @property
+    def pollutants(self):
+        """可用于计算AQI的污染物列"""
+        return [column for column in CONCENTRATION_BREAKPOINTS if column in self._obj.columns]
+
+    @property
+    def aqi(self):
+        """按HJ 633-2012分段计算的空气质量指数（月均浓度近似），取现有污染物分指数的最大值"""
+        def compute():
+            iaqi = np.stack([individual_aqi(self._obj[column].to_numpy(dtype=float), column)
+                             for column in self.pollutants], axis=1)
+            with np.errstate(invalid='ignore'):
+                observed = np.isfinite(iaqi).any(axis=1)
+                aqi = np.where(observed, np.nanmax(np.where(np.isfinite(iaqi), iaqi, -np.inf), axis=1), np.nan)
+            return pd.Series(aqi, index=self._obj.index, name='AQI')
+        if not self.pollutants:
+            raise AttributeError("没有可用于计算AQI的污染物列")
+        return self._memo('aqi', self.pollutants, compute)
+
+    @property
+    def aqi_level(self):
+        """AQI类别：优、良、轻度污染、中度污染、重度污染、严重污染"""
+        def compute():
+            codes = aqi_category(self.aqi.to_numpy())
+            labels = np.append(np.array(AQI_CATEGORIES, dtype=object), None)[codes]
+            return pd.Series(labels, index=self._obj.index, name='AQI类别')
+        return self._memo('aqi_level', self.pollutants, compute)
+
+    @property
+    def pollution_level(self):
+        """污染等级（城市数据）：按AQI达标率划分，与 add_visual_fields 中的 get_pollution_level 一致"""
+        def compute():
+            rate = self._obj['AQI达标率'].to_numpy(dtype=float)
+            level = np.select([rate >= threshold for threshold, _ in POLLUTION_LEVELS],
+                              [label for _, label in POLLUTION_LEVELS], LOWEST_LEVEL)
+            return pd.Series(np.where(np.isnan(rate), None, level), index=self._obj.index, name='污染等级')
+        if 'AQI达标率' not in self._obj.columns:
+            raise AttributeError("污染等级需要'AQI达标率'列")
+        return self._memo('pollution_level', ['AQI达标率'], compute)
+
+    def _group_keys(self, grouping):
+        if grouping == '全局':
+            return np.zeros(len(self._obj), dtype=int)
+        if grouping == '年份':
+            return pd.factorize(self.year)[0]
+        column = {'子站': '监测子站名称', '城市': '城市'}[grouping]
+        return pd.factorize(self._obj[column])[0]
+
+    def normalized(self, column, scheme='minmax', grouping='年份'):
+        """标准化字段，方案与分组同 normalization 模块；默认按年份最小-最大标准化，与预处理中的"_标准化"字段一致"""
+        def compute():
+            codes = self._group_keys(grouping)
+            normalizer = GroupedNormalizer(grouping, [column])
+            normalizer.stats = grouped_statistics(self._obj[[column]].to_numpy(dtype=float), codes, codes.max() + 1)
+            center, scale = normalizer.parameters(scheme)
+            values = self._obj[column].to_numpy(dtype=float)
+            return pd.Series((values - center[codes, 0]) / scale[codes, 0], index=self._obj.index,
+                             name=f"{column}_{grouping}{SCHEME_SUFFIX[scheme].lstrip('_')}")
+        group_columns = {'全局': [], '年份': self._time_columns(), '子站': ['监测子站名称'], '城市': ['城市']}[grouping]
+        return self._memo(('normalized', column, scheme, grouping), group_columns + [column], compute)
+
+    @property
+    def composite_index(self):
+        """综合污染指数：六项污染物按年份最小-最大标准化后求和，与 add_fields_with_minmaxscaler 一致"""
+        missing = [column for column in POLLUTANTS if column not in self._obj.columns]
+        if missing:
+            raise AttributeError(f"综合污染指数缺少污染物列：{missing}")
+        return self._memo('composite_index', self._time_columns() + POLLUTANTS, lambda: pd.Series(
+            sum(self.normalized(column).to_numpy() for column in POLLUTANTS), index=self._obj.index, name='综合污染指数'))
+
+    def with_fields(self, *fields):
+        """返回附加了指定派生字段的新DataFrame，字段名为本访问器的属性名，如 with_fields('season', 'aqi')"""
+        frame = self._obj.copy()
+        for field in fields:
+            series = getattr(self, field)
+            frame[series.name] = series
+        return frame
+
+    def clear_cache(self):
+        self._cache.clear()
+
+
+if __name__ == "__main__":
+    station_data = load_station_data()
+    if station_data is not None:
+        fields = station_data.airq.with_fields('season', 'aqi', 'aqi_level', 'composite_index')
+        fields[station_data.airq.mom('PM2.5').name] = station_data.airq.mom('PM2.5')
+        fields.to_csv("子站空气质量派生字段.csv", index=False, encoding="utf-8-sig")
+        print(fields['AQI类别'].value_counts().to_string())
+        print("✅ 派生字段保存成功：子站空气质量派生字段.csv")
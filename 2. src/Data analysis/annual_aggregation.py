@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+from station_cube import load_station_cube, load_city_cube, StationCube
+from seasonal_decomposition import run_decomposition
+
+MONTHS_PER_YEAR = 12
+# 线性插值补齐的最长连续缺测月数
+MAX_GAP = 2
+
+
+def _year_indicator(cube):
+    """(月份, 年份) 指示矩阵与年份列表，按年份汇总时与之做矩阵乘法"""
+    year_values = np.unique(cube.years)
+    return (cube.years[:, np.newaxis] == year_values[np.newaxis, :]).astype(float), year_values
+
+
+def annual_coverage(cube):
+    """各 实体×年份×变量 的有效月数，返回 (counts[实体, 年份, 变量], 年份列表)"""
+    indicator, year_values = _year_indicator(cube)
+    counts = np.einsum('emv,my->eyv', cube.coverage.astype(float), indicator)
+    return counts.astype(int), year_values
+
+
+def annual_means(cube, seasonal_adjust=True):
+    """年均值，返回 (means[实体, 年份, 变量], counts, 年份列表)
+
+    seasonal_adjust=True时先减去季节分解得到的各月季节项再求平均：全年覆盖时与原始年均值相同，
+    只覆盖部分月份时（如2024年1-6月）不会因缺少高值或低值季节而偏高或偏低
+    """
+    values = cube.values
+    # 全部年份完整时季节调整不改变年均值，无需分解
+    if seasonal_adjust and partial_years(cube):
+        seasonal_index = run_decomposition(cube)['seasonal_index']
+        values = values - np.nan_to_num(seasonal_index[:, cube.month_numbers - 1, :])
+    indicator, year_values = _year_indicator(cube)
+    totals = np.einsum('emv,my->eyv', np.where(cube.coverage, values, 0), indicator)
+    counts, _ = annual_coverage(cube)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return totals / counts, counts, year_values
+
+
+def annual_frame(cube, seasonal_adjust=True, group_by_city=False):
+    """长表形式的年均值：实体（或城市）、年份、各变量年均值与覆盖月数
+
+    group_by_city=True时先按子站计算年均值，再对同一城市的子站取平均
+    """
+    means, counts, year_values = annual_means(cube, seasonal_adjust)
+    n_entity, n_year, n_var = means.shape
+    df = pd.DataFrame(means.reshape(-1, n_var), columns=cube.variables)
+    df.insert(0, '年份', np.tile(year_values, n_entity))
+    df.insert(0, '城市', np.repeat(cube.cities, n_year))
+    df.insert(0, '实体', np.repeat(cube.entities, n_year))
+    df['覆盖月数'] = counts.min(axis=2).ravel()
+    if group_by_city:
+        df = df.groupby(['城市', '年份'], as_index=False).agg(
+            {**{variable: 'mean' for variable in cube.variables}, '覆盖月数': 'min'})
+    return df
+
+
+def partial_years(cube):
+    """覆盖不足12个月的年份及其实际月数，如 {2024: 6}"""
+    observed = pd.Series(cube.coverage.any(axis=(0, 2))).groupby(cube.years).sum()
+    incomplete = observed[observed < MONTHS_PER_YEAR]
+    return {int(year): int(n) for year, n in incomplete.items()}
+
+
+def partial_year_note(cube):
+    """图表标题用的说明文字，没有不完整年份时为空字符串"""
+    incomplete = partial_years(cube)
+    if not incomplete:
+        return ''
+    parts = '、'.join(f'{year}年仅{n}个月' for year, n in incomplete.items())
+    return f'，{parts}，已季节调整'
+
+
+def fill_gaps(cube, max_gap=MAX_GAP):
+    """对全部序列同时沿月份轴做线性插值，只补齐长度不超过max_gap的内部缺口
+
+    前后最近的有效月份位置通过累积最大/最小值一次求出，序列两端的缺测不外推
+    返回 (补齐后的StationCube, filled[实体, 月份, 变量] 布尔掩码标记被补齐的位置)
+    """
+    values = np.moveaxis(cube.values, 1, 2)
+    observed = np.isfinite(values)
+    n_month = values.shape[-1]
+    position = np.arange(n_month)
+
+    previous = np.maximum.accumulate(np.where(observed, position, -1), axis=-1)
+    following = np.minimum.accumulate(np.where(observed, position, n_month)[..., ::-1], axis=-1)[..., ::-1]
+    inside = (previous >= 0) & (following < n_month)
+    gap_length = following - previous - 1
+    fillable = ~observed & inside & (gap_length <= max_gap)
+
+    previous_value = np.take_along_axis(values, np.clip(previous, 0, n_month - 1), axis=-1)
+    following_value = np.take_along_axis(values, np.clip(following, 0, n_month - 1), axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        weight = (position - previous) / (following - previous)
+    filled_values = np.where(fillable, previous_value + weight * (following_value - previous_value), values)
+
+    filled_cube = StationCube(np.moveaxis(filled_values, 2, 1), cube.entities, cube.cities, cube.months,
+                              cube.variables)
+    return filled_cube, np.moveaxis(fillable, 2, 1)
+
+
+def report_coverage(cube, label):
+    """打印覆盖率摘要，缺测不再被静默丢弃"""
+    coverage = cube.coverage
+    missing = (~coverage).sum()
+    print(f"{label}：{cube.shape[0]}个实体 × {cube.shape[1]}个月 × {cube.shape[2]}个变量，"
+          f"缺测{missing}个（{missing / coverage.size:.1%}）")
+    for year, n in partial_years(cube).items():
+        print(f"警告：{year}年只有{n}个月的数据，年均值按季节调整估算")
+
+
+if __name__ == "__main__":
+    city_cube = load_city_cube()
+    if city_cube is not None:
+        report_coverage(city_cube, "城市数据")
+        city_annual = annual_frame(city_cube)
+        city_annual.to_csv("城市季节调整年均值.csv", index=False, encoding="utf-8-sig")
+        print("✅ 年均值保存成功：城市季节调整年均值.csv")
+
+    station_cube = load_station_cube()
+    if station_cube is not None:
+        report_coverage(station_cube, "子站数据")
+        filled_cube, filled = fill_gaps(station_cube)
+        print(f"线性插值补齐{filled.sum()}个子站-月份缺测值")
+        annual_frame(filled_cube).to_csv("子站季节调整年均值.csv", index=False, encoding="utf-8-sig")
+        print("✅ 年均值保存成功：子站季节调整年均值.csv")
@@ -0,0 +1,210 @@
+import os
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, t as student_t
+from station_cube import load_station_data, load_cache, save_cache, POLLUTANTS, SEASON_ORDER, MONTH_SEASON
+
+# 名义阈值：按正态分布z=3的双侧尾概率，换算为随样本数变化的t分布预测区间界限
+Z_THRESHOLD = 3.0
+# 基线至少积累的历史月数，不足时不参与判断
+MIN_HISTORY = 12
+MIN_SEASON_HISTORY = 9
+# 新值与历史均值之比落在该区间（约1000倍）时判为疑似单位错误，如CO的mg/m3未乘1000
+UNIT_RATIO_RANGE = (300, 3000)
+STATE_NAME = "anomaly_state"
+ANOMALY_TABLE = "子站异常值记录.csv"
+
+
+class WelfordState:
+    """一组独立序列的在线均值与方差（Welford算法），每个数组形状相同，按元素更新"""
+
+    def __init__(self, shape):
+        self.count = np.zeros(shape)
+        self.mean = np.zeros(shape)
+        self.m2 = np.zeros(shape)
+
+    def grow(self, n_rows):
+        """为新子站追加行"""
+        for name in ('count', 'mean', 'm2'):
+            current = getattr(self, name)
+            padding = np.zeros((n_rows,) + current.shape[1:])
+            setattr(self, name, np.concatenate([current, padding]))
+
+    def std(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.sqrt(self.m2 / (self.count - 1))
+
+    def zscore(self, index, values, min_count):
+        """用更新前的统计量计算标准分；历史不足或方差为0时为NaN"""
+        count = self.count[index]
+        std = self.std()[index]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            z = (values - self.mean[index]) / std
+        return np.where((count >= min_count) & (std > 0), z, np.nan)
+
+    def update(self, index, values):
+        """逐元素Welford更新；index中不能有重复位置，缺测值跳过"""
+        observed = np.isfinite(values)
+        x = np.where(observed, values, 0)
+        count = self.count[index] + observed
+        delta = x - self.mean[index]
+        mean = self.mean[index] + np.where(observed, delta / np.maximum(count, 1), 0)
+        self.m2[index] += np.where(observed, delta * (x - mean), 0)
+        self.mean[index] = mean
+        self.count[index] = count
+
+
+def prediction_limit(count, z_threshold=Z_THRESHOLD):
+    """n个历史样本估计均值和标准差时，新观测标准分的判定界限：t(n-1)分位数×sqrt(1+1/n)，
+    尾概率与正态分布下的z_threshold相同；样本少时界限更宽，样本多时趋近z_threshold
+    """
+    tail = norm.sf(z_threshold)
+    n = np.maximum(count, 2)
+    return student_t.isf(tail, n - 1) * np.sqrt(1 + 1 / n)
+
+
+class StreamingAnomalyDetector:
+    """子站月度数据在线异常检测
+
+    每个 子站×污染物 维护全历史与四个季节基线的Welford统计量；新月份的每一行先用已有统计量打分，
+    再更新统计量（疑似单位错误的值不计入），单行打分与更新都是O(1)，不需要回看历史数据；
+    普通异常值照常计入，真实的水平突变会逐步被基线吸收，不会一直被标记
+    """
+
+    def __init__(self, variables=POLLUTANTS, z_threshold=Z_THRESHOLD):
+        self.variables = list(variables)
+        self.z_threshold = z_threshold
+        self.stations = {}
+        self.months = set()
+        self.overall = WelfordState((0, len(self.variables)))
+        self.seasonal = WelfordState((0, len(SEASON_ORDER), len(self.variables)))
+
+    def _station_rows(self, names):
+        new_names = [name for name in pd.unique(names) if name not in self.stations]
+        for name in new_names:
+            self.stations[name] = len(self.stations)
+        if new_names:
+            self.overall.grow(len(new_names))
+            self.seasonal.grow(len(new_names))
+        return np.array([self.stations[name] for name in names], dtype=int)
+
+    def _score(self, rows, season_index, values):
+        z_overall = self.overall.zscore(rows, values, MIN_HISTORY)
+        z_season = self.seasonal.zscore((rows, season_index), values, MIN_SEASON_HISTORY)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = values / self.overall.mean[rows]
+        history = self.overall.count[rows] >= MIN_HISTORY
+        unit_error = history & (((ratio >= UNIT_RATIO_RANGE[0]) & (ratio <= UNIT_RATIO_RANGE[1]))
+                                | ((ratio >= 1 / UNIT_RATIO_RANGE[1]) & (ratio <= 1 / UNIT_RATIO_RANGE[0])))
+        # 季节基线可用时以季节基线为准，否则退回全历史基线；界限随基线样本数变化
+        use_season = np.isfinite(z_season)
+        z_used = np.where(use_season, z_season, z_overall)
+        limit = np.where(use_season, prediction_limit(self.seasonal.count[rows, season_index], self.z_threshold),
+                         prediction_limit(self.overall.count[rows], self.z_threshold))
+        outlier = np.abs(np.nan_to_num(z_used)) > limit
+        return z_overall, z_season, unit_error, outlier
+
+    def ingest(self, month_df):
+        """处理一批新到达的子站记录（通常为一个月），返回其中的异常记录
+
+        已处理过的月份会被跳过；同一批中同一子站有多条记录时按出现顺序依次打分和更新。
+        疑似单位错误的值不计入基线，避免污染之后的打分
+        """
+        month_df = month_df[~month_df['时间'].isin(self.months)]
+        if month_df.empty:
+            return self._empty_table()
+
+        names = month_df['监测子站名称'].to_numpy()
+        rows = self._station_rows(names)
+        season_index = month_df['季节'].map(SEASON_ORDER.index).to_numpy()
+        values = month_df[self.variables].to_numpy(dtype=float)
+        occurrence = month_df.groupby('监测子站名称').cumcount().to_numpy()
+
+        results = [np.empty(values.shape) for _ in range(2)] + [np.zeros(values.shape, dtype=bool) for _ in range(2)]
+        baseline = np.empty(values.shape)
+        for k in range(occurrence.max() + 1):
+            batch = occurrence == k
+            scored = self._score(rows[batch], season_index[batch], values[batch])
+            for result, part in zip(results, scored):
+                result[batch] = part
+            # 报告的历史均值取更新前的基线
+            baseline[batch] = self.overall.mean[rows[batch]]
+            clean = np.where(scored[2], np.nan, values[batch])
+            self.overall.update(rows[batch], clean)
+            self.seasonal.update((rows[batch], season_index[batch]), clean)
+        self.months.update(month_df['时间'].unique())
+
+        z_overall, z_season, unit_error, outlier = results
+        flagged_row, flagged_var = np.nonzero(unit_error | outlier)
+        table = pd.DataFrame({
+            '监测子站名称': names[flagged_row],
+            '城市': month_df['城市'].to_numpy()[flagged_row],
+            '时间': month_df['时间'].to_numpy()[flagged_row],
+            '季节': month_df['季节'].to_numpy()[flagged_row],
+            '污染物': np.asarray(self.variables)[flagged_var],
+            '观测值': values[flagged_row, flagged_var],
+            '历史均值': baseline[flagged_row, flagged_var],
+            '历史Z值': z_overall[flagged_row, flagged_var],
+            '季节Z值': z_season[flagged_row, flagged_var],
+        })
+        table['异常类型'] = np.where(unit_error[flagged_row, flagged_var], '疑似单位错误',
+                                 np.where(table['观测值'] > table['历史均值'], '异常偏高', '异常偏低'))
+        return table
+
+    def _empty_table(self):
+        return pd.DataFrame(columns=['监测子站名称', '城市', '时间', '季节', '污染物', '观测值', '历史均值',
+                                     '历史Z值', '季节Z值', '异常类型'])
+
+    def save(self):
+        names = np.array(sorted(self.stations, key=self.stations.get), dtype=str)
+        return save_cache(STATE_NAME, 'welford', stations=names, months=np.array(sorted(self.months), dtype=str),
+                          variables=np.array(self.variables, dtype=str),
+                          overall=np.stack([self.overall.count, self.overall.mean, self.overall.m2]),
+                          seasonal=np.stack([self.seasonal.count, self.seasonal.mean, self.seasonal.m2]))
+
+    @classmethod
+    def load(cls, variables=POLLUTANTS, z_threshold=Z_THRESHOLD):
+        """读取上次保存的检测状态，不存在或变量不一致时返回空的检测器"""
+        detector = cls(variables, z_threshold)
+        state = load_cache(STATE_NAME, 'welford')
+        if state is None or state['variables'].tolist() != detector.variables:
+            return detector
+        detector.stations = {name: i for i, name in enumerate(state['stations'].tolist())}
+        detector.months = set(state['months'].tolist())
+        detector.overall.count, detector.overall.mean, detector.overall.m2 = state['overall']
+        detector.seasonal.count, detector.seasonal.mean, detector.seasonal.m2 = state['seasonal']
+        print(f"✅ 读取异常检测状态：已处理{len(detector.months)}个月，{len(detector.stations)}个子站")
+        return detector
+
+
+def append_anomalies(table, output_path=ANOMALY_TABLE):
+    """追加写入异常记录表"""
+    if table.empty:
+        return
+    table.to_csv(output_path, mode='a', header=not os.path.exists(output_path), index=False, encoding="utf-8-sig")
+
+
+def ingest_month(month_df, output_path=ANOMALY_TABLE):
+    """新月份数据入库时调用：读取状态、打分、更新并保存状态，异常记录追加到表中"""
+    detector = StreamingAnomalyDetector.load()
+    table = detector.ingest(month_df)
+    detector.save()
+    append_anomalies(table, output_path)
+    print(f"✅ 处理{month_df['时间'].nunique()}个月{len(month_df)}条记录，发现异常{len(table)}条")
+    return table
+
+
+if __name__ == "__main__":
+    # 按月份顺序回放全部子站数据，模拟逐月入库
+    station_data = load_station_data()
+    if station_data is not None:
+        if '季节' not in station_data.columns:
+            station_data['季节'] = station_data['月份'].map(MONTH_SEASON)
+        detector = StreamingAnomalyDetector.load()
+        tables = [detector.ingest(month_df) for _, month_df in station_data.groupby('时间', sort=True)]
+        detector.save()
+        anomalies = pd.concat(tables, ignore_index=True)
+        append_anomalies(anomalies)
+        print(f"✅ 异常检测完成：处理{len(detector.months)}个月，发现异常{len(anomalies)}条")
+        if not anomalies.empty:
+            print(anomalies['异常类型'].value_counts())
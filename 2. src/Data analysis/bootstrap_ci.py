@@ -0,0 +1,188 @@
+import warnings
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from station_cube import load_city_cube, load_cache, save_cache, SEASON_ORDER
+
+N_BOOT = 2000
+CHUNK_SIZE = 500
+CONFIDENCE = 0.95
+SEED = 2024
+# 重抽样总元素数（重抽样次数×补齐矩阵大小）低于该值且未指定workers时直接在本进程计算，
+# 进程池启动开销远大于计算本身，也避免在没有__main__保护的脚本中启动子进程
+MIN_PARALLEL_ELEMENTS = 5e7
+
+
+def pad_groups(values, group_codes, n_groups):
+    """把按组划分的观测整理成 (组数, 最大组大小[, 列数]) 的补齐矩阵，返回 (padded, counts)
+
+    values为二维 (观测数, 列数) 时每行是一个成对观测（如同一月份的首末年数值），任一列缺测则整行剔除
+    """
+    valid = np.isfinite(values) if values.ndim == 1 else np.isfinite(values).all(axis=1)
+    values = values[valid]
+    group_codes = group_codes[valid]
+    order = np.argsort(group_codes, kind='stable')
+    values = values[order]
+    group_codes = group_codes[order]
+    counts = np.bincount(group_codes, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    position = np.arange(len(values)) - starts[group_codes]
+    padded = np.full((n_groups, max(counts.max(), 1)) + values.shape[1:], np.nan)
+    padded[group_codes, position] = values
+    return padded, counts
+
+
+def _bootstrap_chunk(task):
+    """工作进程：一次生成 (重抽样次数, 组数, 最大组大小) 的索引张量，返回各组重抽样均值 (重抽样次数, 组数[, 列数])
+
+    成对观测的各列使用同一组索引，保持配对关系
+    """
+    padded, counts, n_boot, seed = task
+    rng = np.random.default_rng(seed)
+    n_groups, width = padded.shape[:2]
+    # 每组在自己的样本数范围内抽取索引，补齐位置之外的列不参与均值
+    index = (rng.random((n_boot, n_groups, width)) * counts[np.newaxis, :, np.newaxis]).astype(np.int64)
+    samples = padded[np.arange(n_groups)[np.newaxis, :, np.newaxis], index]
+    in_group = np.arange(width)[np.newaxis, np.newaxis, :] < counts[np.newaxis, :, np.newaxis]
+    in_group = in_group.reshape(in_group.shape + (1,) * (padded.ndim - 2))
+    total = np.where(in_group, samples, 0).sum(axis=2)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return total / counts.reshape((1, n_groups) + (1,) * (padded.ndim - 2))
+
+
+def bootstrap_means(padded, counts, n_boot=N_BOOT, chunk_size=CHUNK_SIZE, workers=None, seed=SEED):
+    """各组均值的自助法重抽样分布，返回 (n_boot, 组数[, 列数])
+
+    重抽样按chunk_size分块，多于一块且计算量足够大（或显式指定workers>1）时分发到进程池；
+    每块使用独立的随机数子序列，结果与进程数无关
+    """
+    sizes = [min(chunk_size, n_boot - start) for start in range(0, n_boot, chunk_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(padded, counts, size, child) for size, child in zip(sizes, seeds)]
+    small = workers is None and n_boot * padded.size < MIN_PARALLEL_ELEMENTS
+    if len(tasks) == 1 or workers == 1 or small:
+        chunks = [_bootstrap_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(_bootstrap_chunk, tasks))
+    return np.concatenate(chunks, axis=0)
+
+
+def _interval(replicates, confidence=CONFIDENCE):
+    alpha = (1 - confidence) / 2
+    with warnings.catch_warnings():
+        # 没有观测的组（如末年缺失的季节）区间为NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanpercentile(replicates, [100 * alpha, 100 * (1 - alpha)], axis=0)
+
+
+def improvement_rate_ci(cube, variable='PM2.5', first_year=None, last_year=None, matched_months=True,
+                        n_boot=N_BOOT, workers=None, confidence=CONFIDENCE, use_cache=True):
+    """各城市首末年份改善率 (末年均值-首年均值)/首年均值×100 的自助法置信区间
+
+    matched_months=True时只使用首末年都有观测的同期月份，避免末年只覆盖部分月份（如2024年1-6月）引入季节偏差，
+    并按月份成对重抽样，置信区间不包含季节之间的差异；否则两个年份的月份各自独立重抽样。
+    返回DataFrame：城市、首年均值、末年均值、改善率(%)、置信下限、置信上限、首年月数、末年月数
+    """
+    years = cube.years
+    first_year = years.min() if first_year is None else first_year
+    last_year = years.max() if last_year is None else last_year
+    cache_name = (f"bootstrap_improvement_{variable.replace('/', '_')}_{first_year}_{last_year}"
+                  f"_{int(matched_months)}_{n_boot}")
+
+    matrix = cube.get(variable)
+    in_first = years == first_year
+    in_last = years == last_year
+    n_city = len(cube.entities)
+    first = pd.DataFrame(matrix[:, in_first], columns=cube.month_numbers[in_first])
+    last = pd.DataFrame(matrix[:, in_last], columns=cube.month_numbers[in_last])
+    first, last = (frame.reindex(columns=range(1, 13)).to_numpy() for frame in (first, last))
+
+    if matched_months:
+        # 每个城市一组，每个月份是一个 (首年, 末年) 成对观测
+        paired = np.stack([first, last], axis=2).reshape(-1, 2)
+        codes = np.repeat(np.arange(n_city), 12)
+        padded, counts = pad_groups(paired, codes, n_city)
+        first = np.where(np.isfinite(last), first, np.nan)
+        last = np.where(np.isfinite(first), last, np.nan)
+        counts = np.repeat(counts, 2)
+    else:
+        # 组编号：城市i的首年为2i，末年为2i+1
+        values = np.stack([first, last], axis=1).ravel()
+        codes = np.repeat(np.arange(n_city * 2), 12)
+        padded, counts = pad_groups(values, codes, n_city * 2)
+
+    cached = load_cache(cache_name, cube.version) if use_cache else None
+    if cached is not None:
+        print(f"✅ 读取自助法缓存：{cache_name}_{cube.version}")
+        replicates = cached['replicates']
+    else:
+        means = bootstrap_means(padded, counts if not matched_months else counts[0::2], n_boot, workers=workers)
+        means = means.reshape(n_boot, -1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            replicates = (means[:, 1::2] - means[:, 0::2]) / means[:, 0::2] * 100
+        save_cache(cache_name, cube.version, replicates=replicates)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        first_mean = np.nanmean(first, axis=1)
+        last_mean = np.nanmean(last, axis=1)
+    lower, upper = _interval(replicates, confidence)
+    return pd.DataFrame({
+        '城市': cube.entities,
+        '首年均值': first_mean,
+        '末年均值': last_mean,
+        f'{variable}改善率(%)': (last_mean - first_mean) / first_mean * 100,
+        '置信下限': lower,
+        '置信上限': upper,
+        '首年月数': counts[0::2],
+        '末年月数': counts[1::2],
+    })
+
+
+def season_mean_ci(cube, variable='PM2.5', n_boot=N_BOOT, workers=None, confidence=CONFIDENCE, use_cache=True):
+    """各城市各年份季节均值的自助法置信区间，返回长表：城市、年份、季节、均值、置信下限、置信上限、月数"""
+    cache_name = f"bootstrap_season_{variable.replace('/', '_')}_{n_boot}"
+    n_city, n_month, _ = cube.shape
+    year_values = np.unique(cube.years)
+    season_codes = np.array([SEASON_ORDER.index(season) for season in cube.seasons])
+    year_codes = np.searchsorted(year_values, cube.years)
+    # 组编号：城市 × 年份 × 季节
+    month_group = year_codes * len(SEASON_ORDER) + season_codes
+    n_per_city = len(year_values) * len(SEASON_ORDER)
+    codes = (np.arange(n_city)[:, np.newaxis] * n_per_city + month_group[np.newaxis, :]).ravel()
+    padded, counts = pad_groups(cube.get(variable).ravel(), codes, n_city * n_per_city)
+
+    cached = load_cache(cache_name, cube.version) if use_cache else None
+    if cached is not None:
+        print(f"✅ 读取自助法缓存：{cache_name}_{cube.version}")
+        replicates = cached['replicates']
+    else:
+        replicates = bootstrap_means(padded, counts, n_boot, workers=workers)
+        save_cache(cache_name, cube.version, replicates=replicates)
+
+    lower, upper = _interval(replicates, confidence)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nansum(padded, axis=1) / counts
+    df = pd.DataFrame({
+        '城市': np.repeat(cube.entities, n_per_city),
+        '年份': np.tile(np.repeat(year_values, len(SEASON_ORDER)), n_city),
+        '季节': np.tile(SEASON_ORDER, n_city * len(year_values)),
+        '均值': mean,
+        '置信下限': lower,
+        '置信上限': upper,
+        '月数': counts,
+    })
+    return df[df['月数'] > 0].reset_index(drop=True)
+
+
+if __name__ == "__main__":
+    city_cube = load_city_cube()
+    if city_cube is not None:
+        improvement = improvement_rate_ci(city_cube, 'PM2.5')
+        improvement.to_csv("城市PM2.5改善率置信区间.csv", index=False, encoding="utf-8-sig")
+        print("✅ 改善率置信区间保存成功：城市PM2.5改善率置信区间.csv")
+        print(improvement.round(2).to_string(index=False))
+
+        season = season_mean_ci(city_cube, 'PM2.5')
+        season.to_csv("城市PM2.5季节均值置信区间.csv", index=False, encoding="utf-8-sig")
+        print(f"✅ 季节均值置信区间保存成功：城市PM2.5季节均值置信区间.csv（{len(season)}行）")
@@ -0,0 +1,174 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from station_cube import load_station_cube, load_city_cube, load_cache, save_cache
+from seasonal_decomposition import run_decomposition
+
+# 每段最少月数
+MIN_SIZE = 3
+# 惩罚项 = PENALTY × log(样本数)，序列已按稳健标准差缩放，2对应BIC
+PENALTY = 2.0
+METHODS = ('pelt', 'binseg')
+# 每个进程任务包含的序列数
+SERIES_PER_TASK = 64
+
+
+def robust_scale(series):
+    """由一阶差分的中位数绝对偏差估计噪声标准差，不受均值突变本身的影响"""
+    diff = np.diff(series)
+    mad = np.median(np.abs(diff - np.median(diff))) if len(diff) else 0
+    scale = mad * 1.4826 / np.sqrt(2)
+    return scale if scale > 0 else (np.std(series) or 1.0)
+
+
+def _segment_cost(cum1, cum2, start, end):
+    """均值突变模型的段代价（段内平方和），由累积和 O(1) 计算；start/end可为数组"""
+    length = end - start
+    total = cum1[end] - cum1[start]
+    return cum2[end] - cum2[start] - total ** 2 / length
+
+
+def pelt(series, penalty, min_size=MIN_SIZE):
+    """PELT精确分段：F(t) = min_s F(s) + C(s, t) + β，并剪除不可能成为最优分割点的候选位置，返回变点位置列表"""
+    n = len(series)
+    cum1 = np.concatenate([[0], np.cumsum(series)])
+    cum2 = np.concatenate([[0], np.cumsum(series ** 2)])
+    best = np.full(n + 1, np.inf)
+    best[0] = -penalty
+    last = np.zeros(n + 1, dtype=int)
+    candidates = np.array([0])
+    for end in range(min_size, n + 1):
+        if end - min_size > 0:
+            candidates = np.append(candidates, end - min_size)
+        costs = best[candidates] + _segment_cost(cum1, cum2, candidates, end)
+        choice = np.argmin(costs)
+        best[end] = costs[choice] + penalty
+        last[end] = candidates[choice]
+        candidates = candidates[costs <= best[end]]
+    points = []
+    position = last[n]
+    while position > 0:
+        points.append(position)
+        position = last[position]
+    return sorted(points)
+
+
+def binary_segmentation(series, penalty, min_size=MIN_SIZE):
+    """二分分割：每次在代价下降最多的位置切分，下降量不超过惩罚项时停止"""
+    cum1 = np.concatenate([[0], np.cumsum(series)])
+    cum2 = np.concatenate([[0], np.cumsum(series ** 2)])
+    points = []
+    segments = [(0, len(series))]
+    while segments:
+        start, end = segments.pop()
+        splits = np.arange(start + min_size, end - min_size + 1)
+        if len(splits) == 0:
+            continue
+        gain = (_segment_cost(cum1, cum2, start, end) - _segment_cost(cum1, cum2, start, splits)
+                - _segment_cost(cum1, cum2, splits, end))
+        choice = np.argmax(gain)
+        if gain[choice] > penalty:
+            points.append(int(splits[choice]))
+            segments += [(start, int(splits[choice])), (int(splits[choice]), end)]
+    return sorted(points)
+
+
+def _detect_chunk(task):
+    """工作进程：对一批序列检测变点，返回 (序列号, 变点所在月份下标) 两个数组
+
+    每条序列先去掉缺测月份，按稳健标准差缩放后检测，变点位置再映射回原始月份轴
+    """
+    series_ids, block, method, penalty_scale, min_size = task
+    detect = pelt if method == 'pelt' else binary_segmentation
+    ids, positions = [], []
+    for series_id, series in zip(series_ids, block):
+        observed = np.flatnonzero(np.isfinite(series))
+        if len(observed) < 2 * min_size:
+            continue
+        values = series[observed]
+        values = (values - values.mean()) / robust_scale(values)
+        for point in detect(values, penalty_scale * np.log(len(values)), min_size):
+            ids.append(series_id)
+            positions.append(observed[point])
+    return np.array(ids, dtype=int), np.array(positions, dtype=int)
+
+
+def detect_batch(series, method='pelt', penalty=PENALTY, min_size=MIN_SIZE, workers=None,
+                 series_per_task=SERIES_PER_TASK):
+    """对 (序列数, T) 的全部序列检测变点，按series_per_task分块后分发到进程池
+
+    返回 (序列号, 变点月份下标)，变点下标为新水平的第一个月
+    """
+    if method not in METHODS:
+        raise ValueError(f"未知的变点检测方法：{method}，可选{METHODS}")
+    tasks = [(np.arange(start, min(start + series_per_task, len(series))), series[start:start + series_per_task],
+              method, penalty, min_size) for start in range(0, len(series), series_per_task)]
+    if len(tasks) <= 1 or workers == 1:
+        chunks = [_detect_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(_detect_chunk, tasks))
+    if not chunks:
+        return np.array([], dtype=int), np.array([], dtype=int)
+    return np.concatenate([chunk[0] for chunk in chunks]), np.concatenate([chunk[1] for chunk in chunks])
+
+
+def run_changepoints(cube, method='pelt', penalty=PENALTY, min_size=MIN_SIZE, workers=None, use_cache=True):
+    """检测立方体中全部 实体×变量 序列的均值突变，结果按数据版本缓存
+
+    检测前减去季节分解得到的各月季节项，避免把季节循环识别为水平突变。
+    返回字典：series/position 为变点所属序列号与月份下标，adjusted 为去季节后的 (实体, 月份, 变量)
+    """
+    n_entity, n_month, n_var = cube.shape
+    seasonal_index = run_decomposition(cube)['seasonal_index']
+    adjusted = cube.values - np.nan_to_num(seasonal_index[:, cube.month_numbers - 1, :])
+    cache_name = f"changepoints_{method}_{penalty}_{min_size}"
+    if use_cache:
+        cached = load_cache(cache_name, cube.version)
+        if cached is not None:
+            print(f"✅ 读取变点缓存：{cache_name}_{cube.version}")
+            return {**cached, 'adjusted': adjusted}
+
+    series = np.moveaxis(adjusted, 2, 1).reshape(n_entity * n_var, n_month)
+    series_ids, positions = detect_batch(series, method, penalty, min_size, workers)
+    save_cache(cache_name, cube.version, series=series_ids, position=positions)
+    return {'series': series_ids, 'position': positions, 'adjusted': adjusted}
+
+
+def changepoints_to_frame(cube, result):
+    """变点长表：实体、城市、污染物、变点月份，以及相邻两段去季节均值、变化量与变化率"""
+    n_var = len(cube.variables)
+    entity, variable = np.divmod(result['series'], n_var)
+    adjusted = result['adjusted']
+    rows = []
+    for series_id in np.unique(result['series']):
+        points = np.sort(result['position'][result['series'] == series_id])
+        e, v = divmod(series_id, n_var)
+        bounds = np.concatenate([[0], points, [len(cube.months)]])
+        means = [np.nanmean(adjusted[e, bounds[k]:bounds[k + 1], v]) for k in range(len(bounds) - 1)]
+        for k, point in enumerate(points):
+            rows.append((means[k], means[k + 1]))
+    before, after = np.array(rows).T if rows else (np.array([]), np.array([]))
+    order = np.lexsort((result['position'], result['series']))
+    entity, variable, position = entity[order], variable[order], result['position'][order]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.DataFrame({
+            '实体': np.asarray(cube.entities)[entity],
+            '城市': cube.cities[entity],
+            '污染物': np.asarray(cube.variables)[variable],
+            '变点月份': np.asarray(cube.months)[position],
+            '变点前均值': before,
+            '变点后均值': after,
+            '变化量': after - before,
+            '变化率(%)': (after - before) / before * 100,
+        })
+
+
+if __name__ == "__main__":
+    for label, cube in (('子站', load_station_cube()), ('城市', load_city_cube())):
+        if cube is None:
+            continue
+        changepoints = changepoints_to_frame(cube, run_changepoints(cube))
+        output = f"{label}污染物变点检测结果.csv"
+        changepoints.to_csv(output, index=False, encoding="utf-8-sig")
+        print(f"✅ 变点检测结果保存成功：{output}（{len(changepoints)}个变点）")
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from station_cube import load_station_cube, load_cache, save_cache, SEASON_ORDER
+
+GROUP_KEYS = ('城市', '季节', '年份')
+MIN_SAMPLES = 3
+
+
+def _cell_labels(cube):
+    """立方体每个 (子站, 月份) 单元对应的城市、季节、年份标签，展平为长度 n_entity*n_month 的数组"""
+    n_entity, n_month, _ = cube.shape
+    return {
+        '城市': np.repeat(cube.cities.astype(str), n_month),
+        '季节': np.tile(cube.seasons, n_entity),
+        '年份': np.tile(cube.years, n_entity),
+    }
+
+
+def grouped_ranks(values, codes):
+    """组内平均秩（结值取平均秩）：每个变量只排序一次，排序键为 (组号, 数值)"""
+    ranks = np.empty(values.shape)
+    for v in range(values.shape[1]):
+        order = np.lexsort((values[:, v], codes))
+        sorted_codes = codes[order]
+        sorted_values = values[order, v]
+        # 新的结组从组号或数值变化处开始
+        new_run = np.r_[True, (sorted_codes[1:] != sorted_codes[:-1]) | (sorted_values[1:] != sorted_values[:-1])]
+        run_id = np.cumsum(new_run) - 1
+        group_start = np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]
+        start_position = np.maximum.accumulate(np.where(group_start, np.arange(len(order)), 0))
+        position = np.arange(len(order)) - start_position + 1
+        run_rank = np.bincount(run_id, weights=position) / np.bincount(run_id)
+        ranks[order, v] = run_rank[run_id]
+    return ranks
+
+
+def grouped_pearson(values, codes, n_groups):
+    """按组同时计算相关矩阵：组内一阶和与交叉积和由一次分组求和得到
+
+    values: (n_obs, n_var)，codes: 每个观测所属组号；返回 (n_groups, n_var, n_var) 相关矩阵与各组样本数
+    """
+    n_obs, n_var = values.shape
+    count = np.bincount(codes, minlength=n_groups).astype(float)
+    sums = np.zeros((n_groups, n_var))
+    np.add.at(sums, codes, values)
+    cross = np.zeros((n_groups, n_var * n_var))
+    np.add.at(cross, codes, (values[:, :, np.newaxis] * values[:, np.newaxis, :]).reshape(n_obs, -1))
+    cross = cross.reshape(n_groups, n_var, n_var)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = cross - sums[:, :, np.newaxis] * sums[:, np.newaxis, :] / count[:, np.newaxis, np.newaxis]
+        std = np.sqrt(np.diagonal(cov, axis1=1, axis2=2))
+        corr = cov / (std[:, :, np.newaxis] * std[:, np.newaxis, :])
+    corr[count < MIN_SAMPLES] = np.nan
+    return np.clip(corr, -1, 1), count.astype(int)
+
+
+def run_correlations(cube, by=GROUP_KEYS, use_cache=True):
+    """对每个分组（默认 城市×季节×年份）同时计算六种污染物的Pearson与Spearman相关矩阵
+
+    只使用六种污染物均有观测的子站-月份；秩在组内只计算一次。
+    结果按分组方式与数据版本缓存，返回字典：
+    pearson/spearman (组数, 变量数, 变量数)、n (组数)，以及各分组键的标签数组
+    """
+    by = tuple(by)
+    cache_name = "correlation_" + ("_".join(by) if by else "全部")
+    if use_cache:
+        cached = load_cache(cache_name, cube.version)
+        if cached is not None:
+            print(f"✅ 读取相关性缓存：{cache_name}_{cube.version}")
+            return cached
+
+    n_entity, n_month, n_var = cube.shape
+    values = cube.values.reshape(n_entity * n_month, n_var)
+    complete = np.isfinite(values).all(axis=1)
+    values = values[complete]
+    labels = {key: label[complete] for key, label in _cell_labels(cube).items() if key in by}
+
+    if by:
+        keys = pd.MultiIndex.from_arrays([labels[key] for key in by], names=list(by))
+        codes, groups = pd.factorize(keys, sort=True)
+    else:
+        codes, groups = np.zeros(len(values), dtype=np.int64), None
+    n_groups = codes.max() + 1
+
+    pearson, count = grouped_pearson(values, codes, n_groups)
+    spearman, _ = grouped_pearson(grouped_ranks(values, codes), codes, n_groups)
+
+    result = {'pearson': pearson, 'spearman': spearman, 'n': count}
+    for level, key in enumerate(by):
+        result[key] = np.asarray(groups.get_level_values(level)).astype(str if key != '年份' else int)
+    save_cache(cache_name, cube.version, **result)
+    return result
+
+
+def get_group_correlation(cube, result, method='pearson', **group):
+    """按分组标签取出单个相关矩阵，例如 get_group_correlation(cube, result, 城市='广州', 季节='冬季', 年份=2023)"""
+    selected = np.ones(len(result['n']), dtype=bool)
+    for key, value in group.items():
+        selected &= result[key] == value
+    if selected.sum() != 1:
+        return None
+    index = np.flatnonzero(selected)[0]
+    return pd.DataFrame(result[method][index], index=cube.variables, columns=cube.variables)
+
+
+def correlations_to_frame(cube, result, by=GROUP_KEYS):
+    """整理为长表：每行一个 分组×污染物对（上三角）"""
+    n_var = len(cube.variables)
+    row, col = np.triu_indices(n_var, k=1)
+    n_groups = len(result['n'])
+    df = pd.DataFrame({key: np.repeat(result[key], len(row)) for key in by})
+    df['样本数'] = np.repeat(result['n'], len(row))
+    df['污染物1'] = np.tile(np.asarray(cube.variables)[row], n_groups)
+    df['污染物2'] = np.tile(np.asarray(cube.variables)[col], n_groups)
+    df['Pearson'] = result['pearson'][:, row, col].ravel()
+    df['Spearman'] = result['spearman'][:, row, col].ravel()
+    if '季节' in df.columns:
+        df['季节'] = pd.Categorical(df['季节'], categories=SEASON_ORDER, ordered=True)
+        df = df.sort_values(list(by), kind='stable').reset_index(drop=True)
+    return df
+
+
+def save_correlations(df, output_path):
+    df.to_csv(output_path, index=False, encoding="utf-8-sig")
+    print(f"✅ 相关性结果保存成功：{output_path}")
+    print(f"数据规模：{df.shape[0]}行 × {df.shape[1]}列")
+
+
+if __name__ == "__main__":
+    station_cube = load_station_cube()
+    if station_cube is not None:
+        correlations = run_correlations(station_cube)
+        save_correlations(correlations_to_frame(station_cube, correlations), "污染物相关性_城市季节年份.csv")
@@ -0,0 +1,125 @@
+import numpy as np
+import pandas as pd
+from station_cube import load_station_cube
+
+# 《环境空气质量标准》(GB 3095-2012) 浓度限值，单位μg/m3
+# SO2/NO2/PM10/PM2.5 用年平均限值，CO 用24小时平均限值，O3 用日最大8小时平均限值，与月均浓度比较
+LIMIT_TABLES = {
+    "二级标准": {"SO2": 60, "NO2": 40, "O3": 160, "CO_μg/m3": 4000, "PM10": 70, "PM2.5": 35},
+    "一级标准": {"SO2": 20, "NO2": 40, "O3": 100, "CO_μg/m3": 4000, "PM10": 40, "PM2.5": 15},
+}
+
+
+def exceedance_mask(cube, limit_tables=LIMIT_TABLES):
+    """一次比较全部限值表：返回 (exceed[标准, 实体, 月份, 变量], observed, limits[标准, 变量], 标准名称, 变量名称)
+
+    所有限值表都没有的变量不参与比较，某个限值表没有的变量限值为NaN、不判为超标；缺测月份既不算超标也不算达标
+    """
+    variables = [variable for variable in cube.variables
+                 if any(variable in table for table in limit_tables.values())]
+    values = np.stack([cube.get(variable) for variable in variables], axis=2)
+    limits = np.array([[table.get(variable, np.nan) for variable in variables] for table in limit_tables.values()],
+                      dtype=float)
+    observed = np.isfinite(values)
+    exceed = observed[np.newaxis] & (values[np.newaxis] > limits[:, np.newaxis, np.newaxis, :])
+    return exceed, observed, limits, list(limit_tables), variables
+
+
+def run_length_encode(flags):
+    """对每一行布尔序列做游程编码，只返回取值为True的游程
+
+    flags: (行数, 长度)。两端补False后沿展平数组求差分，一次找出全部游程的起止位置，
+    返回 (行号, 起始位置, 长度)
+    """
+    n_rows, length = flags.shape
+    padded = np.zeros((n_rows, length + 2), dtype=np.int8)
+    padded[:, 1:-1] = flags
+    change = np.diff(padded.ravel())
+    starts = np.flatnonzero(change == 1) + 1
+    ends = np.flatnonzero(change == -1) + 1
+    rows = starts // (length + 2)
+    return rows, starts - rows * (length + 2) - 1, ends - starts
+
+
+def streak_statistics(flags):
+    """每行的最长游程长度与起始位置、以及截至最后一期的当前游程长度"""
+    n_rows, length = flags.shape
+    rows, starts, lengths = run_length_encode(flags)
+    longest = np.zeros(n_rows, dtype=int)
+    np.maximum.at(longest, rows, lengths)
+    # 最长游程不唯一时取最早的一段：按 (行, -长度, 起点) 排序后每行取第一个
+    order = np.lexsort((starts, -lengths, rows))
+    first = order[np.r_[True, rows[order][1:] != rows[order][:-1]]] if len(order) else order
+    longest_start = np.full(n_rows, -1)
+    longest_start[rows[first]] = starts[first]
+    current = np.zeros(n_rows, dtype=int)
+    ongoing = starts + lengths == length
+    current[rows[ongoing]] = lengths[ongoing]
+    return longest, longest_start, current, (rows, starts, lengths)
+
+
+def exceedance_tables(cube, limit_tables=LIMIT_TABLES):
+    """返回 (汇总表, 游程明细表)
+
+    汇总表每行一个 标准×子站×污染物：超标月数、有效月数、超标率、最长连续超标月数及起止月份、当前连续超标月数；
+    游程明细表每行一段连续超标。缺测月份会中断连续超标；限值表中没有的 标准×污染物 不出现在汇总表中
+    """
+    exceed, observed, limits, standards, variables = exceedance_mask(cube, limit_tables)
+    n_standard, n_entity, n_month, n_var = exceed.shape
+    # 整理为 (标准×实体×变量, 月份) 的行序列
+    flags = np.moveaxis(exceed, 2, 3).reshape(-1, n_month)
+    longest, longest_start, current, (rows, starts, lengths) = streak_statistics(flags)
+
+    months = np.asarray(cube.months)
+    standard_col = np.repeat(standards, n_entity * n_var)
+    entity_col = np.tile(np.repeat(cube.entities, n_var), n_standard)
+    city_col = np.tile(np.repeat(cube.cities, n_var), n_standard)
+    variable_col = np.tile(variables, n_standard * n_entity)
+    n_exceed = flags.sum(axis=1)
+    n_observed = np.tile(np.moveaxis(observed, 1, 2).reshape(-1, n_month).sum(axis=1), n_standard)
+    has_streak = longest > 0
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rate = n_exceed / n_observed * 100
+
+    summary = pd.DataFrame({
+        '标准': standard_col,
+        '监测子站名称': entity_col,
+        '城市': city_col,
+        '污染物': variable_col,
+        '限值': np.repeat(limits, n_entity, axis=0).ravel(),
+        '超标月数': n_exceed,
+        '有效月数': n_observed,
+        '超标率(%)': rate,
+        '最长连续超标月数': longest,
+        '最长连续超标起始': np.where(has_streak, months[np.maximum(longest_start, 0)], ''),
+        '最长连续超标结束': np.where(has_streak, months[np.maximum(longest_start + longest - 1, 0)], ''),
+        '当前连续超标月数': current,
+    })
+    summary = summary[summary['限值'].notna()].reset_index(drop=True)
+    runs = pd.DataFrame({
+        '标准': standard_col[rows],
+        '监测子站名称': entity_col[rows],
+        '城市': city_col[rows],
+        '污染物': variable_col[rows],
+        '起始月份': months[starts],
+        '结束月份': months[starts + lengths - 1],
+        '连续超标月数': lengths,
+    })
+    return summary, runs
+
+
+def city_exceedance_rate(summary):
+    """按 标准×城市×污染物 汇总的超标率宽表，用于报告"""
+    grouped = summary.groupby(['标准', '城市', '污染物'])[['超标月数', '有效月数']].sum()
+    rate = (grouped['超标月数'] / grouped['有效月数'] * 100).rename('超标率(%)')
+    return rate.unstack('污染物').round(1)
+
+
+if __name__ == "__main__":
+    station_cube = load_station_cube()
+    if station_cube is not None:
+        summary, runs = exceedance_tables(station_cube)
+        summary.to_csv("子站超标统计.csv", index=False, encoding="utf-8-sig")
+        runs.to_csv("子站连续超标明细.csv", index=False, encoding="utf-8-sig")
+        city_exceedance_rate(summary).to_csv("城市超标率汇总.csv", encoding="utf-8-sig")
+        print(f"✅ 超标分析保存成功：子站超标统计.csv、子站连续超标明细.csv（{len(runs)}段连续超标）、城市超标率汇总.csv")
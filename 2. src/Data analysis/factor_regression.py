@@ -0,0 +1,183 @@
+import os
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy.stats import t as t_dist
+from station_cube import load_city_cube, load_station_cube, load_cache, save_cache, normalize_city_name
+
+# 本地协变量表（放在数据目录下）：
+#   城市月度气象数据.csv：城市, 时间(YYYY-MM), 以及任意数值列（如 气温, 降水量, 风速, 相对湿度）
+#   城市年度经济数据.csv：城市, 年份, 以及任意数值列（如 GDP, 第二产业占比, 第三产业占比）
+WEATHER_PATH = "城市月度气象数据.csv"
+ECONOMY_PATH = "城市年度经济数据.csv"
+MIN_SAMPLES = 6
+
+
+def load_covariate_table(path, key_columns, label):
+    """读取协变量表，城市名称规范化后与键列一起建立索引；文件不存在时返回None"""
+    try:
+        df = pd.read_csv(path, encoding='utf-8-sig')
+    except FileNotFoundError:
+        print(f"警告：{label}文件{path}未找到")
+        return None
+    missing = [column for column in key_columns if column not in df.columns]
+    if missing:
+        print(f"❌ {label}缺少键列：{missing}")
+        return None
+    df['城市'] = df['城市'].map(normalize_city_name)
+    if '时间' in key_columns:
+        df['时间'] = pd.to_datetime(df['时间'].astype(str)).dt.strftime('%Y-%m')
+    df = df.set_index(key_columns).select_dtypes('number')
+    if df.index.duplicated().any():
+        print(f"警告：{label}存在重复键，按均值合并")
+        df = df.groupby(level=key_columns).mean()
+    return df
+
+
+def align_covariates(cube, monthly=None, annual=None):
+    """把协变量对齐到立方体的 (实体, 月份) 网格上，返回 (covariates[实体, 月份, 因素], 因素名称)
+
+    月度表按 (城市, 时间) 索引、年度表按 (城市, 年份) 索引，用get_indexer一次取出全部位置，
+    年度值自动广播到当年各月；对不上的位置为NaN
+    """
+    n_entity, n_month, _ = cube.shape
+    city_keys = np.repeat([normalize_city_name(city) for city in cube.cities], n_month)
+    month_keys = np.tile(cube.months, n_entity)
+    year_keys = np.tile(cube.years, n_entity)
+
+    blocks, names = [], []
+    for table, keys in ((monthly, month_keys), (annual, year_keys)):
+        if table is None or table.empty:
+            continue
+        position = table.index.get_indexer(pd.MultiIndex.from_arrays([city_keys, keys]))
+        values = table.to_numpy(dtype=float)[position]
+        values[position < 0] = np.nan
+        blocks.append(values)
+        names += list(table.columns)
+    if not blocks:
+        return np.empty((n_entity, n_month, 0)), []
+    return np.concatenate(blocks, axis=1).reshape(n_entity, n_month, -1), names
+
+
+def covariate_set_key(covariates, names):
+    """协变量集合的哈希，用作缓存键的一部分"""
+    digest = hashlib.sha1("|".join(names).encode('utf-8'))
+    digest.update(np.ascontiguousarray(covariates).tobytes())
+    return digest.hexdigest()[:12]
+
+
+def batched_ols(X, y, valid):
+    """批量最小二乘：一次组装并求解全部 (组, 污染物) 的正规方程
+
+    X: (组, 样本, p)，y: (组, 样本, 污染物)，valid: (组, 样本, 污染物) 有效样本掩码
+    返回字典：coef/se/t/p (组, 污染物, p)，r2/n (组, 污染物)
+    """
+    weight = valid.astype(float)
+    X = np.nan_to_num(X)
+    y = np.where(valid, y, 0)
+    n_feature = X.shape[2]
+    gram = np.einsum('gsv,gsp,gsq->gvpq', weight, X, X)
+    moment = np.einsum('gsv,gsp,gsv->gvp', weight, X, y)
+    n = weight.sum(axis=1)
+    solvable = (n >= max(MIN_SAMPLES, n_feature + 1)) & (np.linalg.matrix_rank(gram) == n_feature)
+
+    # 不可解的组用单位阵占位，结果统一置为NaN
+    gram = np.where(solvable[:, :, np.newaxis, np.newaxis], gram, np.eye(n_feature))
+    inverse = np.linalg.inv(gram)
+    coef = np.einsum('gvpq,gvq->gvp', inverse, moment)
+
+    fitted = np.einsum('gsp,gvp->gsv', X, coef)
+    resid_ss = (weight * (y - fitted) ** 2).sum(axis=1)
+    mean_y = (weight * y).sum(axis=1) / np.maximum(n, 1)
+    total_ss = (weight * (y - mean_y[:, np.newaxis, :]) ** 2).sum(axis=1)
+    dof = n - n_feature
+    with np.errstate(invalid='ignore', divide='ignore'):
+        sigma2 = resid_ss / dof
+        se = np.sqrt(sigma2[:, :, np.newaxis] * np.diagonal(inverse, axis1=2, axis2=3))
+        t_value = coef / se
+        r2 = 1 - resid_ss / total_ss
+    p_value = 2 * t_dist.sf(np.abs(t_value), np.maximum(dof, 1)[:, :, np.newaxis])
+
+    result = {'coef': coef, 'se': se, 't': t_value, 'p': p_value, 'r2': r2}
+    for key in result:
+        result[key] = np.where(solvable.reshape(solvable.shape + (1,) * (result[key].ndim - 2)), result[key], np.nan)
+    result['n'] = n.astype(int)
+    return result
+
+
+def fit_factor_regression(cube, covariates, names, pooled=False, use_cache=True):
+    """对全部污染物同时回归：pooled=False时每个实体（城市/子站）各自一组，pooled=True时所有实体合为一组
+
+    协变量先标准化（z分数），系数表示因素变化一个标准差对应的污染物变化量。
+    结果按 数据版本 + 协变量集合 缓存
+    """
+    mode = 'pooled' if pooled else 'per_entity'
+    cache_name = f"factor_regression_{mode}_{covariate_set_key(covariates, names)}"
+    if use_cache:
+        cached = load_cache(cache_name, cube.version)
+        if cached is not None:
+            print(f"✅ 读取回归缓存：{cache_name}_{cube.version}")
+            return cached
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        standardized = (covariates - np.nanmean(covariates, axis=(0, 1))) / np.nanstd(covariates, axis=(0, 1))
+    X = np.concatenate([np.ones(covariates.shape[:2] + (1,)), standardized], axis=2)
+    y = cube.values
+    valid = np.isfinite(y) & np.isfinite(X).all(axis=2)[:, :, np.newaxis]
+    if pooled:
+        X, y, valid = (array.reshape((1, -1) + array.shape[2:]) for array in (X, y, valid))
+
+    result = batched_ols(X, y, valid)
+    save_cache(cache_name, cube.version, **result)
+    return result
+
+
+def regression_to_frame(cube, result, names, pooled=False):
+    """整理为长表：每行一个 组×污染物×因素"""
+    features = ['截距'] + list(names)
+    groups = ['全部'] if pooled else cube.entities
+    n_var = len(cube.variables)
+    n_feature = len(features)
+    df = pd.DataFrame({
+        '组': np.repeat(groups, n_var * n_feature),
+        '污染物': np.tile(np.repeat(cube.variables, n_feature), len(groups)),
+        '因素': np.tile(features, len(groups) * n_var),
+        '标准化系数': result['coef'].ravel(),
+        '标准误': result['se'].ravel(),
+        't值': result['t'].ravel(),
+        'p值': result['p'].ravel(),
+        'R²': np.repeat(result['r2'].ravel(), n_feature),
+        '样本数': np.repeat(result['n'].ravel(), n_feature),
+    })
+    return df
+
+
+def run_factor_analysis(cube, data_dir=".", pooled=False):
+    """读取本地气象与经济协变量，对齐到污染面板并回归；没有任何协变量时返回None"""
+    monthly = load_covariate_table(os.path.join(data_dir, WEATHER_PATH), ['城市', '时间'], "月度气象数据")
+    annual = load_covariate_table(os.path.join(data_dir, ECONOMY_PATH), ['城市', '年份'], "年度经济数据")
+    covariates, names = align_covariates(cube, monthly, annual)
+    if not names:
+        print("❌ 没有可用的影响因素数据，跳过回归分析")
+        return None
+    matched = np.isfinite(covariates).all(axis=2).mean()
+    print(f"影响因素：{names}，与污染数据匹配的实体-月份占{matched:.1%}")
+    result = fit_factor_regression(cube, covariates, names, pooled)
+    return regression_to_frame(cube, result, names, pooled)
+
+
+if __name__ == "__main__":
+    city_cube = load_city_cube()
+    if city_cube is not None:
+        for pooled, output in ((False, "城市影响因素回归结果.csv"), (True, "全域影响因素回归结果.csv")):
+            table = run_factor_analysis(city_cube, pooled=pooled)
+            if table is not None:
+                table.to_csv(output, index=False, encoding="utf-8-sig")
+                print(f"✅ 回归结果保存成功：{output}")
+
+    station_cube = load_station_cube()
+    if station_cube is not None:
+        table = run_factor_analysis(station_cube, pooled=True)
+        if table is not None:
+            table.to_csv("子站影响因素回归结果.csv", index=False, encoding="utf-8-sig")
+            print("✅ 回归结果保存成功：子站影响因素回归结果.csv")
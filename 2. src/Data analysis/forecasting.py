@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+from station_cube import load_station_cube, load_city_cube, load_cache, save_cache
+
+STATION_TARGETS = ["PM2.5", "PM10", "O3"]
+# 城市级预处理数据没有O3字段
+CITY_TARGETS = ["PM2.5", "PM10"]
+FEATURE_NAMES = ['截距', '滞后1月', '滞后2月', '季节正弦', '季节余弦']
+# 岭回归正则系数（RLS初始逆矩阵为 I/RIDGE）
+RIDGE = 1e-4
+# 回测时至少用多少个月训练后才开始计入误差
+MIN_TRAIN = 12
+
+
+def build_features(series, months):
+    """构造滞后与季节特征
+
+    series: (n_series, T)；months: 长度T的月份编号
+    返回 X: (n_series, T, p)，第t行只用t之前的观测，可用于预测第t个月
+    """
+    n_series, n_time = series.shape
+    lag1 = np.full(series.shape, np.nan)
+    lag2 = np.full(series.shape, np.nan)
+    lag1[:, 1:] = series[:, :-1]
+    lag2[:, 2:] = series[:, :-2]
+    angle = 2 * np.pi * np.asarray(months) / 12
+    seasonal = np.broadcast_to(np.stack([np.sin(angle), np.cos(angle)], axis=1), (n_series, n_time, 2))
+    return np.concatenate([np.ones((n_series, n_time, 1)), lag1[:, :, np.newaxis], lag2[:, :, np.newaxis],
+                           seasonal], axis=2)
+
+
+def rolling_origin_fit(X, y, ridge=RIDGE, min_train=MIN_TRAIN):
+    """所有序列同时做递推最小二乘（RLS），一次时间扫描完成全部滚动起点的回测
+
+    第t个起点用前t个月拟合的系数预测第t个月，然后用该月观测做秩1更新；
+    各起点之间复用同一个逆矩阵 P=(XᵀX+λI)⁻¹ 的秩1更新（Sherman-Morrison），不再重新分解
+    返回 (beta[n_series, p] 全样本系数, predictions[n_series, T] 一步预测，训练月数不足min_train时为NaN)
+    """
+    n_series, n_time, n_feature = X.shape
+    P = np.broadcast_to(np.eye(n_feature) / ridge, (n_series, n_feature, n_feature)).copy()
+    beta = np.zeros((n_series, n_feature))
+    n_seen = np.zeros(n_series, dtype=int)
+    predictions = np.full((n_series, n_time), np.nan)
+
+    for t in range(n_time):
+        x = X[:, t, :]
+        valid = np.isfinite(x).all(axis=1) & np.isfinite(y[:, t])
+        x = np.where(valid[:, np.newaxis], x, 0)
+        prediction = (x * beta).sum(axis=1)
+        predictions[:, t] = np.where(valid & (n_seen >= min_train), prediction, np.nan)
+
+        Px = np.einsum('sij,sj->si', P, x)
+        gain = Px / (1 + (x * Px).sum(axis=1))[:, np.newaxis]
+        error = np.where(valid, y[:, t] - prediction, 0)
+        beta += gain * error[:, np.newaxis]
+        P -= np.where(valid[:, np.newaxis, np.newaxis], gain[:, :, np.newaxis] * Px[:, np.newaxis, :], 0)
+        n_seen += valid
+    return beta, predictions
+
+
+def _error_metrics(actual, predicted):
+    error = predicted - actual
+    scored = np.isfinite(error)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mae = np.nansum(np.abs(error), axis=1) / scored.sum(axis=1)
+        rmse = np.sqrt(np.nansum(error ** 2, axis=1) / scored.sum(axis=1))
+    return mae, rmse, scored.sum(axis=1)
+
+
+def forecast_cube(cube, targets, use_cache=True):
+    """对立方体中 实体×目标污染物 的全部序列拟合并预测下一个月，同时给出滚动起点回测误差
+
+    返回字典，各值为 (实体数, 目标数) 矩阵：forecast, mae, rmse, naive_mae, n_origins；以及coef (实体, 目标, 特征)
+    """
+    cache_name = "forecast_" + "_".join(targets)
+    if use_cache:
+        cached = load_cache(cache_name, cube.version)
+        if cached is not None:
+            print(f"✅ 读取预测缓存：{cache_name}_{cube.version}")
+            return cached
+
+    n_entity, n_month, _ = cube.shape
+    y = np.stack([cube.get(target) for target in targets], axis=1).reshape(n_entity * len(targets), n_month)
+    months = cube.month_numbers
+    X = build_features(y, months)
+    beta, predictions = rolling_origin_fit(X, y)
+
+    # 下一个月的特征：最近两个月的观测与下个月的季节项
+    next_month = months[-1] % 12 + 1
+    angle = 2 * np.pi * next_month / 12
+    x_next = np.column_stack([np.ones(len(y)), y[:, -1], y[:, -2],
+                              np.full(len(y), np.sin(angle)), np.full(len(y), np.cos(angle))])
+    forecast = (x_next * beta).sum(axis=1)
+
+    mae, rmse, n_origins = _error_metrics(y, predictions)
+    # 持续性预测（下月等于本月）作为基准
+    naive = np.where(np.isfinite(predictions), X[:, :, 1], np.nan)
+    naive_mae, _, _ = _error_metrics(y, naive)
+
+    result = {key: value.reshape(n_entity, len(targets)) for key, value in
+              (('forecast', forecast), ('mae', mae), ('rmse', rmse), ('naive_mae', naive_mae),
+               ('n_origins', n_origins))}
+    result['coef'] = beta.reshape(n_entity, len(targets), -1)
+    save_cache(cache_name, cube.version, **result)
+    return result
+
+
+def forecasts_to_frame(cube, targets, result):
+    """整理为长表：每行一个 实体×污染物 的下月预测与回测误差"""
+    n_entity = len(cube.entities)
+    target_month = (pd.Period(cube.months[-1], freq='M') + 1).strftime('%Y-%m')
+    df = pd.DataFrame({
+        '实体': np.repeat(cube.entities, len(targets)),
+        '城市': np.repeat(cube.cities, len(targets)),
+        '污染物': np.tile(targets, n_entity),
+        '预测月份': target_month,
+        '预测值': result['forecast'].ravel(),
+        '回测次数': result['n_origins'].ravel().astype(int),
+        '回测MAE': result['mae'].ravel(),
+        '回测RMSE': result['rmse'].ravel(),
+        '持续性预测MAE': result['naive_mae'].ravel(),
+    })
+    with np.errstate(invalid='ignore', divide='ignore'):
+        df['技能评分'] = 1 - df['回测MAE'] / df['持续性预测MAE']
+    return df
+
+
+def save_forecasts(df, output_path):
+    df.to_csv(output_path, index=False, encoding="utf-8-sig")
+    print(f"✅ 预测结果保存成功：{output_path}")
+    print(f"数据规模：{df.shape[0]}行 × {df.shape[1]}列，平均技能评分{df['技能评分'].mean():.3f}")
+
+
+if __name__ == "__main__":
+    station_cube = load_station_cube()
+    if station_cube is not None:
+        save_forecasts(forecasts_to_frame(station_cube, STATION_TARGETS,
+                                          forecast_cube(station_cube, STATION_TARGETS)), "子站污染物下月预测.csv")
+
+    city_cube = load_city_cube()
+    if city_cube is not None:
+        save_forecasts(forecasts_to_frame(city_cube, CITY_TARGETS,
+                                          forecast_cube(city_cube, CITY_TARGETS)), "城市污染物下月预测.csv")
@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+from station_cube import load_city_cube, load_station_cube, load_cache, save_cache
+
+MAX_LAG = 3
+# 每批参与互相关的行序列数，限制 (批大小, 序列数, FFT长度) 互谱数组的内存
+ROW_CHUNK = 256
+
+
+def monthly_anomalies(series, months):
+    """减去各序列的月份气候平均值并标准化，去掉所有城市共有的季节循环，避免滞后相关被季节性主导"""
+    series = np.asarray(series, dtype=float)
+    indicator = (np.asarray(months)[:, np.newaxis] == np.arange(1, 13)[np.newaxis, :]).astype(float)
+    observed = np.isfinite(series)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        climatology = (np.where(observed, series, 0) @ indicator) / (observed.astype(float) @ indicator)
+        anomalies = series - climatology[:, np.asarray(months) - 1]
+        anomalies = (anomalies - np.nanmean(anomalies, axis=1, keepdims=True)) / np.nanstd(anomalies, axis=1,
+                                                                                           keepdims=True)
+    return anomalies
+
+
+def lagged_cross_correlation(series, max_lag=MAX_LAG, row_chunk=ROW_CHUNK):
+    """基于FFT的全部序列两两滞后互相关
+
+    series: (n_series, T)，已标准化，缺测为NaN
+    返回 (corr[2*max_lag+1, n, n], overlap[2*max_lag+1, n, n])，corr[k, i, j] 为 x_i(t) 与 x_j(t+lag) 的相关，
+    lag = k - max_lag；lag>0处的峰值表示序列i领先序列j。每对的分子与有效重叠月数都由互谱逆变换得到
+    """
+    observed = np.isfinite(series)
+    values = np.where(observed, series, 0)
+    n_series, n_time = values.shape
+    n_fft = 1 << int(np.ceil(np.log2(2 * n_time - 1)))
+    spectrum = np.fft.rfft(values, n=n_fft, axis=1)
+    mask_spectrum = np.fft.rfft(observed.astype(float), n=n_fft, axis=1)
+    lags = np.arange(-max_lag, max_lag + 1)
+
+    corr = np.empty((len(lags), n_series, n_series))
+    overlap = np.empty((len(lags), n_series, n_series))
+    for start in range(0, n_series, row_chunk):
+        rows = slice(start, start + row_chunk)
+        # 循环互相关：c[i, j, lag] = Σ_t x_i(t) x_j(t+lag)，负滞后位于数组末尾
+        cross = np.fft.irfft(np.conj(spectrum[rows, np.newaxis, :]) * spectrum[np.newaxis, :, :], n=n_fft)
+        counts = np.fft.irfft(np.conj(mask_spectrum[rows, np.newaxis, :]) * mask_spectrum[np.newaxis, :, :], n=n_fft)
+        cross = np.moveaxis(cross[:, :, lags % n_fft], 2, 0)
+        counts = np.rint(np.moveaxis(counts[:, :, lags % n_fft], 2, 0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            corr[:, rows, :] = np.where(counts > 2, cross / counts, np.nan)
+        overlap[:, rows, :] = counts
+    return np.clip(corr, -1, 1), overlap
+
+
+def run_lagged_correlation(cube, variable='PM2.5', max_lag=MAX_LAG, use_cache=True):
+    """计算立方体中某变量全部实体两两之间的滞后互相关，结果按数据版本缓存"""
+    cache_name = f"lagged_corr_{variable.replace('/', '_')}_{max_lag}"
+    if use_cache:
+        cached = load_cache(cache_name, cube.version)
+        if cached is not None:
+            print(f"✅ 读取滞后相关缓存：{cache_name}_{cube.version}")
+            return cached
+
+    anomalies = monthly_anomalies(cube.get(variable), cube.month_numbers)
+    corr, overlap = lagged_cross_correlation(anomalies, max_lag)
+    result = {'corr': corr, 'overlap': overlap, 'lags': np.arange(-max_lag, max_lag + 1)}
+    save_cache(cache_name, cube.version, **result)
+    return result
+
+
+def lead_lag_summary(cube, result, significance=2.0):
+    """每对实体的峰值相关与对应滞后，返回长表
+
+    只保留i<j的实体对；最佳滞后>0表示实体1领先实体2，显著性按 |r| > significance/√n 近似判断
+    """
+    corr = result['corr']
+    lags = result['lags']
+    n = corr.shape[1]
+    i, j = np.triu_indices(n, k=1)
+    pair_corr = corr[:, i, j]
+    best = np.nanargmax(np.abs(np.nan_to_num(pair_corr, nan=0)), axis=0)
+    peak = pair_corr[best, np.arange(len(i))]
+    overlap = result['overlap'][best, i, j]
+    zero_lag = corr[list(lags).index(0), i, j]
+    entities = np.asarray(cube.entities)
+    return pd.DataFrame({
+        '实体1': entities[i],
+        '实体2': entities[j],
+        '同期相关': zero_lag,
+        '峰值相关': peak,
+        '最佳滞后(月)': lags[best],
+        '重叠月数': overlap.astype(int),
+        '显著': np.abs(peak) > significance / np.sqrt(np.maximum(overlap, 1)),
+    })
+
+
+if __name__ == "__main__":
+    city_cube = load_city_cube()
+    if city_cube is not None:
+        summary = lead_lag_summary(city_cube, run_lagged_correlation(city_cube, 'PM2.5'))
+        summary.to_csv("城市PM2.5滞后互相关.csv", index=False, encoding="utf-8-sig")
+        print(f"✅ 滞后互相关结果保存成功：城市PM2.5滞后互相关.csv（显著实体对{summary['显著'].sum()}个）")
+
+    station_cube = load_station_cube()
+    if station_cube is not None:
+        summary = lead_lag_summary(station_cube, run_lagged_correlation(station_cube, 'PM2.5'))
+        summary.to_csv("子站PM2.5滞后互相关.csv", index=False, encoding="utf-8-sig")
+        print(f"✅ 滞后互相关结果保存成功：子站PM2.5滞后互相关.csv（显著实体对{summary['显著'].sum()}个）")
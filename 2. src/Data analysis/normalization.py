@@ -0,0 +1,157 @@
+import warnings
+import numpy as np
+import pandas as pd
+from station_cube import load_station_cube, load_cache, save_cache, POLLUTANTS
+
+# 分组方式：全局、按年份（与各年份预处理脚本中的MinMaxScaler一致）、按子站、按城市
+GROUPINGS = ('全局', '年份', '子站', '城市')
+SCHEMES = ('minmax', 'zscore', 'robust')
+# 标准化字段后缀，minmax沿用 add_fields_with_minmaxscaler 的"_标准化"
+SCHEME_SUFFIX = {'minmax': '_标准化', 'zscore': '_Z分数', 'robust': '_稳健标准化'}
+STAT_NAMES = ('count', 'min', 'max', 'mean', 'std', 'median', 'q1', 'q3')
+
+
+def group_labels(cube, grouping):
+    """每个 (实体, 月份) 所属分组的标签，返回 (实体, 月份) 字符串数组"""
+    n_entity, n_month, _ = cube.shape
+    if grouping == '全局':
+        labels = np.full(n_month, grouping)[np.newaxis, :]
+    elif grouping == '年份':
+        labels = cube.years.astype(str)[np.newaxis, :]
+    elif grouping == '子站':
+        labels = np.asarray(cube.entities, dtype=str)[:, np.newaxis]
+    elif grouping == '城市':
+        labels = np.asarray(cube.cities, dtype=str)[:, np.newaxis]
+    else:
+        raise ValueError(f"未知的分组方式：{grouping}，可选{GROUPINGS}")
+    return np.broadcast_to(labels, (n_entity, n_month))
+
+
+def grouped_statistics(values, codes, n_groups):
+    """一次分组归约：把 (样本, 变量) 按组整理为 (组, 最大组大小, 变量) 的NaN补齐张量，
+    沿组内轴同时求出计数、最小值、最大值、均值、标准差、中位数与上下四分位数，返回 (组, 统计量, 变量)
+    """
+    order = np.argsort(codes, kind='stable')
+    codes, values = codes[order], values[order]
+    counts = np.bincount(codes, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    position = np.arange(len(codes)) - starts[codes]
+    padded = np.full((n_groups, max(counts.max(), 1), values.shape[1]), np.nan)
+    padded[codes, position] = values
+
+    with warnings.catch_warnings():
+        # 全部缺测的 组×变量 统计量为NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        q1, median, q3 = np.nanpercentile(padded, [25, 50, 75], axis=1)
+        stats = [np.isfinite(padded).sum(axis=1).astype(float), np.nanmin(padded, axis=1),
+                 np.nanmax(padded, axis=1), np.nanmean(padded, axis=1), np.nanstd(padded, axis=1), median, q1, q3]
+    return np.stack(stats, axis=1)
+
+
+class GroupedNormalizer:
+    """多种标准化方案的分组参数：一次拟合得到全部方案所需的统计量，保存后新月份可直接转换，无需重新拟合"""
+
+    def __init__(self, grouping='年份', variables=POLLUTANTS):
+        if grouping not in GROUPINGS:
+            raise ValueError(f"未知的分组方式：{grouping}，可选{GROUPINGS}")
+        self.grouping = grouping
+        self.variables = list(variables)
+        self.labels = []
+        self.stats = None
+
+    def fit(self, cube):
+        labels = group_labels(cube, self.grouping)
+        self.labels, codes = np.unique(labels.ravel(), return_inverse=True)
+        self.labels = self.labels.tolist()
+        values = np.stack([cube.get(variable) for variable in self.variables], axis=2).reshape(-1, len(self.variables))
+        self.stats = grouped_statistics(values, codes, len(self.labels))
+        return self
+
+    def parameters(self, scheme):
+        """方案的 (中心, 尺度)，形状均为 (组, 变量)；尺度为0时取1，与scikit-learn的处理一致"""
+        stat = {name: self.stats[:, i, :] for i, name in enumerate(STAT_NAMES)}
+        if scheme == 'minmax':
+            center, scale = stat['min'], stat['max'] - stat['min']
+        elif scheme == 'zscore':
+            center, scale = stat['mean'], stat['std']
+        elif scheme == 'robust':
+            center, scale = stat['median'], stat['q3'] - stat['q1']
+        else:
+            raise ValueError(f"未知的标准化方案：{scheme}，可选{SCHEMES}")
+        return center, np.where(scale == 0, 1.0, scale)
+
+    def transform(self, cube, scheme='minmax'):
+        """按保存的参数转换立方体，返回 (实体, 月份, 变量)；参数中没有的分组（如新的年份或子站）为NaN"""
+        labels = group_labels(cube, self.grouping)
+        index = pd.Index(self.labels).get_indexer(labels.ravel())
+        unknown = np.unique(labels.ravel()[index < 0])
+        if len(unknown):
+            print(f"警告：以下{self.grouping}没有已保存的标准化参数，结果为NaN：{unknown.tolist()}")
+        center, scale = self.parameters(scheme)
+        # 末尾追加一行NaN，未知分组（-1）直接取到它
+        center = np.vstack([center, np.full((1, len(self.variables)), np.nan)])[index]
+        scale = np.vstack([scale, np.full((1, len(self.variables)), np.nan)])[index]
+        values = np.stack([cube.get(variable) for variable in self.variables], axis=2)
+        return (values - center.reshape(values.shape)) / scale.reshape(values.shape)
+
+    def transform_all(self, cube, schemes=SCHEMES):
+        """一次返回多个方案的结果 {方案: (实体, 月份, 变量)}"""
+        return {scheme: self.transform(cube, scheme) for scheme in schemes}
+
+    def parameter_frame(self):
+        """参数长表：分组、污染物及各统计量"""
+        n_group, n_stat, n_var = self.stats.shape
+        df = pd.DataFrame(np.moveaxis(self.stats, 1, 2).reshape(-1, n_stat), columns=STAT_NAMES)
+        df.insert(0, '污染物', np.tile(self.variables, n_group))
+        df.insert(0, self.grouping, np.repeat(self.labels, n_var))
+        return df
+
+    def save(self):
+        return save_cache(f"normalization_{self.grouping}", "params", labels=np.array(self.labels, dtype=str),
+                          variables=np.array(self.variables, dtype=str), stats=self.stats)
+
+    @classmethod
+    def load(cls, grouping='年份'):
+        """读取保存的标准化参数，不存在时返回None"""
+        state = load_cache(f"normalization_{grouping}", "params")
+        if state is None:
+            return None
+        normalizer = cls(grouping, state['variables'].tolist())
+        normalizer.labels = state['labels'].tolist()
+        normalizer.stats = state['stats']
+        return normalizer
+
+
+def normalized_frame(cube, normalizer, schemes=SCHEMES):
+    """长表：子站、城市、时间及各方案的标准化字段，列名为 污染物_分组+方案，如"PM2.5_城市Z分数" """
+    n_entity, n_month, _ = cube.shape
+    df = pd.DataFrame({
+        '监测子站名称': np.repeat(cube.entities, n_month),
+        '城市': np.repeat(cube.cities, n_month),
+        '时间': np.tile(cube.months, n_entity),
+    })
+    for scheme, values in normalizer.transform_all(cube, schemes).items():
+        for v, variable in enumerate(normalizer.variables):
+            df[f"{variable}_{normalizer.grouping}{SCHEME_SUFFIX[scheme].lstrip('_')}"] = values[:, :, v].ravel()
+    return df
+
+
+def fit_normalizers(cube, groupings=GROUPINGS):
+    """拟合并保存全部分组方式的标准化参数"""
+    normalizers = {}
+    for grouping in groupings:
+        normalizers[grouping] = GroupedNormalizer(grouping).fit(cube)
+        normalizers[grouping].save()
+        print(f"✅ {grouping}标准化参数已保存：{len(normalizers[grouping].labels)}组")
+    return normalizers
+
+
+if __name__ == "__main__":
+    station_cube = load_station_cube()
+    if station_cube is not None:
+        normalizers = fit_normalizers(station_cube)
+        for grouping, normalizer in normalizers.items():
+            result_path, parameter_path = f"子站标准化结果_按{grouping}.csv", f"子站标准化参数_按{grouping}.csv"
+            normalized_frame(station_cube, normalizer).to_csv(result_path, index=False, encoding="utf-8-sig")
+            normalizer.parameter_frame().to_csv(parameter_path, index=False, encoding="utf-8-sig")
+            print(f"✅ 标准化结果保存成功：{result_path}、{parameter_path}")
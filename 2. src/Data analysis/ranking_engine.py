@@ -0,0 +1,209 @@
+import hashlib
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+from station_cube import load_city_cube, load_station_cube, load_cache, save_cache
+
+TOP_K = 3
+# 数值越高代表空气质量越好的指标，排名时取反，保证第1名始终是污染最重的实体
+HIGHER_IS_BETTER = {"AQI达标率"}
+PERIODS = ('月份', '季节', '年份')
+# 并列名次的处理方式（scipy.stats.rankdata的method），也用于区分保存的排名状态
+RANK_METHOD = 'min'
+
+
+def rank_entities(values, variables):
+    """沿实体轴排名：values (实体, 时期, 变量)，污染最重为第1名，缺测为NaN
+
+    数值相同的实体并列（竞争排名，如1、2、2、4），不按实体名称顺序拉开名次
+    """
+    sign = np.array([-1.0 if variable in HIGHER_IS_BETTER else 1.0 for variable in variables])
+    valid = np.isfinite(values)
+    # 缺测排在最后，不影响有观测实体的名次
+    scores = np.where(valid, -values * sign, np.inf)
+    ranks = rankdata(scores, method=RANK_METHOD, axis=0).astype(float)
+    return np.where(valid, ranks, np.nan)
+
+
+def _period_labels(cube, period):
+    if period == '月份':
+        return np.asarray(cube.months)
+    if period == '季节':
+        return np.char.add(np.char.add(cube.years.astype(str), '-'), cube.seasons.astype(str))
+    return cube.years.astype(str)
+
+
+def month_digests(cube):
+    """各月全部 实体×变量 数值的短哈希，用于发现已排名月份的数据修订"""
+    return [hashlib.sha1(np.ascontiguousarray(cube.values[:, m, :]).tobytes()).hexdigest()[:16]
+            for m in range(len(cube.months))]
+
+
+class RankingTracker:
+    """城市/子站逐月、逐季、逐年排名，支持追加新月份后的增量更新
+
+    月度排名各月独立，追加时只对新月份排序；季度与年度排名保存各时期的累计和与观测数，
+    新月份只更新其所属时期的均值并对这些时期重新排序；同时保存各月数据的哈希，
+    实体、变量变化或已排名月份的数据被修订时由 stale_reason 发现，需要重新计算
+    """
+
+    def __init__(self, level='城市'):
+        self.level = level
+        self.entities = []
+        self.cities = np.array([], dtype=str)
+        self.variables = []
+        self.labels = {period: [] for period in PERIODS}
+        self.sums = {period: None for period in PERIODS}
+        self.counts = {period: None for period in PERIODS}
+        self.ranks = {period: None for period in PERIODS}
+        self.digests = []
+
+    def append(self, cube):
+        """追加立方体中尚未统计过的月份，返回新增月数"""
+        if not self.entities:
+            self.entities = list(cube.entities)
+            self.cities = np.asarray(cube.cities).astype(str)
+            self.variables = list(cube.variables)
+            for period in PERIODS:
+                self.sums[period] = np.zeros((len(self.entities), 0, len(self.variables)))
+                self.counts[period] = np.zeros_like(self.sums[period])
+                self.ranks[period] = np.zeros_like(self.sums[period])
+        elif list(cube.entities) != self.entities or list(cube.variables) != self.variables:
+            raise ValueError("追加数据的实体或变量与已有排名不一致")
+
+        is_new = ~np.isin(cube.months, self.labels['月份'])
+        if not is_new.any():
+            return 0
+        values = cube.values[:, is_new, :]
+        observed = np.isfinite(values)
+        self.digests += [digest for digest, new in zip(month_digests(cube), is_new) if new]
+        for period in PERIODS:
+            keys = _period_labels(cube, period)[is_new]
+            # 新出现的时期追加到末尾
+            added = [key for key in dict.fromkeys(keys) if key not in self.labels[period]]
+            if added:
+                self.labels[period] += added
+                padding = np.zeros((len(self.entities), len(added), len(self.variables)))
+                self.sums[period] = np.concatenate([self.sums[period], padding], axis=1)
+                self.counts[period] = np.concatenate([self.counts[period], padding], axis=1)
+                self.ranks[period] = np.concatenate([self.ranks[period], padding], axis=1)
+            position = np.array([self.labels[period].index(key) for key in keys])
+            # (新月份, 时期) 指示矩阵：一次矩阵乘法把新月份累加到所属时期
+            indicator = (position[:, np.newaxis] == np.arange(len(self.labels[period]))[np.newaxis, :]).astype(float)
+            self.sums[period] += np.einsum('emv,mp->epv', np.where(observed, values, 0), indicator)
+            self.counts[period] += np.einsum('emv,mp->epv', observed.astype(float), indicator)
+            touched = np.unique(position)
+            self.ranks[period][:, touched, :] = rank_entities(self.means(period)[:, touched, :], self.variables)
+        return int(is_new.sum())
+
+    def stale_reason(self, cube):
+        """已保存的排名能否在该立方体上增量追加：不能时返回原因，可以时返回None"""
+        if not self.entities:
+            return None
+        if list(cube.entities) != self.entities or list(cube.variables) != self.variables:
+            return "实体或变量与已保存的排名不一致"
+        if len(self.digests) != len(self.labels['月份']):
+            return "已保存的排名缺少各月数据哈希"
+        current = dict(zip(cube.months, month_digests(cube)))
+        revised = [month for month, digest in zip(self.labels['月份'], self.digests)
+                   if current.get(month, digest) != digest]
+        if revised:
+            return f"已排名月份的数据有修订：{revised}"
+        return None
+
+    def means(self, period):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts[period] > 0, self.sums[period] / self.counts[period], np.nan)
+
+    def rank_changes(self, period):
+        """本期名次 - 上期名次，正值表示相对其他实体污染减轻；首期为NaN"""
+        ranks = self.ranks[period]
+        change = np.full(ranks.shape, np.nan)
+        change[:, 1:, :] = ranks[:, 1:, :] - ranks[:, :-1, :]
+        return change
+
+    def to_frame(self, period='月份'):
+        """长表：实体、城市、时期、污染物、数值、排名、排名变化"""
+        n_entity, n_period, n_var = self.ranks[period].shape
+        df = pd.DataFrame({
+            self.level: np.repeat(self.entities, n_period * n_var),
+            '城市': np.repeat(self.cities, n_period * n_var),
+            period: np.tile(np.repeat(self.labels[period], n_var), n_entity),
+            '污染物': np.tile(self.variables, n_entity * n_period),
+            '数值': self.means(period).ravel(),
+            '排名': self.ranks[period].ravel(),
+            '排名变化': self.rank_changes(period).ravel(),
+        })
+        return df.dropna(subset=['排名']).reset_index(drop=True)
+
+    def extreme_counts(self, k=TOP_K, period='月份'):
+        """各实体各污染物进入前k（污染最重）与后k（污染最轻）的时期数"""
+        ranks = self.ranks[period]
+        n_valid = np.isfinite(ranks).sum(axis=0, keepdims=True)
+        top = (ranks <= k).sum(axis=1)
+        bottom = (ranks > n_valid - k).sum(axis=1)
+        n_entity, n_var = top.shape
+        return pd.DataFrame({
+            self.level: np.repeat(self.entities, n_var),
+            '城市': np.repeat(self.cities, n_var),
+            '污染物': np.tile(self.variables, n_entity),
+            f'前{k}{period}数': top.ravel(),
+            f'后{k}{period}数': bottom.ravel(),
+            f'参与排名{period}数': np.isfinite(ranks).sum(axis=1).ravel(),
+        })
+
+    def save(self):
+        arrays = {'entities': np.array(self.entities, dtype=str), 'cities': self.cities,
+                  'variables': np.array(self.variables, dtype=str), 'digests': np.array(self.digests, dtype=str)}
+        for i, period in enumerate(PERIODS):
+            arrays[f'labels_{i}'] = np.array(self.labels[period], dtype=str)
+            arrays[f'sums_{i}'] = self.sums[period]
+            arrays[f'counts_{i}'] = self.counts[period]
+            arrays[f'ranks_{i}'] = self.ranks[period]
+        return save_cache(f"rankings_{self.level}", f"state_{RANK_METHOD}", **arrays)
+
+    @classmethod
+    def load(cls, level='城市'):
+        """读取上次保存的排名状态，不存在时返回空的排名器"""
+        tracker = cls(level)
+        state = load_cache(f"rankings_{level}", f"state_{RANK_METHOD}")
+        if state is not None:
+            tracker.entities = state['entities'].tolist()
+            tracker.cities = state['cities']
+            tracker.variables = state['variables'].tolist()
+            tracker.digests = state['digests'].tolist() if 'digests' in state else []
+            for i, period in enumerate(PERIODS):
+                tracker.labels[period] = state[f'labels_{i}'].tolist()
+                tracker.sums[period] = state[f'sums_{i}']
+                tracker.counts[period] = state[f'counts_{i}']
+                tracker.ranks[period] = state[f'ranks_{i}']
+            print(f"✅ 读取{level}排名状态：已统计{len(tracker.labels['月份'])}个月")
+        return tracker
+
+
+def update_rankings(cube, level, incremental=True):
+    """在已保存状态的基础上追加新月份并保存；incremental=False，或实体、变量变化、已排名月份数据被修订时
+    重新计算全部排名
+    """
+    tracker = RankingTracker.load(level) if incremental else RankingTracker(level)
+    reason = tracker.stale_reason(cube)
+    if reason is not None:
+        print(f"警告：{reason}，重新计算全部{level}排名")
+        tracker = RankingTracker(level)
+    n_new = tracker.append(cube)
+    print(f"✅ {level}排名更新完成：新增{n_new}个月，共{len(tracker.labels['月份'])}个月")
+    tracker.save()
+    return tracker
+
+
+if __name__ == "__main__":
+    for level, cube in (('城市', load_city_cube()), ('子站', load_station_cube())):
+        if cube is None:
+            continue
+        tracker = update_rankings(cube, level)
+        for period in PERIODS:
+            output = f"{level}{period}排名.csv"
+            tracker.to_frame(period).to_csv(output, index=False, encoding="utf-8-sig")
+            print(f"✅ 排名结果保存成功：{output}")
+        tracker.extreme_counts().to_csv(f"{level}前后{TOP_K}名月数.csv", index=False, encoding="utf-8-sig")
+        print(f"✅ 前后{TOP_K}名统计保存成功：{level}前后{TOP_K}名月数.csv")
@@ -0,0 +1,149 @@
+import os
+import numpy as np
+import pandas as pd
+from station_cube import load_station_data, load_city_data, normalize_city_name
+
+RECONCILE_VARIABLES = ["PM2.5", "PM10"]
+# 子站均值与官方值相对偏差超过该比例时标记
+RELATIVE_THRESHOLD = 0.2
+# 相对偏差偏离该城市历史偏差的稳健Z值超过该值时标记（城市与子站口径差异通常是稳定的系统偏差）
+Z_THRESHOLD = 3.5
+MIN_HISTORY = 6
+# 对账表中一条记录的键
+KEY_COLUMNS = ['城市', '时间', '污染物']
+RECONCILIATION_TABLE = "城市子站对账表.csv"
+DISCREPANCY_TABLE = "城市子站差异记录.csv"
+
+
+def hash_keys(cities, months):
+    """(城市, 月份) 组合的64位哈希键，城市名称先规范化（"东莞市"与"东莞"得到同一个键）"""
+    cities = pd.Series(cities).map(normalize_city_name).to_numpy(dtype=str)
+    return pd.util.hash_array(np.char.add(np.char.add(cities, '|'), np.asarray(months, dtype=str)))
+
+
+def station_city_means(station_df, variables=RECONCILE_VARIABLES):
+    """按哈希键汇总子站数据：各 城市×月份 的子站均值与参与平均的子站数"""
+    keys = hash_keys(station_df['城市'], station_df['时间'])
+    grouped = station_df[variables].groupby(keys)
+    means = grouped.mean()
+    means['子站数'] = grouped.size()
+    first = station_df.groupby(keys)[['城市', '时间']].first()
+    means['城市'] = first['城市'].map(normalize_city_name)
+    means['时间'] = first['时间']
+    return means
+
+
+def reconcile(station_df, city_df, variables=RECONCILE_VARIABLES):
+    """一次对齐全部 城市×月份：子站均值与官方城市值的偏差，返回长表（每行一个 城市×月份×污染物）
+
+    以子站汇总结果为主表，官方值通过哈希键的get_indexer一次取出；官方数据缺失的月份官方值为NaN
+    """
+    means = station_city_means(station_df, variables)
+    official_keys = hash_keys(city_df['城市'], city_df['时间'])
+    if pd.Index(official_keys).has_duplicates:
+        print("警告：城市数据存在重复的 城市×月份 记录，按均值合并")
+    official = city_df[variables].groupby(official_keys).mean()
+    position = official.index.get_indexer(means.index)
+    # 末尾追加一行NaN，未匹配的位置（-1）直接取到它
+    official_values = np.vstack([official.to_numpy(dtype=float), np.full((1, len(variables)), np.nan)])[position]
+
+    station_values = means[variables].to_numpy(dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        relative = (station_values - official_values) / official_values
+    n_key, n_var = station_values.shape
+    table = pd.DataFrame({
+        '城市': np.repeat(means['城市'].to_numpy(), n_var),
+        '时间': np.repeat(means['时间'].to_numpy(), n_var),
+        '污染物': np.tile(variables, n_key),
+        '子站数': np.repeat(means['子站数'].to_numpy(), n_var),
+        '子站均值': station_values.ravel(),
+        '官方值': official_values.ravel(),
+        '偏差': (station_values - official_values).ravel(),
+        '相对偏差(%)': relative.ravel() * 100,
+    })
+    return table.sort_values(['城市', '污染物', '时间']).reset_index(drop=True)
+
+
+def flag_discrepancies(table, history=None):
+    """标记差异：相对偏差超过阈值，或偏离该城市该污染物历史相对偏差（中位数±MAD）过远
+
+    history为已对账的历史记录，不提供时以table自身为基准；历史不足MIN_HISTORY个月时只用阈值判断
+    """
+    history = table if history is None else history
+    matched = history.dropna(subset=['相对偏差(%)'])
+    grouped = matched.groupby(['城市', '污染物'])['相对偏差(%)']
+    baseline = pd.DataFrame({'历史中位数': grouped.median(), '历史MAD': grouped.apply(
+        lambda values: (values - values.median()).abs().median() * 1.4826), '历史月数': grouped.size()})
+    table = table.join(baseline, on=['城市', '污染物'])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        robust_z = (table['相对偏差(%)'] - table['历史中位数']) / table['历史MAD']
+    robust_z = robust_z.where(table['历史月数'] >= MIN_HISTORY)
+    too_large = table['相对偏差(%)'].abs() > RELATIVE_THRESHOLD * 100
+    drifted = robust_z.abs() > Z_THRESHOLD
+    table['稳健Z值'] = robust_z
+    table['差异类型'] = np.select([too_large & drifted, too_large, drifted],
+                              ['偏差过大且偏离历史', '相对偏差过大', '偏离历史偏差'], '')
+    return table.drop(columns=['历史中位数', '历史MAD', '历史月数'])
+
+
+def deviation_statistics(table):
+    """各 城市×污染物 的偏差统计：匹配月数、平均偏差、平均绝对偏差、均方根偏差、平均相对偏差、相关系数"""
+    matched = table.dropna(subset=['官方值', '子站均值']).copy()
+    matched['绝对偏差'] = matched['偏差'].abs()
+    matched['偏差平方'] = matched['偏差'] ** 2
+    grouped = matched.groupby(['城市', '污染物'])
+    stats = grouped.agg(匹配月数=('偏差', 'size'), 平均偏差=('偏差', 'mean'), 平均绝对偏差=('绝对偏差', 'mean'),
+                        均方根偏差=('偏差平方', 'mean'), **{'平均相对偏差(%)': ('相对偏差(%)', 'mean')})
+    stats['均方根偏差'] = np.sqrt(stats['均方根偏差'])
+    stats['相关系数'] = grouped.apply(lambda group: group['子站均值'].corr(group['官方值']))
+    return stats.reset_index()
+
+
+def ingest_month(station_month_df, city_month_df, table_path=RECONCILIATION_TABLE,
+                 discrepancy_path=DISCREPANCY_TABLE):
+    """新数据入库时调用：对账新数据，以已保存的对账表为历史基准标记差异，写入对账表与差异记录
+
+    按 城市×时间×污染物 去重：对账表中没有的记录追加；已保存但官方值缺失、现在官方值已到的记录替换原记录
+    """
+    history = pd.read_csv(table_path, encoding='utf-8-sig') if os.path.exists(table_path) else None
+    table = reconcile(station_month_df, city_month_df)
+    filled = np.zeros(len(table), dtype=bool)
+    if history is not None:
+        history = history.drop_duplicates(KEY_COLUMNS, keep='last')
+        position = pd.MultiIndex.from_frame(history[KEY_COLUMNS]).get_indexer(
+            pd.MultiIndex.from_frame(table[KEY_COLUMNS]))
+        saved_official = np.append(history['官方值'].to_numpy(dtype=float), np.nan)[position]
+        filled = (position >= 0) & np.isnan(saved_official) & table['官方值'].notna().to_numpy()
+        keep = (position < 0) | filled
+        history = history.drop(index=history.index[position[filled]])
+        table, filled = table[keep], filled[keep]
+    if table.empty:
+        print("没有新的记录需要对账")
+        return table
+    table = flag_discrepancies(table, history)
+    if filled.any():
+        # 有补到官方值的记录时重写整张对账表
+        pd.concat([history, table], ignore_index=True).sort_values(['城市', '污染物', '时间']).to_csv(
+            table_path, index=False, encoding="utf-8-sig")
+    else:
+        table.to_csv(table_path, mode='a', header=history is None, index=False, encoding="utf-8-sig")
+    flagged = table[table['差异类型'] != '']
+    if not flagged.empty:
+        flagged.to_csv(discrepancy_path, mode='a', header=not os.path.exists(discrepancy_path), index=False,
+                       encoding="utf-8-sig")
+    print(f"✅ 对账{table['时间'].nunique()}个月{len(table)}条记录（补充官方值{filled.sum()}条），标记差异{len(flagged)}条")
+    return flagged
+
+
+if __name__ == "__main__":
+    station_data = load_station_data()
+    city_data = load_city_data()
+    if station_data is not None and city_data is not None:
+        table = flag_discrepancies(reconcile(station_data, city_data))
+        matched = table['官方值'].notna()
+        print(f"对账记录{len(table)}条，其中{matched.sum()}条与官方城市数据匹配")
+        table.to_csv(RECONCILIATION_TABLE, index=False, encoding="utf-8-sig")
+        table[table['差异类型'] != ''].to_csv(DISCREPANCY_TABLE, index=False, encoding="utf-8-sig")
+        deviation_statistics(table).to_csv("城市子站偏差统计.csv", index=False, encoding="utf-8-sig")
+        print(f"✅ 对账结果保存成功：{RECONCILIATION_TABLE}、{DISCREPANCY_TABLE}"
+              f"（{(table['差异类型'] != '').sum()}条差异）、城市子站偏差统计.csv")
@@ -0,0 +1,162 @@
+import numpy as np
+import pandas as pd
+from station_cube import load_station_cube, normalize_city_name, POLLUTANTS
+
+BASELINE = "基准"
+ALL_CITIES = "全部"
+
+# HJ 633-2012 空气质量分指数分段：IAQI断点与各污染物浓度限值（μg/m3；O3为8小时平均，其余为24小时平均）
+# 月均浓度代入日均限值计算，作为月度空气质量类别的近似
+IAQI_BREAKPOINTS = [0, 50, 100, 150, 200, 300, 400, 500]
+CONCENTRATION_BREAKPOINTS = {
+    "SO2": [0, 50, 150, 475, 800, 1600, 2100, 2620],
+    "NO2": [0, 40, 80, 180, 280, 565, 750, 940],
+    "O3": [0, 100, 160, 215, 265, 800],
+    "CO_μg/m3": [0, 2000, 4000, 14000, 24000, 36000, 48000, 60000],
+    "PM10": [0, 50, 150, 250, 350, 420, 500, 600],
+    "PM2.5": [0, 35, 75, 115, 150, 250, 350, 500],
+}
+AQI_CATEGORIES = ["优", "良", "轻度污染", "中度污染", "重度污染", "严重污染"]
+AQI_UPPER_BOUNDS = [50, 100, 150, 200, 300]
+
+
+def individual_aqi(concentration, pollutant):
+    """分段线性插值计算空气质量分指数，超出最高限值时取最高分指数"""
+    limits = CONCENTRATION_BREAKPOINTS[pollutant]
+    return np.interp(concentration, limits, IAQI_BREAKPOINTS[:len(limits)])
+
+
+def aqi_category(aqi):
+    """AQI数值转类别编号（0=优 … 5=严重污染），缺测为-1"""
+    codes = np.digitize(aqi, AQI_UPPER_BOUNDS, right=True)
+    return np.where(np.isfinite(aqi), codes, -1)
+
+
+def parse_scenarios(scenarios, cities, pollutants):
+    """把情景定义转为缩放系数张量 (情景, 城市, 污染物)
+
+    scenarios: {情景名: {城市: {污染物: 系数}}}，城市写"全部"表示所有城市，城市名称"东莞市"/"东莞"均可；
+    系数为排放情景下浓度与现状的比值，如NO2下降10%写0.9。未提及的城市与污染物系数为1
+    """
+    city_index = {normalize_city_name(city): i for i, city in enumerate(cities)}
+    factors = np.ones((len(scenarios), len(cities), len(pollutants)))
+    for s, (name, spec) in enumerate(scenarios.items()):
+        for city, changes in spec.items():
+            key = normalize_city_name(city)
+            if key == ALL_CITIES:
+                rows = slice(None)
+            elif key in city_index:
+                rows = city_index[key]
+            else:
+                raise ValueError(f"情景“{name}”中的城市{city}不在数据中")
+            for pollutant, factor in changes.items():
+                if pollutant not in pollutants:
+                    raise ValueError(f"情景“{name}”中的污染物{pollutant}不在{pollutants}中")
+                factors[s, rows, pollutants.index(pollutant)] *= factor
+    return factors
+
+
+class ScenarioSimulator:
+    """减排情景模拟：对子站立方体按城市×污染物缩放浓度，重新计算综合污染指数与AQI类别
+
+    综合污染指数沿用 add_fields_with_minmaxscaler 的定义（各年份MinMaxScaler标准化后六项求和），
+    情景下保持现状年份的标准化参数不变，因此指数变化量是浓度变化量的线性函数：
+        Δ指数 = Σ_p (系数_p - 1) × 浓度_p / (最大值_p,年 - 最小值_p,年)
+    基准量在构造时一次算好，每批情景只需一次einsum
+    """
+
+    def __init__(self, cube, pollutants=POLLUTANTS):
+        self.cube = cube
+        self.pollutants = list(pollutants)
+        self.values = np.stack([cube.get(pollutant) for pollutant in self.pollutants], axis=2)
+        self.city_names = list(dict.fromkeys(normalize_city_name(city) for city in cube.cities))
+        self.city_codes = np.array([self.city_names.index(normalize_city_name(city)) for city in cube.cities])
+
+        # 各年份的MinMaxScaler参数，展开到月份轴：(月份, 污染物)
+        years = cube.years
+        low = np.empty((len(cube.months), len(self.pollutants)))
+        span = np.empty_like(low)
+        for year in np.unique(years):
+            in_year = years == year
+            block = self.values[:, in_year, :]
+            low[in_year] = np.nanmin(block, axis=(0, 1))
+            span[in_year] = np.nanmax(block, axis=(0, 1)) - low[in_year]
+        self.low = low
+        self.inverse_span = np.where(span > 0, 1 / np.where(span > 0, span, 1), 0)
+        self.baseline_index = ((self.values - low) * self.inverse_span).sum(axis=2)
+        self.baseline_index[~np.isfinite(self.values).all(axis=2)] = np.nan
+
+    def simulate(self, scenarios):
+        """一次计算全部情景（第一个情景固定为基准），返回字典：
+        names、factors (情景, 城市, 污染物)、index/aqi/category (情景, 子站, 月份)、primary 首要污染物编号
+        """
+        names = [BASELINE] + list(scenarios)
+        factors = np.concatenate([np.ones((1, len(self.city_names), len(self.pollutants))),
+                                  parse_scenarios(scenarios, self.city_names, self.pollutants)])
+        station_factors = factors[:, self.city_codes, :]
+
+        delta = np.einsum('sep,emp,mp->sem', station_factors - 1, self.values, self.inverse_span)
+        index = self.baseline_index[np.newaxis] + delta
+
+        scaled = station_factors[:, :, np.newaxis, :] * self.values[np.newaxis]
+        iaqi = np.stack([individual_aqi(scaled[..., p], pollutant) for p, pollutant in enumerate(self.pollutants)],
+                        axis=-1)
+        observed = np.isfinite(scaled).all(axis=-1)
+        aqi = np.where(observed, np.nanmax(np.where(np.isfinite(iaqi), iaqi, -np.inf), axis=-1), np.nan)
+        primary = np.where(observed, np.argmax(np.nan_to_num(iaqi, nan=-1), axis=-1), -1)
+        return {'names': names, 'factors': factors, 'index': index, 'aqi': aqi, 'category': aqi_category(aqi),
+                'primary': primary}
+
+    def summary(self, result):
+        """情景 × 城市 汇总表：平均综合污染指数及较基准变化、平均AQI、各AQI类别月数、优良月份占比"""
+        n_scenario = len(result['names'])
+        n_city = len(self.city_names)
+        # 城市指示矩阵 (子站, 城市)，按城市求和与计数都用矩阵乘法完成
+        member = (self.city_codes[:, np.newaxis] == np.arange(n_city)[np.newaxis, :]).astype(float)
+
+        def city_mean(array):
+            observed = np.isfinite(array)
+            total = np.einsum('sem,ec->sc', np.where(observed, array, 0), member)
+            count = np.einsum('sem,ec->sc', observed.astype(float), member)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                return total / count, count
+
+        index_mean, _ = city_mean(result['index'])
+        aqi_mean, n_months = city_mean(result['aqi'])
+        one_hot = result['category'][..., np.newaxis] == np.arange(len(AQI_CATEGORIES))
+        category_counts = np.einsum('semk,ec->sck', one_hot.astype(float), member)
+
+        df = pd.DataFrame({
+            '情景': np.repeat(result['names'], n_city),
+            '城市': np.tile(self.city_names, n_scenario),
+            '综合污染指数': index_mean.ravel(),
+            '指数变化(%)': ((index_mean / index_mean[0] - 1) * 100).ravel(),
+            'AQI': aqi_mean.ravel(),
+        })
+        for k, category in enumerate(AQI_CATEGORIES):
+            df[f'{category}月数'] = category_counts[:, :, k].ravel().astype(int)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            df['优良月份占比(%)'] = (category_counts[:, :, :2].sum(axis=2) / n_months * 100).ravel()
+        return df
+
+    def level_distribution(self, result):
+        """各情景全域AQI类别分布（子站-月份数），行为情景、列为类别"""
+        counts = np.stack([(result['category'] == k).sum(axis=(1, 2)) for k in range(len(AQI_CATEGORIES))], axis=1)
+        return pd.DataFrame(counts, index=pd.Index(result['names'], name='情景'), columns=AQI_CATEGORIES)
+
+
+if __name__ == "__main__":
+    station_cube = load_station_cube()
+    if station_cube is not None:
+        simulator = ScenarioSimulator(station_cube)
+        scenarios = {
+            "佛山东莞NO2下降10%": {"佛山": {"NO2": 0.9}, "东莞": {"NO2": 0.9}},
+            "全域PM2.5下降10%": {ALL_CITIES: {"PM2.5": 0.9}},
+            "全域颗粒物下降20%": {ALL_CITIES: {"PM2.5": 0.8, "PM10": 0.8}},
+            "全域O3前体物协同减排": {ALL_CITIES: {"NO2": 0.85, "O3": 0.9}},
+        }
+        result = simulator.simulate(scenarios)
+        summary = simulator.summary(result)
+        summary.to_csv("减排情景模拟结果.csv", index=False, encoding="utf-8-sig")
+        print("✅ 情景模拟结果保存成功：减排情景模拟结果.csv")
+        print(simulator.level_distribution(result).to_string())
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+from station_cube import load_station_cube, load_city_cube, load_cache, save_cache, SEASON_ORDER, MONTH_SEASON
+
+PERIOD = 12
+
+
+def _trend_weights(period=PERIOD):
+    """中心化移动平均权重；偶数周期使用2×period移动平均（两端各取半权）"""
+    if period % 2 == 0:
+        weights = np.ones(period + 1)
+        weights[[0, -1]] = 0.5
+    else:
+        weights = np.ones(period)
+    return weights / period
+
+
+def decompose_batch(series, months, period=PERIOD):
+    """对多条月度序列同时做经典加法分解：序列 = 趋势 + 季节 + 残差
+
+    series: (n_series, T)，缺测为NaN；months: 长度T的月份编号(1-12)
+    趋势为中心化移动平均（窗口内有缺测或位于序列两端时为NaN），
+    季节项为各月去趋势值的平均并中心化为零均值，全部通过矩阵运算一次完成
+    返回字典：trend, seasonal, resid 均为 (n_series, T)，seasonal_index 为 (n_series, 12)
+    """
+    series = np.asarray(series, dtype=float)
+    months = np.asarray(months)
+    n_series, n_time = series.shape
+    weights = _trend_weights(period)
+    half = len(weights) // 2
+    valid = np.isfinite(series)
+
+    # 移动平均：滑动窗口视图与权重向量做一次矩阵乘法
+    trend = np.full(series.shape, np.nan)
+    if n_time >= len(weights):
+        windows = sliding_window_view(np.where(valid, series, 0), len(weights), axis=1)
+        complete = sliding_window_view(valid, len(weights), axis=1).all(axis=2)
+        trend[:, half:n_time - half] = np.where(complete, windows @ weights, np.nan)
+
+    # 各月平均的去趋势值：与 (T, 12) 月份指示矩阵相乘得到各月求和与计数
+    detrended = series - trend
+    observed = np.isfinite(detrended)
+    indicator = (months[:, np.newaxis] == np.arange(1, 13)[np.newaxis, :]).astype(float)
+    totals = np.where(observed, detrended, 0) @ indicator
+    counts = observed.astype(float) @ indicator
+    with np.errstate(invalid='ignore', divide='ignore'):
+        seasonal_index = totals / counts
+    seasonal_index = seasonal_index - np.nanmean(seasonal_index, axis=1, keepdims=True)
+
+    seasonal = seasonal_index[:, months - 1]
+    resid = series - trend - seasonal
+    return {'trend': trend, 'seasonal': seasonal, 'resid': resid, 'seasonal_index': seasonal_index}
+
+
+def seasonal_strength(seasonal, resid):
+    """季节性强度 F_s = max(0, 1 - Var(残差) / Var(季节 + 残差))，越接近1季节性越明显"""
+    both = np.isfinite(seasonal) & np.isfinite(resid)
+    resid_var = np.nanvar(np.where(both, resid, np.nan), axis=-1)
+    total_var = np.nanvar(np.where(both, seasonal + resid, np.nan), axis=-1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.clip(1 - resid_var / total_var, 0, 1)
+
+
+def run_decomposition(cube, period=PERIOD, use_cache=True):
+    """分解立方体中全部 实体×变量 序列，结果按数据版本缓存
+
+    返回字典：trend/seasonal/resid 为 (实体, 月份, 变量)，seasonal_index 为 (实体, 12, 变量)，
+    level 为各序列趋势均值，strength 为季节性强度，均为 (实体, 变量)
+    """
+    cache_name = f"decomposition_p{period}"
+    if use_cache:
+        cached = load_cache(cache_name, cube.version)
+        if cached is not None:
+            print(f"✅ 读取季节分解缓存：{cache_name}_{cube.version}")
+            return cached
+
+    n_entity, n_month, n_var = cube.shape
+    series = np.moveaxis(cube.values, 2, 1).reshape(n_entity * n_var, n_month)
+    result = decompose_batch(series, cube.month_numbers, period)
+    result['level'] = np.nanmean(result['trend'], axis=1)
+    result['strength'] = seasonal_strength(result['seasonal'], result['resid'])
+
+    for key in ('trend', 'seasonal', 'resid', 'seasonal_index'):
+        result[key] = np.moveaxis(result[key].reshape(n_entity, n_var, -1), 1, 2)
+    for key in ('level', 'strength'):
+        result[key] = result[key].reshape(n_entity, n_var)
+
+    save_cache(cache_name, cube.version, **result)
+    return result
+
+
+def season_profile(cube, result):
+    """季节平均剖面：趋势均值 + 季节内各月季节项的平均，返回 (实体, 4, 变量)
+
+    由分解结果计算，不受数据末年只覆盖部分月份的影响
+    """
+    month_seasons = np.array([MONTH_SEASON[m] for m in range(1, 13)])
+    seasonal_means = np.stack([np.nanmean(result['seasonal_index'][:, month_seasons == season, :], axis=1)
+                               for season in SEASON_ORDER], axis=1)
+    return result['level'][:, np.newaxis, :] + seasonal_means
+
+
+def decomposition_to_frame(cube, result):
+    """将分解结果整理为长表：每行一个 实体×月份×变量"""
+    n_entity, n_month, n_var = cube.shape
+    return pd.DataFrame({
+        '实体': np.repeat(cube.entities, n_month * n_var),
+        '城市': np.repeat(cube.cities, n_month * n_var),
+        '时间': np.tile(np.repeat(cube.months, n_var), n_entity),
+        '变量': np.tile(cube.variables, n_entity * n_month),
+        '观测值': cube.values.ravel(),
+        '趋势项': result['trend'].ravel(),
+        '季节项': result['seasonal'].ravel(),
+        '残差项': result['resid'].ravel(),
+    })
+
+
+def save_decomposition(df, output_path):
+    df.to_csv(output_path, index=False, encoding="utf-8-sig")
+    print(f"✅ 季节分解结果保存成功：{output_path}")
+    print(f"数据规模：{df.shape[0]}行 × {df.shape[1]}列")
+
+
+if __name__ == "__main__":
+    station_cube = load_station_cube()
+    if station_cube is not None:
+        save_decomposition(decomposition_to_frame(station_cube, run_decomposition(station_cube)),
+                           "子站污染物季节分解结果.csv")
+
+    city_cube = load_city_cube()
+    if city_cube is not None:
+        save_decomposition(decomposition_to_frame(city_cube, run_decomposition(city_cube)),
+                           "城市污染物季节分解结果.csv")
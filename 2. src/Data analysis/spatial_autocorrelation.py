@@ -0,0 +1,205 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy import sparse
+from scipy.spatial import cKDTree
+from station_cube import (load_station_cube, load_station_coordinates, normalize_station_name, project_to_km,
+                          STATION_INFO_PATH, COORDINATE_PATH)
+
+K_NEIGHBOURS = 4
+N_PERMUTATIONS = 999
+PERMUTATIONS_PER_TASK = 100
+SIGNIFICANCE = 0.05
+SEED = 2024
+# 置换张量 (置换数, 子站数, 子站数) 的元素上限，超过时缩小每块置换数
+MAX_TENSOR = 5e7
+ALL_PERIOD = "全期"
+
+
+def neighbour_weights(lon, lat, k=K_NEIGHBOURS, band_km=None):
+    """KD树构建行标准化的稀疏空间权重矩阵 (CSR)
+
+    band_km为None时取k个最近邻；否则取距离band_km公里以内的全部子站。没有邻居的子站（孤岛）整行为0
+    """
+    lon, lat = np.asarray(lon, dtype=float), np.asarray(lat, dtype=float)
+    n = len(lon)
+    tree = cKDTree(project_to_km(lon, lat, np.deg2rad(lat.mean())))
+    if band_km is None:
+        k = min(k, n - 1)
+        _, index = tree.query(tree.data, k=k + 1)
+        rows = np.repeat(np.arange(n), k)
+        # 第一列是子站自身
+        weights = sparse.csr_matrix((np.ones(n * k), (rows, index[:, 1:].ravel())), shape=(n, n))
+    else:
+        weights = tree.sparse_distance_matrix(tree, band_km, output_type='coo_matrix').tocsr()
+        weights.setdiag(0)
+        weights.eliminate_zeros()
+        weights.data[:] = 1
+    degree = np.asarray(weights.sum(axis=1)).ravel()
+    if (degree == 0).any():
+        print(f"警告：{(degree == 0).sum()}个子站在{band_km}公里内没有邻居，不参与空间自相关")
+    return sparse.diags(np.where(degree > 0, 1 / np.maximum(degree, 1), 0)) @ weights
+
+
+def standardize_columns(values):
+    """按列（每个 月份×污染物）去均值，缺测位置置0；返回 (z, 有效掩码)"""
+    observed = np.isfinite(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.nanmean(values, axis=0)
+    return np.where(observed, values - mean, 0), observed.astype(float)
+
+
+def moran_global(weights, z, mask):
+    """全部列的全局Moran's I：I = n / S0 × zᵀWz / zᵀz，只统计有观测的子站（S0为有效子站之间的权重和）"""
+    lag = weights @ z
+    s0 = (mask * (weights @ mask)).sum(axis=0)
+    n_valid = mask.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return n_valid / s0 * (z * lag).sum(axis=0) / (z ** 2).sum(axis=0)
+
+
+def moran_local(weights, z, mask):
+    """局部Moran's I (LISA)：I_i = z_i (Wz)_i / m2，m2 = Σz²/n；同时返回空间滞后Wz"""
+    lag = weights @ z
+    with np.errstate(invalid='ignore', divide='ignore'):
+        m2 = (z ** 2).sum(axis=0) / mask.sum(axis=0)
+        return z * lag / m2, lag
+
+
+def _permutation_chunk(task):
+    """工作进程：一块置换，返回全局统计量的置换和、平方和、不小于观测值的次数，以及LISA不小于观测值的次数
+
+    全局I对子站整体做随机置换（掩码随之置换）；LISA做条件置换：子站i自身值不动，
+    其邻居位置依次填入从其余子站中无放回抽取的值
+    """
+    weights, z, mask, observed_global, observed_local, n_perm, seed = task
+    rng = np.random.default_rng(seed)
+    n, n_col = z.shape
+    indptr, indices, data = weights.indptr, weights.indices, weights.data
+    degree = np.diff(indptr)
+    max_degree = max(degree.max(), 1)
+    # 每个子站的邻居权重补齐为 (子站, 最大邻居数)
+    slot = np.arange(max_degree)[np.newaxis, :] < degree[:, np.newaxis]
+    slot_weight = np.zeros((n, max_degree))
+    slot_weight[slot] = data
+    with np.errstate(invalid='ignore', divide='ignore'):
+        m2 = (z ** 2).sum(axis=0) / mask.sum(axis=0)
+
+    global_sum = np.zeros(n_col)
+    global_square = np.zeros(n_col)
+    global_larger = np.zeros(n_col)
+    local_larger = np.zeros((n, n_col))
+    block = max(1, int(MAX_TENSOR // (n * n)))
+    for start in range(0, n_perm, block):
+        size = min(block, n_perm - start)
+        permutation = np.argsort(rng.random((size, n)), axis=1)
+        for p in range(size):
+            statistic = moran_global(weights, z[permutation[p]], mask[permutation[p]])
+            global_sum += np.nan_to_num(statistic)
+            global_square += np.nan_to_num(statistic) ** 2
+            global_larger += statistic >= observed_global
+
+        # 每行随机排序其余子站，子站自身排到最后，前max_degree个作为邻居样本
+        keys = rng.random((size, n, n))
+        keys[:, np.arange(n), np.arange(n)] = np.inf
+        drawn = np.argsort(keys, axis=2)[:, :, :max_degree]
+        lag = np.einsum('ik,pikc->pic', slot_weight, z[drawn])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            local = z[np.newaxis] * lag / m2
+        local_larger += (local >= observed_local[np.newaxis]).sum(axis=0)
+    return global_sum, global_square, global_larger, local_larger
+
+
+def permutation_inference(weights, z, mask, observed_global, observed_local, n_perm=N_PERMUTATIONS,
+                          per_task=PERMUTATIONS_PER_TASK, workers=None, seed=SEED):
+    """置换检验分块分发到进程池，每块使用独立的随机数子序列；各块只返回计数与累加和，内存与置换次数无关
+
+    返回 (全局I的置换z值, 全局伪p值, LISA伪p值)，伪p值取单侧较小的一侧：(min(≥次数, ≤次数) + 1) / (置换数 + 1)
+    """
+    sizes = [min(per_task, n_perm - start) for start in range(0, n_perm, per_task)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(weights, z, mask, observed_global, observed_local, size, child) for size, child in zip(sizes, seeds)]
+    if len(tasks) == 1 or workers == 1:
+        chunks = [_permutation_chunk(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            chunks = list(pool.map(_permutation_chunk, tasks))
+    global_sum, global_square, global_larger, local_larger = (sum(parts) for parts in zip(*chunks))
+
+    mean = global_sum / n_perm
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z_score = (observed_global - mean) / np.sqrt(global_square / n_perm - mean ** 2)
+    global_p = (np.minimum(global_larger, n_perm - global_larger) + 1) / (n_perm + 1)
+    local_p = (np.minimum(local_larger, n_perm - local_larger) + 1) / (n_perm + 1)
+    return z_score, global_p, local_p
+
+
+def lisa_clusters(z, lag, p_value, significance=SIGNIFICANCE):
+    """LISA聚类类型：高-高、低-低、高-低、低-高，不显著为"不显著" """
+    kind = np.select([(z > 0) & (lag > 0), (z < 0) & (lag < 0), (z > 0) & (lag < 0), (z < 0) & (lag > 0)],
+                     ['高-高', '低-低', '高-低', '低-高'], '不显著')
+    return np.where(p_value < significance, kind, '不显著')
+
+
+def run_spatial_autocorrelation(cube, coords, k=K_NEIGHBOURS, band_km=None, n_perm=N_PERMUTATIONS, workers=None):
+    """对全部 月份×污染物（另加各污染物全期平均）计算全局Moran's I与LISA
+
+    返回 (全局结果表, LISA结果表)
+    """
+    station_keys = [normalize_station_name(name) for name in cube.entities]
+    located = np.array([key in coords.index for key in station_keys])
+    if not located.all():
+        missing = [name for name, ok in zip(cube.entities, located) if not ok]
+        print(f"警告：以下子站缺少坐标，不参与空间自相关：{missing}")
+    station_coords = coords.loc[[key for key, ok in zip(station_keys, located) if ok]]
+    weights = neighbour_weights(station_coords['经度'].to_numpy(), station_coords['纬度'].to_numpy(), k, band_km)
+
+    values = cube.values[located]
+    n_station, n_month, n_var = values.shape
+    with np.errstate(invalid='ignore'):
+        overall = np.nanmean(values, axis=1, keepdims=True)
+    # 列顺序：(月份..., 全期) × 污染物
+    columns = np.concatenate([values, overall], axis=1).reshape(n_station, -1)
+    periods = np.repeat(list(cube.months) + [ALL_PERIOD], n_var)
+    variables = np.tile(cube.variables, n_month + 1)
+
+    z, mask = standardize_columns(columns)
+    moran = moran_global(weights, z, mask)
+    local, lag = moran_local(weights, z, mask)
+    z_score, global_p, local_p = permutation_inference(weights, z, mask, moran, local, n_perm, workers=workers)
+
+    global_table = pd.DataFrame({
+        '污染物': variables,
+        '时间': periods,
+        "Moran's I": moran,
+        '期望值': -1 / (mask.sum(axis=0) - 1),
+        'Z值': z_score,
+        'p值': global_p,
+        '有效子站数': mask.sum(axis=0).astype(int),
+    })
+    entities = np.asarray(cube.entities)[located]
+    n_col = columns.shape[1]
+    lisa_table = pd.DataFrame({
+        '监测子站名称': np.repeat(entities, n_col),
+        '城市': np.repeat(cube.cities[located], n_col),
+        '污染物': np.tile(variables, n_station),
+        '时间': np.tile(periods, n_station),
+        '局部I': local.ravel(),
+        '空间滞后': lag.ravel(),
+        'p值': local_p.ravel(),
+        '聚类类型': lisa_clusters(z, lag, local_p).ravel(),
+    })
+    lisa_table = lisa_table[mask.ravel() > 0].reset_index(drop=True)
+    return global_table, lisa_table
+
+
+if __name__ == "__main__":
+    station_cube = load_station_cube()
+    coords = load_station_coordinates(STATION_INFO_PATH, COORDINATE_PATH)
+    if station_cube is not None and coords is not None:
+        global_table, lisa_table = run_spatial_autocorrelation(station_cube, coords)
+        global_table.to_csv("子站全局Moran指数.csv", index=False, encoding="utf-8-sig")
+        lisa_table.to_csv("子站LISA聚类结果.csv", index=False, encoding="utf-8-sig")
+        overall = global_table[global_table['时间'] == ALL_PERIOD]
+        print(overall[['污染物', "Moran's I", 'Z值', 'p值']].round(3).to_string(index=False))
+        print("✅ 空间自相关结果保存成功：子站全局Moran指数.csv、子站LISA聚类结果.csv")
@@ -0,0 +1,223 @@
+import numpy as np
+import pandas as pd
+from station_cube import (load_station_cube, load_station_info, normalize_station_name, load_cache, save_cache,
+                          POLLUTANTS, SEASON_ORDER, YEARS, STATION_INFO_PATH)
+
+# add_fields_with_minmaxscaler 生成的标准化字段
+PROFILE_VARIABLES = [f"{pollutant}_标准化" for pollutant in POLLUTANTS]
+N_CLUSTERS = 3
+# 子站数超过该值时改用mini-batch k-means
+MINIBATCH_THRESHOLD = 2000
+STATE_NAME = "station_clusters"
+
+
+def squared_distances(X, centroids):
+    """(n, k) 平方欧氏距离矩阵：||x||² - 2x·c + ||c||²，一次矩阵乘法完成"""
+    distances = (X ** 2).sum(axis=1)[:, np.newaxis] - 2 * X @ centroids.T + (centroids ** 2).sum(axis=1)
+    return np.maximum(distances, 0)
+
+
+def kmeans_plus_plus(X, k, rng):
+    """k-means++ 初始化"""
+    centroids = [X[rng.integers(len(X))]]
+    closest = squared_distances(X, centroids[0][np.newaxis, :])[:, 0]
+    for _ in range(1, k):
+        probabilities = closest / closest.sum() if closest.sum() > 0 else None
+        centroids.append(X[rng.choice(len(X), p=probabilities)])
+        closest = np.minimum(closest, squared_distances(X, centroids[-1][np.newaxis, :])[:, 0])
+    return np.array(centroids)
+
+
+def kmeans(X, k, init=None, max_iter=100, tol=1e-6, seed=42):
+    """向量化Lloyd迭代；init给定时从该质心热启动
+
+    返回 (centroids, labels, inertia, 迭代次数)
+    """
+    rng = np.random.default_rng(seed)
+    centroids = kmeans_plus_plus(X, k, rng) if init is None else np.array(init, dtype=float)
+    for iteration in range(1, max_iter + 1):
+        labels = squared_distances(X, centroids).argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, X)
+        # 空簇保留原质心
+        updated = np.where(counts[:, np.newaxis] > 0, sums / np.maximum(counts, 1)[:, np.newaxis], centroids)
+        shift = ((updated - centroids) ** 2).sum()
+        centroids = updated
+        if shift <= tol:
+            break
+    distances = squared_distances(X, centroids)
+    labels = distances.argmin(axis=1)
+    return centroids, labels, distances[np.arange(len(X)), labels].sum(), iteration
+
+
+def minibatch_kmeans(X, k, init=None, batch_size=1024, n_iter=100, seed=42):
+    """mini-batch k-means：每步只用一个随机小批量更新质心，学习率为各质心累计样本数的倒数"""
+    rng = np.random.default_rng(seed)
+    centroids = kmeans_plus_plus(X, k, rng) if init is None else np.array(init, dtype=float)
+    seen = np.zeros(k)
+    for _ in range(n_iter):
+        batch = X[rng.choice(len(X), size=min(batch_size, len(X)), replace=False)]
+        labels = squared_distances(batch, centroids).argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, batch)
+        seen += counts
+        rate = np.where(seen > 0, counts / np.maximum(seen, 1), 0)[:, np.newaxis]
+        centroids = (1 - rate) * centroids + rate * sums / np.maximum(counts, 1)[:, np.newaxis]
+    distances = squared_distances(X, centroids)
+    labels = distances.argmin(axis=1)
+    return centroids, labels, distances[np.arange(len(X)), labels].sum(), n_iter
+
+
+class StationProfileClustering:
+    """按 季节×污染物 标准化剖面对子站聚类，支持新增月份后的增量更新
+
+    每个子站保存各季节各污染物的累计和与观测数（充分统计量），并记录每个子站已统计过的月份，
+    新数据到来时只累加各子站尚未统计的 子站×月份（新增子站的历史月份也会补齐），
+    剖面更新后以上一次的质心热启动k-means，聚类编号在更新前后保持一致
+    """
+
+    def __init__(self, n_clusters=N_CLUSTERS, seed=42):
+        self.n_clusters = n_clusters
+        self.seed = seed
+        self.stations = []
+        self.cities = np.array([], dtype=str)
+        self.months = []
+        # (子站, 月份) 是否已累加进充分统计量
+        self.seen = np.zeros((0, 0), dtype=bool)
+        self.sums = np.zeros((0, len(SEASON_ORDER), len(PROFILE_VARIABLES)))
+        self.counts = np.zeros_like(self.sums)
+        self.centroids = None
+        self.labels = None
+        self.inertia = np.nan
+
+    def _accumulate(self, cube):
+        """把立方体中各子站尚未统计过的有观测月份累加进充分统计量，新子站、新月份追加到末尾
+
+        返回新累加的 子站×月份 数
+        """
+        new_stations = [name for name in cube.entities if name not in self.stations]
+        if new_stations:
+            self.stations += new_stations
+            new_cities = cube.cities[[cube.entities.index(name) for name in new_stations]].astype(str)
+            self.cities = np.concatenate([self.cities, new_cities])
+            padding = np.zeros((len(new_stations),) + self.sums.shape[1:])
+            self.sums = np.concatenate([self.sums, padding])
+            self.counts = np.concatenate([self.counts, padding])
+            self.seen = np.vstack([self.seen, np.zeros((len(new_stations), self.seen.shape[1]), dtype=bool)])
+        new_months = [month for month in cube.months if month not in self.months]
+        if new_months:
+            self.months += new_months
+            self.seen = np.hstack([self.seen, np.zeros((len(self.stations), len(new_months)), dtype=bool)])
+
+        rows = [self.stations.index(name) for name in cube.entities]
+        columns = [self.months.index(month) for month in cube.months]
+        observed = np.isfinite(cube.values)
+        # 只累加有观测且尚未统计过的 子站×月份；全部缺测的月份不标记，日后补录的数据仍会被统计
+        pending = observed.any(axis=2) & ~self.seen[np.ix_(rows, columns)]
+        if not pending.any():
+            return 0
+        observed &= pending[:, :, np.newaxis]
+        # (月份, 季节) 指示矩阵：一次矩阵乘法得到各季节的求和与计数
+        indicator = (cube.seasons[:, np.newaxis] == np.array(SEASON_ORDER)[np.newaxis, :]).astype(float)
+        self.sums[rows] += np.einsum('smv,mq->sqv', np.where(observed, cube.values, 0), indicator)
+        self.counts[rows] += np.einsum('smv,mq->sqv', observed.astype(float), indicator)
+        self.seen[np.ix_(rows, columns)] |= pending
+        return int(pending.sum())
+
+    def profiles(self):
+        """(子站数, 4×6) 特征矩阵；某季节无观测时用全部子站的均值填补"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            profile = (self.sums / self.counts).reshape(len(self.stations), -1)
+        column_mean = np.nanmean(profile, axis=0)
+        return np.where(np.isfinite(profile), profile, np.nan_to_num(column_mean))
+
+    def update(self, cube):
+        """增量更新：累加新的 子站×月份 后从当前质心热启动聚类；首次调用时用k-means++初始化"""
+        n_new = self._accumulate(cube)
+        if n_new == 0 and self.labels is not None and len(self.labels) == len(self.stations):
+            print("没有新增的子站月份，聚类结果保持不变")
+            return self
+        X = self.profiles()
+        fit = minibatch_kmeans if len(X) > MINIBATCH_THRESHOLD else kmeans
+        self.centroids, self.labels, self.inertia, n_iter = fit(X, self.n_clusters, init=self.centroids,
+                                                                seed=self.seed)
+        print(f"✅ 子站聚类完成：新增{n_new}个子站月份，{len(X)}个子站，迭代{n_iter}次，簇内平方和{self.inertia:.3f}")
+        return self
+
+    def to_frame(self):
+        """聚类结果表，以规范化子站名称为索引，可直接与监测子站资料.xlsx关联"""
+        X = self.profiles()
+        distances = np.sqrt(squared_distances(X, self.centroids))
+        df = pd.DataFrame({
+            '监测子站名称': self.stations,
+            '城市': self.cities,
+            '聚类': self.labels,
+            '到质心距离': distances[np.arange(len(X)), self.labels],
+        }, index=pd.Index([normalize_station_name(name) for name in self.stations], name='站点键'))
+        return df
+
+    def centroid_frame(self):
+        """各簇质心的 季节×污染物 剖面"""
+        columns = pd.MultiIndex.from_product([SEASON_ORDER, POLLUTANTS], names=['季节', '污染物'])
+        return pd.DataFrame(self.centroids, columns=columns).rename_axis('聚类')
+
+    def save(self):
+        return save_cache(STATE_NAME, f"k{self.n_clusters}", stations=np.array(self.stations, dtype=str),
+                          cities=self.cities, months=np.array(self.months, dtype=str), seen=self.seen, sums=self.sums,
+                          counts=self.counts, centroids=self.centroids, labels=self.labels)
+
+    @classmethod
+    def load(cls, n_clusters=N_CLUSTERS, seed=42):
+        """读取上次保存的聚类状态，不存在（或是没有逐子站月份记录的旧状态）时返回空的聚类器；
+        新增子站由 update 补齐其全部历史月份
+        """
+        model = cls(n_clusters, seed)
+        state = load_cache(STATE_NAME, f"k{n_clusters}")
+        if state is not None and 'seen' in state:
+            model.stations = state['stations'].tolist()
+            model.cities = state['cities']
+            model.months = state['months'].tolist()
+            model.seen = state['seen']
+            model.sums = state['sums']
+            model.counts = state['counts']
+            model.centroids = state['centroids']
+            model.labels = state['labels']
+            print(f"✅ 读取聚类状态：已统计{len(model.months)}个月，{len(model.stations)}个子站"
+                  f"（{int(model.seen.sum())}个子站月份）")
+        return model
+
+
+def join_station_info(clusters, info_path=STATION_INFO_PATH):
+    """按规范化子站名称关联子站属性（地址、地区类别、采样高度等）"""
+    station_info = load_station_info(info_path)
+    if station_info is None:
+        return clusters
+    joined = clusters.join(station_info, how='left')
+    missing = joined['监测子站'].isna().sum()
+    if missing:
+        print(f"警告：{missing}个子站在子站资料中没有匹配记录")
+    return joined
+
+
+def cluster_stations(data_dir=".", years=YEARS, n_clusters=N_CLUSTERS, info_path=STATION_INFO_PATH,
+                     incremental=True):
+    """读取子站标准化数据并聚类；incremental=True时在已保存状态的基础上只处理新增的子站月份（含新增子站的全部历史）"""
+    cube = load_station_cube(data_dir, years, variables=PROFILE_VARIABLES)
+    if cube is None:
+        return None
+    model = StationProfileClustering.load(n_clusters) if incremental else StationProfileClustering(n_clusters)
+    model.update(cube)
+    model.save()
+    return model, join_station_info(model.to_frame(), info_path)
+
+
+if __name__ == "__main__":
+    clustered = cluster_stations()
+    if clustered is not None:
+        model, result = clustered
+        result.to_csv("子站污染剖面聚类结果.csv", encoding="utf-8-sig")
+        model.centroid_frame().to_csv("子站污染剖面聚类质心.csv", encoding="utf-8-sig")
+        print("✅ 聚类结果保存成功：子站污染剖面聚类结果.csv")
+        print(result.groupby('聚类')['监测子站名称'].apply(list))
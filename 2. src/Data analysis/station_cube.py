@@ -0,0 +1,254 @@
+import os
+import re
+import hashlib
+import unicodedata
+import numpy as np
+import pandas as pd
+
+YEARS = [2021, 2022, 2023, 2024]
+# 子站六种污染物（CO统一使用μg/m3，与综合污染指数的标准化字段一致）
+POLLUTANTS = ["SO2", "NO2", "O3", "CO_μg/m3", "PM10", "PM2.5"]
+CITY_METRICS = ["PM2.5", "PM10", "AQI达标率"]
+SEASON_ORDER = ['春季', '夏季', '秋季', '冬季']
+MONTH_SEASON = {
+    1: "冬季", 2: "冬季", 3: "春季",
+    4: "春季", 5: "春季", 6: "夏季",
+    7: "夏季", 8: "夏季", 9: "秋季",
+    10: "秋季", 11: "秋季", 12: "冬季"
+}
+CACHE_DIR = "cache"
+STATION_INFO_PATH = "监测子站资料.xlsx"
+# 监测子站资料.xlsx没有经纬度字段时，从该文件读取坐标（列：监测子站、经度、纬度）
+COORDINATE_PATH = "监测子站坐标.csv"
+KM_PER_DEG_LAT = 110.57
+KM_PER_DEG_LON = 111.32
+
+
+def get_season(month):
+    return MONTH_SEASON[int(month)]
+
+
+def normalize_station_name(name):
+    """统一子站名称写法（NFKC规范化：全角括号转半角、兼容汉字转标准汉字；去除空白），用于关联预处理数据与监测子站资料.xlsx"""
+    return re.sub(r"\s+", "", unicodedata.normalize("NFKC", str(name)))
+
+
+def normalize_city_name(name):
+    """统一城市名称写法：城市级数据为"东莞市"，子站数据为"东莞"，统一去掉"市"后缀"""
+    name = re.sub(r"\s+", "", unicodedata.normalize("NFKC", str(name)))
+    return name[:-1] if name.endswith("市") else name
+
+
+def load_station_info(info_path=STATION_INFO_PATH):
+    """读取子站属性表，以规范化后的子站名称为索引"""
+    try:
+        station_info = pd.read_excel(info_path)
+    except FileNotFoundError:
+        print("警告：子站属性文件未找到")
+        return None
+    station_info.index = station_info['监测子站'].map(normalize_station_name).rename('站点键')
+    return station_info
+
+
+def load_station_coordinates(info_path=STATION_INFO_PATH, coords_path=COORDINATE_PATH):
+    """读取子站经纬度，索引为规范化后的子站名称"""
+    station_info = load_station_info(info_path)
+    if station_info is not None and {'经度', '纬度'} <= set(station_info.columns):
+        coords = station_info[['经度', '纬度']]
+    else:
+        try:
+            coords = pd.read_csv(coords_path, encoding='utf-8-sig')
+        except FileNotFoundError:
+            print(f"❌ 子站资料中没有经纬度字段，且未找到坐标文件{coords_path}（需包含 监测子站、经度、纬度 三列）")
+            return None
+        coords.index = coords['监测子站'].map(normalize_station_name).rename('站点键')
+        coords = coords[['经度', '纬度']]
+    return coords.dropna().astype(float)
+
+
+def project_to_km(lon, lat, lat0):
+    """经纬度近似换算为平面公里坐标，保证KD树按实际距离查找近邻；lat0为参考纬度（弧度）"""
+    return np.column_stack([lon * KM_PER_DEG_LON * np.cos(lat0), lat * KM_PER_DEG_LAT])
+
+
+def _read_yearly_csv(data_dir, pattern, years, label):
+    df_list = []
+    for year in years:
+        path = os.path.join(data_dir, pattern.format(year=year))
+        try:
+            df = pd.read_csv(path, encoding='utf-8-sig')
+        except FileNotFoundError:
+            print(f"警告：{year}年{label}文件未找到")
+            continue
+        df['年份'] = year
+        # 各年份预处理脚本生成的时间字段都以2021开头，这里按文件年份重建真实的年月
+        df['月份'] = df['时间'].str.split('-').str[1].astype(int)
+        df['时间'] = df['年份'].astype(str) + '-' + df['月份'].astype(str).str.zfill(2)
+        if '季节' not in df.columns:
+            df['季节'] = df['月份'].map(MONTH_SEASON)
+        df_list.append(df)
+
+    if not df_list:
+        print(f"错误：没有找到任何{label}文件")
+        return None
+    return pd.concat(df_list, ignore_index=True)
+
+
+def load_city_data(data_dir=".", years=YEARS):
+    """读取所有年份的城市级预处理数据"""
+    return _read_yearly_csv(data_dir, "珠三角9市大气污染数据_{year}预处理后.csv", years, "城市数据")
+
+
+def load_station_data(data_dir=".", years=YEARS):
+    """读取所有年份的子站级预处理数据"""
+    return _read_yearly_csv(data_dir, "六种污染物浓度_{year}预处理后.csv", years, "子站数据")
+
+
+class StationCube:
+    """站点 × 月份 × 变量 的三维数值立方体，缺失的站点-月份为NaN
+
+    entities为站点（或城市）名称，cities为每个站点所属城市，months为'YYYY-MM'字符串
+    """
+
+    def __init__(self, values, entities, cities, months, variables):
+        # 保证单块连续内存，宽表、长表视图都直接reshape这块缓冲区
+        self.values = np.ascontiguousarray(values, dtype=float)
+        self.entities = list(entities)
+        self.cities = np.asarray(cities)
+        self.months = list(months)
+        self.variables = list(variables)
+        self._version = None
+        self._coverage = None
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def years(self):
+        return np.array([int(m[:4]) for m in self.months])
+
+    @property
+    def month_numbers(self):
+        return np.array([int(m[5:7]) for m in self.months])
+
+    @property
+    def seasons(self):
+        return np.array([MONTH_SEASON[m] for m in self.month_numbers])
+
+    @property
+    def coverage(self):
+        """有效观测掩码 (站点, 月份, 变量)，只计算一次供下游复用"""
+        if self._coverage is None:
+            self._coverage = np.isfinite(self.values)
+        return self._coverage
+
+    @property
+    def version(self):
+        """数据版本：数值与标签的哈希，用于缓存失效判断"""
+        if self._version is None:
+            digest = hashlib.sha1(np.ascontiguousarray(self.values).tobytes())
+            for labels in (self.entities, self.months, self.variables):
+                digest.update("|".join(map(str, labels)).encode('utf-8'))
+            self._version = digest.hexdigest()[:16]
+        return self._version
+
+    def variable_index(self, variable):
+        return self.variables.index(variable)
+
+    def get(self, variable):
+        """返回单个变量的 (站点, 月份) 矩阵视图"""
+        return self.values[:, :, self.variable_index(variable)]
+
+    def wide_view(self):
+        """宽表视图（save_data写出的逐污染物列格式）：每行一个 站点×月份，每列一个变量，与values共享内存"""
+        index = pd.MultiIndex.from_product([self.entities, self.months], names=['实体', '时间'])
+        return pd.DataFrame(self.values.reshape(-1, len(self.variables)), index=index, columns=self.variables,
+                            copy=False)
+
+    def long_view(self):
+        """长表视图（污染物作为列值）：每行一个 站点×月份×变量，与values共享内存，无需melt"""
+        index = pd.MultiIndex.from_product([self.entities, self.months, self.variables],
+                                           names=['实体', '时间', '污染物'])
+        return pd.Series(self.values.reshape(-1), index=index, name='数值', copy=False)
+
+    def entity_time(self, variable):
+        """站点 × 月份 矩阵视图，带行列标签，无需pivot"""
+        return pd.DataFrame(self.get(variable), index=pd.Index(self.entities, name='实体'),
+                            columns=pd.Index(self.months, name='时间'), copy=False)
+
+    def period_labels(self, period):
+        """各月所属时期标签与时期顺序：'年份季节'如"2021年春季"，'季节'按SEASON_ORDER，'年份'按年份"""
+        if period == '年份季节':
+            labels = np.char.add(np.char.add(self.years.astype(str), '年'), self.seasons.astype(str))
+            order = [f"{year}年{season}" for year in np.unique(self.years) for season in SEASON_ORDER]
+        elif period == '季节':
+            labels, order = self.seasons, list(SEASON_ORDER)
+        elif period == '年份':
+            labels, order = self.years, list(np.unique(self.years))
+        else:
+            raise ValueError(f"未知的时期类型：{period}")
+        return labels, [label for label in order if label in set(labels.tolist())]
+
+    def period_matrix(self, variable, period='年份季节', years=None):
+        """时期 × 站点 均值矩阵，等价于 groupby([站点, 时期]).mean() 再 pivot，
+        通过 (月份, 时期) 指示矩阵一次矩阵乘法得到；years给定时只使用这些年份的月份
+        """
+        labels, order = self.period_labels(period)
+        selected = np.ones(len(self.months), dtype=bool) if years is None else np.isin(self.years, years)
+        order = [label for label in order if label in set(labels[selected].tolist())]
+        indicator = ((labels[:, np.newaxis] == np.array(order, dtype=labels.dtype)[np.newaxis, :])
+                     & selected[:, np.newaxis]).astype(float)
+        matrix = self.get(variable)
+        observed = self.coverage[:, :, self.variable_index(variable)]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = (np.where(observed, matrix, 0) @ indicator) / (observed.astype(float) @ indicator)
+        return pd.DataFrame(means.T, index=pd.Index(order, name=period), columns=pd.Index(self.entities, name='实体'))
+
+
+def build_cube(df, entity_col, variables, city_col='城市'):
+    """将长表（每行一个实体-月份）整理为StationCube，月份轴补齐为连续月份"""
+    months = pd.period_range(df['时间'].min(), df['时间'].max(), freq='M').strftime('%Y-%m')
+    entities = np.sort(df[entity_col].unique())
+    grouped = df.groupby([entity_col, '时间'])[variables].mean()
+    full_index = pd.MultiIndex.from_product([entities, months], names=[entity_col, '时间'])
+    values = grouped.reindex(full_index).to_numpy(dtype=float)
+    values = values.reshape(len(entities), len(months), len(variables))
+    cities = df.groupby(entity_col)[city_col].first().reindex(entities).to_numpy()
+    return StationCube(values, entities, cities, months, variables)
+
+
+def load_station_cube(data_dir=".", years=YEARS, variables=POLLUTANTS):
+    """读取子站数据并构建 子站 × 月份 × 污染物 立方体"""
+    station_data = load_station_data(data_dir, years)
+    if station_data is None:
+        return None
+    return build_cube(station_data, '监测子站名称', variables)
+
+
+def load_city_cube(data_dir=".", years=YEARS, variables=CITY_METRICS):
+    """读取城市数据并构建 城市 × 月份 × 指标 立方体"""
+    city_data = load_city_data(data_dir, years)
+    if city_data is None:
+        return None
+    return build_cube(city_data, '城市', variables)
+
+
+def cache_path(name, version, cache_dir=CACHE_DIR):
+    return os.path.join(cache_dir, f"{name}_{version}.npz")
+
+
+def load_cache(name, version, cache_dir=CACHE_DIR):
+    """读取缓存结果，不存在时返回None"""
+    path = cache_path(name, version, cache_dir)
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as cached:
+        return {key: cached[key] for key in cached.files}
+
+
+def save_cache(name, version, cache_dir=CACHE_DIR, **arrays):
+    os.makedirs(cache_dir, exist_ok=True)
+    path = cache_path(name, version, cache_dir)
+    np.savez_compressed(path, **arrays)
+    return path
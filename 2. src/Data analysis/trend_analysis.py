@@ -0,0 +1,154 @@
+import warnings
+import numpy as np
+import pandas as pd
+from scipy.stats import norm
+from station_cube import load_station_cube, load_city_cube, load_cache, save_cache
+
+# 每批成对差值张量 (批大小, T, T) 的内存上限
+MAX_CHUNK_BYTES = 64 * 1024 ** 2
+ALPHA = 0.05
+
+
+def _pair_mask(months, seasonal):
+    """参与比较的时间点对 (i<j)；seasonal=True时只比较同一月份（季节性Kendall检验）"""
+    n_time = len(months)
+    mask = np.triu(np.ones((n_time, n_time), dtype=bool), k=1)
+    if seasonal:
+        mask &= months[:, np.newaxis] == months[np.newaxis, :]
+    return mask
+
+
+def mann_kendall_batch(series, time_index, months=None, seasonal=False, max_chunk_bytes=MAX_CHUNK_BYTES):
+    """对多条时间序列同时做Mann-Kendall检验和Sen斜率估计
+
+    series: (n_series, T)，缺测为NaN；time_index: 长度T的时间坐标（如月序号）
+    数据按批构造 (批大小, T, T) 成对差值张量，内存占用由max_chunk_bytes限制
+    返回字典：n, S, var_S, Z, p, slope（每单位time_index的Sen斜率）
+    """
+    series = np.asarray(series, dtype=float)
+    time_index = np.asarray(time_index, dtype=float)
+    n_series, n_time = series.shape
+    if months is None:
+        months = np.zeros(n_time, dtype=int)
+    months = np.asarray(months)
+    pairs = _pair_mask(months, seasonal)
+    dt = time_index[np.newaxis, :] - time_index[:, np.newaxis]
+    season_ids = np.unique(months)
+
+    result = {key: np.full(n_series, np.nan) for key in ('n', 'S', 'var_S', 'Z', 'p', 'slope')}
+    chunk_size = max(1, int(max_chunk_bytes // (n_time * n_time * 8 * 3)))
+
+    for start in range(0, n_series, chunk_size):
+        block = series[start:start + chunk_size]
+        valid = np.isfinite(block)
+        # diff[b, i, j] = x_j - x_i
+        diff = block[:, np.newaxis, :] - block[:, :, np.newaxis]
+        pair_valid = pairs & valid[:, :, np.newaxis] & valid[:, np.newaxis, :]
+        S = np.where(pair_valid, np.sign(np.nan_to_num(diff)), 0).sum(axis=(1, 2))
+
+        # 方差按季节（不分季节时只有一组）分别计算后求和，含结值修正：
+        # 每个观测所在结组的大小t_i由同组内相等值的个数得到，Σ_i (t_i-1)(2t_i+5) 即 Σ_组 t(t-1)(2t+5)
+        var_S = np.zeros(len(block))
+        n_valid = valid.sum(axis=1)
+        for season in season_ids:
+            in_season = months == season
+            sub = block[:, in_season]
+            sub_valid = valid[:, in_season]
+            n = sub_valid.sum(axis=1)
+            equal = (sub[:, :, np.newaxis] == sub[:, np.newaxis, :]) & sub_valid[:, :, np.newaxis]
+            tie_size = np.where(sub_valid, equal.sum(axis=2), 0)
+            tie_term = ((tie_size - 1) * (2 * tie_size + 5) * sub_valid).sum(axis=1)
+            var_S += (n * (n - 1) * (2 * n + 5) - tie_term) / 18
+
+        with np.errstate(invalid='ignore', divide='ignore'), warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            Z = np.where(var_S > 0, (S - np.sign(S)) / np.sqrt(var_S), 0.0)
+            slopes = np.where(pair_valid, diff / dt, np.nan)
+            slope = np.nanmedian(slopes.reshape(len(block), -1), axis=1)
+
+        stop = start + len(block)
+        result['n'][start:stop] = n_valid
+        result['S'][start:stop] = S
+        result['var_S'][start:stop] = var_S
+        result['Z'][start:stop] = Z
+        result['p'][start:stop] = 2 * norm.sf(np.abs(Z))
+        result['slope'][start:stop] = slope
+    return result
+
+
+def run_trend_tests(cube, seasonal=True, use_cache=True):
+    """对立方体中所有 实体×变量 序列做趋势检验，结果按数据版本缓存
+
+    返回字典，每个值为 (实体数, 变量数) 矩阵；Sen斜率换算为每年变化量
+    """
+    cache_name = f"trend_{'seasonal' if seasonal else 'plain'}"
+    if use_cache:
+        cached = load_cache(cache_name, cube.version)
+        if cached is not None:
+            print(f"✅ 读取趋势检验缓存：{cache_name}_{cube.version}")
+            return cached
+
+    n_entity, n_month, n_var = cube.shape
+    series = np.moveaxis(cube.values, 2, 1).reshape(n_entity * n_var, n_month)
+    month_index = np.arange(n_month)
+    result = mann_kendall_batch(series, month_index, months=cube.month_numbers, seasonal=seasonal)
+    result = {key: value.reshape(n_entity, n_var) for key, value in result.items()}
+    result['slope'] = result['slope'] * 12
+
+    save_cache(cache_name, cube.version, **result)
+    return result
+
+
+def trends_to_frame(cube, result, alpha=ALPHA):
+    """将趋势检验结果整理为长表：每行一个 实体×污染物"""
+    n_entity, _, n_var = cube.shape
+    df = pd.DataFrame({
+        '实体': np.repeat(cube.entities, n_var),
+        '城市': np.repeat(cube.cities, n_var),
+        '污染物': np.tile(cube.variables, n_entity),
+        '有效月数': result['n'].ravel().astype(int),
+        'S': result['S'].ravel(),
+        'Z': result['Z'].ravel(),
+        'p值': result['p'].ravel(),
+        'Sen斜率(每年)': result['slope'].ravel(),
+    })
+    significant = df['p值'] < alpha
+    df['趋势'] = np.select([significant & (df['Z'] > 0), significant & (df['Z'] < 0)],
+                         ['显著上升', '显著下降'], default='无显著趋势')
+    return df
+
+
+def significance_marker(p_value):
+    """图表标注用的显著性符号"""
+    if p_value < 0.001:
+        return '***'
+    elif p_value < 0.01:
+        return '**'
+    elif p_value < 0.05:
+        return '*'
+    return ''
+
+
+def trend_labels(cube, result, variable, scale=1):
+    """图例标签 {实体: "实体 (Sen斜率/年 显著性符号)"}，scale用于单位换算（如达标率×100换算为百分点）"""
+    v = cube.variable_index(variable)
+    return {entity: f"{entity} ({result['slope'][e, v] * scale:+.1f}/年{significance_marker(result['p'][e, v])})"
+            for e, entity in enumerate(cube.entities)}
+
+
+def save_trend_results(df, output_path):
+    df.to_csv(output_path, index=False, encoding="utf-8-sig")
+    print(f"✅ 趋势检验结果保存成功：{output_path}")
+    print(f"数据规模：{df.shape[0]}行 × {df.shape[1]}列，显著趋势{(df['趋势'] != '无显著趋势').sum()}条")
+
+
+if __name__ == "__main__":
+    station_cube = load_station_cube()
+    if station_cube is not None:
+        station_trends = trends_to_frame(station_cube, run_trend_tests(station_cube))
+        save_trend_results(station_trends, "子站污染物趋势检验结果.csv")
+
+    city_cube = load_city_cube()
+    if city_cube is not None:
+        city_trends = trends_to_frame(city_cube, run_trend_tests(city_cube))
+        save_trend_results(city_trends, "城市污染物趋势检验结果.csv")
@@ -2,9 +2,19 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
+import os
+import sys
+from batch_drawing import plot_lines_batched, bar_batched
 import warnings
 warnings.filterwarnings('ignore')
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data analysis'))
+from station_cube import load_city_data, load_station_data, build_cube, CITY_METRICS, SEASON_ORDER
+from seasonal_decomposition import run_decomposition, season_profile
+from bootstrap_ci import improvement_rate_ci
+from annual_aggregation import annual_frame, partial_year_note, report_coverage
+from trend_analysis import run_trend_tests, trend_labels
+
 import matplotlib as mpl
 # 设置字体：英文用Times New Roman，中文用微软雅黑
 mpl.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'DejaVu Sans', 'Arial Unicode MS', 'SimSun']
@@ -20,88 +30,36 @@ print("大气污染可视化分析")
 
 def plot_annual_trend_city_level():
     """绘制城市级别数据的年际变化趋势 - 单独输出每个子图"""
-    # 读取所有年份的数据
-    years = [2021, 2022, 2023, 2024]
-    city_data_list = []
-    
-    for year in years:
-        try:
-            df = pd.read_csv(f"珠三角9市大气污染数据_{year}预处理后.csv", encoding='utf-8-sig')
-            df['年份'] = year
-            
-            # 确保每个文件都有季节列
-            if '季节' not in df.columns:
-                print(f"在{year}年数据中重新生成季节列...")
-                df['月份'] = df['时间'].str.split('-').str[1].astype(int)
-                
-                def get_season(month):
-                    if month in [12, 1, 2]:
-                        return '冬季'
-                    elif month in [3, 4, 5]:
-                        return '春季'
-                    elif month in [6, 7, 8]:
-                        return '夏季'
-                    else:
-                        return '秋季'
-                
-                df['季节'] = df['月份'].apply(get_season)
-            
-            city_data_list.append(df)
-            print(f"成功读取{year}年数据，共{len(df)}行")
-            
-        except FileNotFoundError:
-            print(f"警告：{year}年数据文件未找到")
-            continue
-        except Exception as e:
-            print(f"读取{year}年数据时出错：{e}")
-            continue
-    
-    if not city_data_list:
-        print("错误：没有找到任何数据文件")
-        return None
-    
-    # 合并所有数据
-    city_data = pd.concat(city_data_list, ignore_index=True)
+    # 读取所有年份的数据（统一重建真实年月并补齐季节列），年均值立方体直接由这张表构建，不再重复读取CSV
+    city_data = load_city_data()
+    if city_data is None:
+        return None, None
     print(f"合并后总数据量：{len(city_data)}行")
     
-    # 确保季节列存在
-    if '季节' not in city_data.columns:
-        print("在合并数据中重新生成季节列...")
-        city_data['月份'] = city_data['时间'].str.split('-').str[1].astype(int)
-        
-        def get_season(month):
-            if month in [12, 1, 2]:
-                return '冬季'
-            elif month in [3, 4, 5]:
-                return '春季'
-            elif month in [6, 7, 8]:
-                return '夏季'
-            else:
-                return '秋季'
-        
-        city_data['季节'] = city_data['月份'].apply(get_season)
-    
     # 计算年度平均值
-    annual_avg = city_data.groupby(['城市', '年份']).agg({
-        'PM2.5': 'mean',
-        'PM10': 'mean', 
-        'AQI达标率': 'mean'
-    }).reset_index()
+    # 年均值由聚合层统一计算：缺测显式统计，覆盖不足12个月的年份（2024年仅1-6月）按季节调整估算
+    city_cube = build_cube(city_data, '城市', CITY_METRICS)
+    report_coverage(city_cube, "城市数据")
+    annual_avg = annual_frame(city_cube)[['城市', '年份', 'PM2.5', 'PM10', 'AQI达标率']]
+    year_note = partial_year_note(city_cube)
+    # 图例附季节性Mann-Kendall检验的Sen斜率与显著性
+    trends = run_trend_tests(city_cube)
+    legend_title = 'Sen斜率/年  *p<0.05 **p<0.01 ***p<0.001'
     
     # 创建专业的颜色方案
     colors = plt.cm.Set3(np.linspace(0, 1, len(annual_avg['城市'].unique())))
     
     # 1. PM2.5年际变化 - 单独图表
     plt.figure(figsize=(14, 8), facecolor='white')
-    for i, city in enumerate(annual_avg['城市'].unique()):
-        city_data_plot = annual_avg[annual_avg['城市'] == city]
-        plt.plot(city_data_plot['年份'], city_data_plot['PM2.5'], 
-                marker='o', linewidth=3, markersize=8, label=city, color=colors[i])
+    annual_pivot = annual_avg.pivot(index='城市', columns='年份', values='PM2.5')
+    labels = trend_labels(city_cube, trends, 'PM2.5')
+    handles = plot_lines_batched(plt.gca(), annual_pivot.columns, annual_pivot.values, colors,
+                                 labels=[labels[city] for city in annual_pivot.index], marker='o', linewidth=3, markersize=8)
     
-    plt.title('珠三角9市PM2.5浓度年际变化趋势 (2021-2024)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
+    plt.title(f'珠三角9市PM2.5浓度年际变化趋势 (2021-2024{year_note})', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
     plt.xlabel('年份', fontsize=14, fontname='Microsoft YaHei')
     plt.ylabel('PM2.5浓度 (μg/m³)', fontsize=14, fontname='Microsoft YaHei')
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10})
+    plt.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10}, title=legend_title)
     plt.grid(False)  # 移除网格线
     plt.xticks([2021, 2022, 2023, 2024], fontsize=12)
     plt.yticks(fontsize=12)
@@ -111,15 +69,15 @@ def plot_annual_trend_city_level():
     
     # 2. PM10年际变化 - 单独图表
     plt.figure(figsize=(14, 8), facecolor='white')
-    for i, city in enumerate(annual_avg['城市'].unique()):
-        city_data_plot = annual_avg[annual_avg['城市'] == city]
-        plt.plot(city_data_plot['年份'], city_data_plot['PM10'], 
-                marker='s', linewidth=3, markersize=8, label=city, color=colors[i])
+    annual_pivot = annual_avg.pivot(index='城市', columns='年份', values='PM10')
+    labels = trend_labels(city_cube, trends, 'PM10')
+    handles = plot_lines_batched(plt.gca(), annual_pivot.columns, annual_pivot.values, colors,
+                                 labels=[labels[city] for city in annual_pivot.index], marker='s', linewidth=3, markersize=8)
     
-    plt.title('珠三角9市PM10浓度年际变化趋势 (2021-2024)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
+    plt.title(f'珠三角9市PM10浓度年际变化趋势 (2021-2024{year_note})', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
     plt.xlabel('年份', fontsize=14, fontname='Microsoft YaHei')
     plt.ylabel('PM10浓度 (μg/m³)', fontsize=14, fontname='Microsoft YaHei')
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10})
+    plt.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10}, title=legend_title)
     plt.grid(False)  # 移除网格线
     plt.xticks([2021, 2022, 2023, 2024], fontsize=12)
     plt.yticks(fontsize=12)
@@ -129,15 +87,15 @@ def plot_annual_trend_city_level():
     
     # 3. AQI达标率年际变化 - 单独图表
     plt.figure(figsize=(14, 8), facecolor='white')
-    for i, city in enumerate(annual_avg['城市'].unique()):
-        city_data_plot = annual_avg[annual_avg['城市'] == city]
-        plt.plot(city_data_plot['年份'], city_data_plot['AQI达标率']*100, 
-                marker='^', linewidth=3, markersize=8, label=city, color=colors[i])
+    annual_pivot = annual_avg.pivot(index='城市', columns='年份', values='AQI达标率') * 100
+    labels = trend_labels(city_cube, trends, 'AQI达标率', scale=100)
+    handles = plot_lines_batched(plt.gca(), annual_pivot.columns, annual_pivot.values, colors,
+                                 labels=[labels[city] for city in annual_pivot.index], marker='^', linewidth=3, markersize=8)
     
-    plt.title('珠三角9市AQI达标率年际变化趋势 (2021-2024)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
+    plt.title(f'珠三角9市AQI达标率年际变化趋势 (2021-2024{year_note})', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
     plt.xlabel('年份', fontsize=14, fontname='Microsoft YaHei')
     plt.ylabel('AQI达标率 (%)', fontsize=14, fontname='Microsoft YaHei')
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10})
+    plt.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10}, title=legend_title)
     plt.grid(False)  # 移除网格线
     plt.xticks([2021, 2022, 2023, 2024], fontsize=12)
     plt.yticks(fontsize=12)
@@ -146,36 +104,31 @@ def plot_annual_trend_city_level():
     plt.show()
     
     # 4. PM2.5改善率 - 单独图表
-    improvement_data = []
-    for city in annual_avg['城市'].unique():
-        city_years = annual_avg[annual_avg['城市'] == city].sort_values('年份')
-        if len(city_years) >= 2:
-            first_pm25 = city_years.iloc[0]['PM2.5']
-            last_pm25 = city_years.iloc[-1]['PM2.5']
-            improvement_rate = (last_pm25 - first_pm25) / first_pm25 * 100
-            improvement_data.append({'城市': city, 'PM2.5改善率(%)': improvement_rate})
-    
-    if improvement_data:
-        improvement = pd.DataFrame(improvement_data)
+    # 首年只取末年有观测的同期月份（2024年只有1-6月），误差线为自助法95%置信区间
+    # 绘图脚本没有__main__保护，在本进程内计算（spawn启动的子进程会重新执行整个脚本）
+    improvement = improvement_rate_ci(city_cube, 'PM2.5', workers=1)
+    
+    if not improvement.empty:
+        rate = improvement['PM2.5改善率(%)']
+        lower_error = rate - improvement['置信下限']
+        upper_error = improvement['置信上限'] - rate
         plt.figure(figsize=(12, 8), facecolor='white')
-        colors_bar = ['#2E8B57' if x < 0 else '#CD5C5C' for x in improvement['PM2.5改善率(%)']]
-        bars = plt.bar(improvement['城市'], improvement['PM2.5改善率(%)'], 
-                      color=colors_bar, alpha=0.8, edgecolor='black', linewidth=0.5)
+        colors_bar = ['#2E8B57' if x < 0 else '#CD5C5C' for x in rate]
+        # 数值标签放在误差线外侧
+        bar_batched(plt.gca(), improvement['城市'], rate, colors_bar,
+                    fmt='{:.1f}%', offset=upper_error + 0.5, neg_offset=lower_error + 1,
+                    fontsize=10, fontweight='bold', fontname='Microsoft YaHei')
+        plt.errorbar(np.arange(len(improvement)), rate, yerr=[lower_error, upper_error],
+                     fmt='none', ecolor='black', elinewidth=1, capsize=4)
         
-        plt.title('各城市PM2.5浓度改善率 (2021-2024)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
+        cube_years = city_cube.years
+        plt.title(f'各城市PM2.5浓度改善率 ({cube_years.min()}-{cube_years.max()}，同期月份对比，95%置信区间)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
         plt.xlabel('城市', fontsize=14, fontname='Microsoft YaHei')
         plt.ylabel('PM2.5改善率 (%)', fontsize=14, fontname='Microsoft YaHei')
         plt.xticks(rotation=45, fontsize=12, fontname='Microsoft YaHei')
         plt.yticks(fontsize=12)
         plt.grid(False)  # 移除网格线
         
-        # 添加数值标签
-        for bar in bars:
-            height = bar.get_height()
-            plt.text(bar.get_x() + bar.get_width()/2., height + (0.5 if height > 0 else -1),
-                    f'{height:.1f}%', ha='center', va='bottom' if height > 0 else 'top', 
-                    fontsize=10, fontweight='bold', fontname='Microsoft YaHei')
-        
         # 添加零线参考
         plt.axhline(y=0, color='black', linestyle='-', alpha=0.3)
         
@@ -183,10 +136,10 @@ def plot_annual_trend_city_level():
         plt.savefig('PM2.5改善率分析.png', dpi=300, bbox_inches='tight', facecolor='white')
         plt.show()
     
-    return city_data
+    return city_data, city_cube
 
-# 执行城市级别年际趋势分析
-city_data = plot_annual_trend_city_level()
+# 执行城市级别年际趋势分析，城市立方体供后续图表复用
+city_data, city_cube = plot_annual_trend_city_level()
 
 def plot_spatial_distribution():
     """绘制空间分布特征图 - 单独输出每个子图"""
@@ -205,8 +158,9 @@ def plot_spatial_distribution():
     plt.figure(figsize=(14, 8), facecolor='white')
     sorted_pm25 = spatial_avg.sort_values('PM2.5', ascending=False)
     colors_pm25 = plt.cm.RdYlBu_r(np.linspace(0.2, 0.8, len(sorted_pm25)))
-    bars1 = plt.bar(sorted_pm25['城市'], sorted_pm25['PM2.5'], 
-                   color=colors_pm25, alpha=0.8, edgecolor='black', linewidth=0.5)
+    bar_batched(plt.gca(), sorted_pm25['城市'], sorted_pm25['PM2.5'], colors_pm25,
+                fmt='{:.1f}', offset=0.5,
+                fontsize=11, fontweight='bold', fontname='Microsoft YaHei')
     
     plt.title('珠三角9市PM2.5浓度空间分布 (2021-2024年平均)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
     plt.xlabel('城市', fontsize=14, fontname='Microsoft YaHei')
@@ -215,13 +169,6 @@ def plot_spatial_distribution():
     plt.yticks(fontsize=12)
     plt.grid(False)  # 移除网格线
     
-    # 添加数值标签
-    for bar in bars1:
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height + 0.5,
-                f'{height:.1f}', ha='center', va='bottom', 
-                fontsize=11, fontweight='bold', fontname='Microsoft YaHei')
-    
     plt.tight_layout()
     plt.savefig('PM2.5_空间分布.png', dpi=300, bbox_inches='tight', facecolor='white')
     plt.show()
@@ -230,8 +177,9 @@ def plot_spatial_distribution():
     plt.figure(figsize=(14, 8), facecolor='white')
     sorted_pm10 = spatial_avg.sort_values('PM10', ascending=False)
     colors_pm10 = plt.cm.RdYlBu_r(np.linspace(0.2, 0.8, len(sorted_pm10)))
-    bars2 = plt.bar(sorted_pm10['城市'], sorted_pm10['PM10'],
-                   color=colors_pm10, alpha=0.8, edgecolor='black', linewidth=0.5)
+    bar_batched(plt.gca(), sorted_pm10['城市'], sorted_pm10['PM10'], colors_pm10,
+                fmt='{:.1f}', offset=1,
+                fontsize=11, fontweight='bold', fontname='Microsoft YaHei')
     
     plt.title('珠三角9市PM10浓度空间分布 (2021-2024年平均)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
     plt.xlabel('城市', fontsize=14, fontname='Microsoft YaHei')
@@ -240,12 +188,6 @@ def plot_spatial_distribution():
     plt.yticks(fontsize=12)
     plt.grid(False)  # 移除网格线
     
-    for bar in bars2:
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height + 1,
-                f'{height:.1f}', ha='center', va='bottom', 
-                fontsize=11, fontweight='bold', fontname='Microsoft YaHei')
-    
     plt.tight_layout()
     plt.savefig('PM10_空间分布.png', dpi=300, bbox_inches='tight', facecolor='white')
     plt.show()
@@ -254,8 +196,9 @@ def plot_spatial_distribution():
     plt.figure(figsize=(14, 8), facecolor='white')
     sorted_aqi = spatial_avg.sort_values('AQI达标率', ascending=True)
     colors_aqi = plt.cm.RdYlBu_r(np.linspace(0.8, 0.2, len(sorted_aqi)))
-    bars3 = plt.bar(sorted_aqi['城市'], sorted_aqi['AQI达标率']*100,
-                   color=colors_aqi, alpha=0.8, edgecolor='black', linewidth=0.5)
+    bar_batched(plt.gca(), sorted_aqi['城市'], sorted_aqi['AQI达标率']*100, colors_aqi,
+                fmt='{:.1f}%', offset=0.5,
+                fontsize=11, fontweight='bold', fontname='Microsoft YaHei')
     
     plt.title('珠三角9市AQI达标率空间分布 (2021-2024年平均)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
     plt.xlabel('城市', fontsize=14, fontname='Microsoft YaHei')
@@ -264,12 +207,6 @@ def plot_spatial_distribution():
     plt.yticks(fontsize=12)
     plt.grid(False)  # 移除网格线
     
-    for bar in bars3:
-        height = bar.get_height()
-        plt.text(bar.get_x() + bar.get_width()/2., height + 0.5,
-                f'{height:.1f}%', ha='center', va='bottom', 
-                fontsize=11, fontweight='bold', fontname='Microsoft YaHei')
-    
     plt.tight_layout()
     plt.savefig('AQI达标率_空间分布.png', dpi=300, bbox_inches='tight', facecolor='white')
     plt.show()
@@ -277,9 +214,9 @@ def plot_spatial_distribution():
 # 执行空间分布分析
 plot_spatial_distribution()
 
-def plot_seasonal_pattern():
-    """绘制年份季节分布特征图 - 单独输出每个子图"""
-    if city_data is None:
+def plot_seasonal_pattern(city_cube):
+    """绘制年份季节分布特征图 - 单独输出每个子图，city_cube为年际趋势分析中已构建的城市立方体"""
+    if city_data is None or city_cube is None:
         print("没有可用的城市数据")
         return
         
@@ -300,108 +237,97 @@ def plot_seasonal_pattern():
         
         city_data['季节'] = city_data['月份'].apply(get_season)
     
-    # 只使用2021-2023年的数据进行季节分析
-    seasonal_data = city_data[city_data['年份'].isin([2021, 2022, 2023])].copy()
-    
-    # 创建年份季节列
-    seasonal_data['年份季节'] = seasonal_data['年份'].astype(str) + '年' + seasonal_data['季节']
-    
-    # 定义正确的年份季节顺序
-    year_season_order = []
-    for year in [2021, 2022, 2023]:
-        for season in ['春季', '夏季', '秋季', '冬季']:
-            year_season_order.append(f"{year}年{season}")
-    
-    seasonal_data['年份季节'] = pd.Categorical(seasonal_data['年份季节'], categories=year_season_order, ordered=True)
-    
-    # 计算年份季节平均值
-    year_season_avg = seasonal_data.groupby(['城市', '年份季节']).agg({
-        'PM2.5': 'mean',
-        'PM10': 'mean',
-        'AQI达标率': 'mean'
-    }).reset_index()
-    
-    print("年份季节数据统计：")
-    print(f"城市数量：{year_season_avg['城市'].nunique()}")
-    print(f"年份季节类别：{len(year_season_avg['年份季节'].unique())}")
-    print(f"数据时间段：{year_season_avg['年份季节'].min()} 到 {year_season_avg['年份季节'].max()}")
+    # 只使用完整覆盖12个月的年份进行年份季节对比
+    months_per_year = city_data.groupby('年份')['时间'].nunique()
+    full_years = months_per_year[months_per_year == 12].index.tolist()
+    if not full_years:
+        print("没有完整覆盖12个月的年份，跳过年份季节变化图")
+    else:
+        year_span = f"{full_years[0]}-{full_years[-1]}"
+        
+        # 年份季节 × 城市 矩阵由城市立方体按 (月份, 年份季节) 指示矩阵一次求均值，无需groupby+pivot
+        seasonal_pivots = {variable: city_cube.period_matrix(variable, '年份季节', years=full_years)
+                           for variable in ['PM2.5', 'PM10', 'AQI达标率']}
+        year_season_order = list(seasonal_pivots['PM2.5'].index)
+        n_cities = seasonal_pivots['PM2.5'].shape[1]
+
+        print("年份季节数据统计：")
+        print(f"城市数量：{n_cities}")
+        print(f"年份季节类别：{len(year_season_order)}")
+        print(f"数据时间段：{year_season_order[0]} 到 {year_season_order[-1]}")
     
-    # 创建专业的颜色方案
-    colors = plt.cm.Set3(np.linspace(0, 1, len(year_season_avg['城市'].unique())))
+        # 创建专业的颜色方案
+        colors = plt.cm.Set3(np.linspace(0, 1, n_cities))
     
-    # 1. PM2.5年份季节变化 - 单独图表
-    plt.figure(figsize=(16, 8), facecolor='white')
-    seasonal_pivot_pm25 = year_season_avg.pivot(index='年份季节', columns='城市', values='PM2.5')
-    seasonal_pivot_pm25 = seasonal_pivot_pm25.reindex(year_season_order)
+        # 1. PM2.5年份季节变化 - 单独图表
+        plt.figure(figsize=(16, 8), facecolor='white')
+        seasonal_pivot_pm25 = seasonal_pivots['PM2.5']
     
-    for i, city in enumerate(seasonal_pivot_pm25.columns):
-        plt.plot(seasonal_pivot_pm25.index, seasonal_pivot_pm25[city], 
-                marker='o', linewidth=2.5, markersize=6, label=city, color=colors[i])
+        handles = plot_lines_batched(plt.gca(), np.arange(len(year_season_order)), seasonal_pivot_pm25.values.T, colors,
+                                     labels=seasonal_pivot_pm25.columns, marker='o', linewidth=2.5, markersize=6)
     
-    plt.title('珠三角9市PM2.5浓度年份季节变化 (2021-2023年)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
-    plt.xlabel('年份季节', fontsize=14, fontname='Microsoft YaHei')
-    plt.ylabel('PM2.5浓度 (μg/m³)', fontsize=14, fontname='Microsoft YaHei')
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10})
-    plt.grid(False)  # 移除网格线
+        plt.title(f'珠三角9市PM2.5浓度年份季节变化 ({year_span}年)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
+        plt.xlabel('年份季节', fontsize=14, fontname='Microsoft YaHei')
+        plt.ylabel('PM2.5浓度 (μg/m³)', fontsize=14, fontname='Microsoft YaHei')
+        plt.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10})
+        plt.grid(False)  # 移除网格线
     
-    x_positions = range(len(year_season_order))
-    plt.xticks(x_positions, year_season_order, rotation=45, fontsize=11, fontname='Microsoft YaHei')
-    plt.yticks(fontsize=12)
-    plt.tight_layout()
-    plt.savefig('PM2.5_年份季节变化.png', dpi=300, bbox_inches='tight', facecolor='white')
-    plt.show()
+        x_positions = range(len(year_season_order))
+        plt.xticks(x_positions, year_season_order, rotation=45, fontsize=11, fontname='Microsoft YaHei')
+        plt.yticks(fontsize=12)
+        plt.tight_layout()
+        plt.savefig('PM2.5_年份季节变化.png', dpi=300, bbox_inches='tight', facecolor='white')
+        plt.show()
     
-    # 2. PM10年份季节变化 - 单独图表
-    plt.figure(figsize=(16, 8), facecolor='white')
-    seasonal_pivot_pm10 = year_season_avg.pivot(index='年份季节', columns='城市', values='PM10')
-    seasonal_pivot_pm10 = seasonal_pivot_pm10.reindex(year_season_order)
+        # 2. PM10年份季节变化 - 单独图表
+        plt.figure(figsize=(16, 8), facecolor='white')
+        seasonal_pivot_pm10 = seasonal_pivots['PM10']
     
-    for i, city in enumerate(seasonal_pivot_pm10.columns):
-        plt.plot(seasonal_pivot_pm10.index, seasonal_pivot_pm10[city], 
-                marker='s', linewidth=2.5, markersize=6, label=city, color=colors[i])
+        handles = plot_lines_batched(plt.gca(), np.arange(len(year_season_order)), seasonal_pivot_pm10.values.T, colors,
+                                     labels=seasonal_pivot_pm10.columns, marker='s', linewidth=2.5, markersize=6)
     
-    plt.title('珠三角9市PM10浓度年份季节变化 (2021-2023年)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
-    plt.xlabel('年份季节', fontsize=14, fontname='Microsoft YaHei')
-    plt.ylabel('PM10浓度 (μg/m³)', fontsize=14, fontname='Microsoft YaHei')
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10})
-    plt.grid(False)  # 移除网格线
+        plt.title(f'珠三角9市PM10浓度年份季节变化 ({year_span}年)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
+        plt.xlabel('年份季节', fontsize=14, fontname='Microsoft YaHei')
+        plt.ylabel('PM10浓度 (μg/m³)', fontsize=14, fontname='Microsoft YaHei')
+        plt.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10})
+        plt.grid(False)  # 移除网格线
     
-    plt.xticks(x_positions, year_season_order, rotation=45, fontsize=11, fontname='Microsoft YaHei')
-    plt.yticks(fontsize=12)
-    plt.tight_layout()
-    plt.savefig('PM10_年份季节变化.png', dpi=300, bbox_inches='tight', facecolor='white')
-    plt.show()
+        plt.xticks(x_positions, year_season_order, rotation=45, fontsize=11, fontname='Microsoft YaHei')
+        plt.yticks(fontsize=12)
+        plt.tight_layout()
+        plt.savefig('PM10_年份季节变化.png', dpi=300, bbox_inches='tight', facecolor='white')
+        plt.show()
     
-    # 3. AQI达标率年份季节变化 - 单独图表
-    plt.figure(figsize=(16, 8), facecolor='white')
-    seasonal_pivot_aqi = year_season_avg.pivot(index='年份季节', columns='城市', values='AQI达标率') * 100
-    seasonal_pivot_aqi = seasonal_pivot_aqi.reindex(year_season_order)
+        # 3. AQI达标率年份季节变化 - 单独图表
+        plt.figure(figsize=(16, 8), facecolor='white')
+        seasonal_pivot_aqi = seasonal_pivots['AQI达标率'] * 100
     
-    for i, city in enumerate(seasonal_pivot_aqi.columns):
-        plt.plot(seasonal_pivot_aqi.index, seasonal_pivot_aqi[city], 
-                marker='^', linewidth=2.5, markersize=6, label=city, color=colors[i])
+        handles = plot_lines_batched(plt.gca(), np.arange(len(year_season_order)), seasonal_pivot_aqi.values.T, colors,
+                                     labels=seasonal_pivot_aqi.columns, marker='^', linewidth=2.5, markersize=6)
     
-    plt.title('珠三角9市AQI达标率年份季节变化 (2021-2023年)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
-    plt.xlabel('年份季节', fontsize=14, fontname='Microsoft YaHei')
-    plt.ylabel('AQI达标率 (%)', fontsize=14, fontname='Microsoft YaHei')
-    plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10})
-    plt.grid(False)  # 移除网格线
+        plt.title(f'珠三角9市AQI达标率年份季节变化 ({year_span}年)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
+        plt.xlabel('年份季节', fontsize=14, fontname='Microsoft YaHei')
+        plt.ylabel('AQI达标率 (%)', fontsize=14, fontname='Microsoft YaHei')
+        plt.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10})
+        plt.grid(False)  # 移除网格线
     
-    plt.xticks(x_positions, year_season_order, rotation=45, fontsize=11, fontname='Microsoft YaHei')
-    plt.yticks(fontsize=12)
-    plt.tight_layout()
-    plt.savefig('AQI达标率_年份季节变化.png', dpi=300, bbox_inches='tight', facecolor='white')
-    plt.show()
+        plt.xticks(x_positions, year_season_order, rotation=45, fontsize=11, fontname='Microsoft YaHei')
+        plt.yticks(fontsize=12)
+        plt.tight_layout()
+        plt.savefig('AQI达标率_年份季节变化.png', dpi=300, bbox_inches='tight', facecolor='white')
+        plt.show()
     
     # 4. 污染物浓度季节热力图 - 单独图表
-    season_avg = seasonal_data.groupby('季节').mean(numeric_only=True)
-    season_order = ['春季', '夏季', '秋季', '冬季']
-    season_avg = season_avg.reindex(season_order)
+    # 使用缓存的季节分解结果（趋势均值 + 季节项），全部月份参与且不受末年缺月影响
+    profile = season_profile(city_cube, run_decomposition(city_cube))
+    season_avg = pd.DataFrame(np.nanmean(profile, axis=0), index=SEASON_ORDER, columns=city_cube.variables)
+    season_avg = season_avg[['PM2.5', 'PM10']]
+    season_order = SEASON_ORDER
     
     plt.figure(figsize=(10, 8), facecolor='white')
     im = plt.imshow(season_avg[['PM2.5', 'PM10']].T, cmap='YlOrRd', aspect='auto')
     
-    plt.title('污染物浓度季节热力图 (2021-2023年平均)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
+    plt.title(f'污染物浓度季节热力图 ({city_cube.months[0]}至{city_cube.months[-1]}，季节分解)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
     plt.xticks(range(len(season_order)), season_order, fontsize=12, fontname='Microsoft YaHei')
     plt.yticks(range(2), ['PM2.5', 'PM10'], fontsize=12, fontname='Microsoft YaHei')
     
@@ -421,53 +347,14 @@ def plot_seasonal_pattern():
     plt.show()
 
 # 执行季节分布分析
-plot_seasonal_pattern()
+plot_seasonal_pattern(city_cube)
 
 def analyze_station_data():
     """分析监测子站数据 - 修改为读取所有年份数据"""
-    # 读取所有年份的子站数据
-    years = [2021, 2022, 2023, 2024]
-    station_data_list = []
-    
-    for year in years:
-        try:
-            filename = f"六种污染物浓度_{year}预处理后.csv"
-            df = pd.read_csv(filename, encoding='utf-8-sig')
-            df['年份'] = year
-            
-            # 确保有季节列
-            if '季节' not in df.columns and '时间' in df.columns:
-                print(f"在{year}年子站数据中生成季节列...")
-                df['月份'] = df['时间'].str.split('-').str[1].astype(int)
-                
-                def get_season(month):
-                    if month in [12, 1, 2]:
-                        return '冬季'
-                    elif month in [3, 4, 5]:
-                        return '春季'
-                    elif month in [6, 7, 8]:
-                        return '夏季'
-                    else:
-                        return '秋季'
-                
-                df['季节'] = df['月份'].apply(get_season)
-            
-            station_data_list.append(df)
-            print(f"成功读取{year}年子站数据，共{len(df)}行")
-            
-        except FileNotFoundError:
-            print(f"警告：{year}年子站数据文件未找到")
-            continue
-        except Exception as e:
-            print(f"读取{year}年子站数据时出错：{e}")
-            continue
-    
-    if not station_data_list:
-        print("错误：没有找到任何子站数据文件")
+    # 读取所有年份的子站数据（统一重建真实年月并补齐季节列）
+    station_data = load_station_data()
+    if station_data is None:
         return None
-    
-    # 合并所有年份的子站数据
-    station_data = pd.concat(station_data_list, ignore_index=True)
     print(f"合并后子站数据总量：{len(station_data)}行")
     
     # 读取子站属性
@@ -489,15 +376,11 @@ if station_data is not None:
     def plot_station_annual_trend():
         """绘制子站年际变化趋势 - 单独输出每个污染物"""
         # 计算各年份平均值
-        annual_station_avg = station_data.groupby(['城市', '年份']).agg({
-            'SO2': 'mean',
-            'NO2': 'mean', 
-            'O3': 'mean',
-            'PM10': 'mean',
-            'PM2.5': 'mean',
-            'CO_mg/m3': 'mean',  
-            '综合污染指数': 'mean'
-        }).reset_index()
+        # 先按子站计算（必要时季节调整的）年均值，再对同城市子站取平均
+        station_cube = build_cube(station_data, '监测子站名称', variables=['SO2', 'NO2', 'O3', 'PM10', 'PM2.5', 'CO_mg/m3', '综合污染指数'])
+        report_coverage(station_cube, "子站数据")
+        annual_station_avg = annual_frame(station_cube, group_by_city=True)
+        year_note = partial_year_note(station_cube)
         
         # 使用mathtext格式的污染物名称，确保SO₂、NO₂、O₃在图表标题中正常显示
         pollutants = ['SO2', 'NO2', 'O3', 'PM10', 'PM2.5', 'CO_mg/m3', '综合污染指数']
@@ -509,13 +392,12 @@ if station_data is not None:
         for i, (pollutant, title, marker) in enumerate(zip(pollutants, titles, markers)):
             plt.figure(figsize=(14, 8), facecolor='white')
             
-            for j, city in enumerate(annual_station_avg['城市'].unique()):
-                city_data = annual_station_avg[annual_station_avg['城市'] == city].sort_values('年份')
-                plt.plot(city_data['年份'], city_data[pollutant], 
-                        marker=marker, linewidth=2.5, markersize=7, label=city, color=colors[j])
+            station_pivot = annual_station_avg.pivot(index='城市', columns='年份', values=pollutant)
+            handles = plot_lines_batched(plt.gca(), station_pivot.columns, station_pivot.values, colors,
+                                         labels=station_pivot.index, marker=marker, linewidth=2.5, markersize=7)
             
             # 在标题中使用mathtext格式的污染物名称
-            plt.title(f'监测子站{title}浓度年际变化趋势 (2021-2024)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
+            plt.title(f'监测子站{title}浓度年际变化趋势 (2021-2024{year_note})', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
             plt.xlabel('年份', fontsize=14, fontname='Microsoft YaHei')
             if pollutant in ['PM10', 'PM2.5']:
                 plt.ylabel(f'{title}浓度 (μg/m³)', fontsize=14, fontname='Microsoft YaHei')
@@ -526,7 +408,7 @@ if station_data is not None:
                 plt.ylabel('CO浓度 (mg/m³)', fontsize=14, fontname='Microsoft YaHei')
             else:
                 plt.ylabel('综合污染指数', fontsize=14, fontname='Microsoft YaHei')
-            plt.legend(bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10})
+            plt.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': 'Microsoft YaHei', 'size': 10})
             plt.grid(False)  # 移除网格线
             plt.xticks([2021, 2022, 2023, 2024], fontsize=12)
             plt.yticks(fontsize=12)
@@ -555,8 +437,9 @@ if station_data is not None:
             plt.figure(figsize=(14, 8), facecolor='white')
             sorted_data = city_station_avg.sort_values(pollutant, ascending=False)
             colors = plt.cm.viridis(np.linspace(0.2, 0.8, len(sorted_data)))
-            bars = plt.bar(sorted_data['城市'], sorted_data[pollutant], 
-                          color=colors, alpha=0.8, edgecolor='black', linewidth=0.5)
+            bar_batched(plt.gca(), sorted_data['城市'], sorted_data[pollutant], colors,
+                        fmt='{:.1f}', offset=sorted_data[pollutant].abs() * 0.01,
+                        fontsize=10, fontweight='bold', fontname='Microsoft YaHei')
             
             plt.title(f'各城市监测子站{title}对比 (2021-2024年平均)', fontsize=16, fontweight='bold', fontname='Microsoft YaHei', pad=20)
             plt.xlabel('城市', fontsize=14, fontname='Microsoft YaHei')
@@ -572,11 +455,6 @@ if station_data is not None:
             plt.yticks(fontsize=12)
             plt.grid(False)  # 移除网格线
             
-            for bar in bars:
-                height = bar.get_height()
-                plt.text(bar.get_x() + bar.get_width()/2., height + height*0.01,
-                       f'{height:.1f}', ha='center', va='bottom', fontsize=10, fontweight='bold', fontname='Microsoft YaHei')
-            
             plt.tight_layout()
             safe_pollutant = pollutant.replace('/', '_')
             plt.savefig(f'子站_{safe_pollutant}_空间分布.png', dpi=300, bbox_inches='tight', facecolor='white')
@@ -616,4 +494,4 @@ print("21. 子站_O3_空间分布.png")
 print("22. 子站_PM10_空间分布.png")
 print("23. 子站_PM2.5_空间分布.png")
 print("24. 子站_CO_mg_m3_空间分布.png")  
-print("25. 子站_综合污染指数_空间分布.png")
\ No newline at end of file
+print("25. 子站_综合污染指数_空间分布.png")
\ No newline at end of file
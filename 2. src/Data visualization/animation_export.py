@@ -0,0 +1,182 @@
+import os
+import sys
+import shutil
+import hashlib
+import subprocess
+import numpy as np
+import matplotlib as mpl
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import PolyCollection
+from matplotlib.colors import Normalize
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
+import warnings
+warnings.filterwarnings('ignore')
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data analysis'))
+from station_cube import load_station_cube, load_city_cube, CACHE_DIR
+
+mpl.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'DejaVu Sans', 'Arial Unicode MS', 'SimSun']
+mpl.rcParams['font.family'] = 'sans-serif'
+mpl.rcParams['axes.unicode_minus'] = False
+
+FONT = 'Microsoft YaHei'
+FRAME_CACHE_DIR = os.path.join(CACHE_DIR, 'frames')
+UNITS = {'CO_μg/m3': 'μg/m³', 'AQI达标率': '%', 'PM2.5': 'μg/m³', 'PM10': 'μg/m³',
+         'SO2': 'μg/m³', 'NO2': 'μg/m³', 'O3': 'μg/m³'}
+# 数据中以0~1比例保存、按百分数显示的变量
+PERCENT_VARIABLES = {'AQI达标率'}
+
+
+class FrameRenderer:
+    """逐月柱状图帧渲染器 - 整个动画只创建一个Figure
+
+    坐标轴、刻度、标题等静态内容只绘制一次并保存为背景，每帧恢复背景后仅重绘柱子和月份标签（blit）
+    """
+
+    def __init__(self, spec):
+        labels = spec['labels']
+        self.fig = Figure(figsize=spec['figsize'], dpi=spec['dpi'], facecolor='white')
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        self.y = np.arange(len(labels))
+        self.cmap = mpl.colormaps[spec['cmap']]
+        self.norm = Normalize(vmin=0, vmax=spec['vmax'])
+
+        self.bars = PolyCollection(self._verts(np.zeros(len(labels))), edgecolors='black', linewidths=0.5,
+                                   animated=True)
+        self.ax.add_collection(self.bars)
+        self.ax.set_xlim(0, spec['vmax'] * 1.05)
+        self.ax.set_ylim(len(labels) - 0.4, -0.6)
+        self.ax.set_yticks(self.y)
+        self.ax.set_yticklabels(labels, fontname=FONT)
+        self.ax.set_xlabel(f"{spec['variable']} ({spec['unit']})", fontsize=14, fontname=FONT)
+        self.ax.set_title(spec['title'], fontsize=16, fontweight='bold', fontname=FONT, pad=20)
+        self.label = self.ax.text(0.97, 0.03, '', transform=self.ax.transAxes, ha='right', va='bottom',
+                                  fontsize=22, fontweight='bold', color='gray', animated=True)
+        self.fig.tight_layout()
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+    def _verts(self, values):
+        width = np.nan_to_num(values)
+        top = self.y - 0.4
+        bottom = self.y + 0.4
+        zeros = np.zeros(len(values))
+        return np.stack([np.column_stack([zeros, top]), np.column_stack([width, top]),
+                         np.column_stack([width, bottom]), np.column_stack([zeros, bottom])], axis=1)
+
+    def render(self, values, label):
+        """原地更新柱子顶点、颜色和标签文字，返回 (高, 宽, 4) 的RGBA帧"""
+        self.bars.set_verts(self._verts(values))
+        self.bars.set_facecolor(self.cmap(self.norm(np.nan_to_num(values))))
+        self.label.set_text(label)
+        self.canvas.restore_region(self.background)
+        self.ax.draw_artist(self.bars)
+        self.ax.draw_artist(self.label)
+        return np.asarray(self.canvas.buffer_rgba()).copy()
+
+
+def frame_key(spec, values, label):
+    """帧内容哈希：数值、标签与全部样式参数相同的帧直接复用缓存"""
+    digest = hashlib.sha1(repr(sorted(spec.items())).encode('utf-8'))
+    digest.update(np.ascontiguousarray(values, dtype=float).tobytes())
+    digest.update(label.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _render_chunk(task):
+    """工作进程：为一段连续帧创建一次渲染器，逐帧渲染并写入缓存"""
+    spec, frames = task
+    renderer = FrameRenderer(spec)
+    for values, label, path in frames:
+        Image.fromarray(renderer.render(values, label)).save(path)
+    return len(frames)
+
+
+def _write_gif(paths, output, fps):
+    frames = [Image.open(path).convert('RGB') for path in paths]
+    frames[0].save(output, save_all=True, append_images=frames[1:], duration=int(1000 / fps), loop=0)
+
+
+def _write_mp4(ffmpeg, paths, output, fps):
+    """通过管道把帧写入ffmpeg编码为MP4，返回是否编码成功"""
+    width, height = Image.open(paths[0]).size
+    command = [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgba',
+               '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+               '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', output]
+    with subprocess.Popen(command, stdin=subprocess.PIPE) as process:
+        try:
+            for path in paths:
+                process.stdin.write(np.asarray(Image.open(path).convert('RGBA')).tobytes())
+            process.stdin.close()
+        except OSError:
+            # ffmpeg提前退出（编码器或参数不可用）时管道断开，按编码失败处理
+            process.kill()
+            return False
+        process.wait()
+    return process.returncode == 0
+
+
+def export_animation(variable='PM2.5', level='station', data_dir=".", output=None, fps=2, workers=None,
+                     chunk_size=8, figsize=(12, 8), dpi=100, cmap='YlOrRd'):
+    """导出子站（level='station'）或城市（level='city'）污染物逐月动画，输出为MP4或GIF
+
+    只渲染缓存中不存在的帧；未找到ffmpeg或ffmpeg编码失败时MP4自动改为输出GIF
+    """
+    cube = load_station_cube(data_dir) if level == 'station' else load_city_cube(data_dir)
+    if cube is None:
+        print("❌ 数据不可用，无法导出动画")
+        return None
+    matrix = cube.get(variable) * (100 if variable in PERCENT_VARIABLES else 1)
+
+    # 按全期平均值排序并固定顺序，避免柱子在帧之间跳动
+    order = np.argsort(-np.nan_to_num(np.nanmean(matrix, axis=1)))
+    matrix = matrix[order]
+    level_name = '子站' if level == 'station' else '城市'
+    spec = {
+        'labels': tuple(str(cube.entities[i]).strip() for i in order),
+        'variable': variable,
+        'unit': UNITS.get(variable, ''),
+        'title': f'{level_name}{variable}{"" if variable in PERCENT_VARIABLES else "浓度"}逐月变化 ({cube.months[0]} ~ {cube.months[-1]})',
+        'vmax': float(np.nanmax(matrix)),
+        'figsize': tuple(figsize),
+        'dpi': dpi,
+        'cmap': cmap,
+    }
+
+    os.makedirs(FRAME_CACHE_DIR, exist_ok=True)
+    frames = []
+    for m, month in enumerate(cube.months):
+        values = matrix[:, m]
+        path = os.path.join(FRAME_CACHE_DIR, f"{frame_key(spec, values, month)}.png")
+        frames.append((values, month, path))
+    pending = [frame for frame in frames if not os.path.exists(frame[2])]
+    print(f"共{len(frames)}帧，缓存命中{len(frames) - len(pending)}帧，需渲染{len(pending)}帧")
+
+    if pending:
+        tasks = [(spec, pending[start:start + chunk_size]) for start in range(0, len(pending), chunk_size)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_render_chunk, tasks))
+
+    if output is None:
+        output = f"{level_name}_{variable.replace('/', '_')}_逐月动画.mp4"
+    paths = [frame[2] for frame in frames]
+    if output.endswith('.mp4'):
+        ffmpeg = shutil.which(mpl.rcParams['animation.ffmpeg_path'])
+        if ffmpeg is None:
+            output = output[:-4] + '.gif'
+            print("警告：未找到ffmpeg，改为输出GIF")
+        elif not _write_mp4(ffmpeg, paths, output, fps):
+            output = output[:-4] + '.gif'
+            print("警告：ffmpeg编码MP4失败，改为输出GIF")
+    if output.endswith('.gif'):
+        _write_gif(paths, output, fps)
+    print(f"✅ 动画导出成功：{output}")
+    return output
+
+
+if __name__ == "__main__":
+    export_animation('PM2.5', level='station')
+    export_animation('PM2.5', level='city')
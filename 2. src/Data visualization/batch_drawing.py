@@ -0,0 +1,90 @@
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.lines import Line2D
+
+# 图例条目超过该数量时不再绘制图例（上百个子站的图例本身就无法阅读）
+MAX_LEGEND_ENTRIES = 30
+# 柱子超过该数量时不再逐个添加数值标签，横轴刻度标签也按间隔抽稀
+MAX_BAR_LABELS = 60
+# 标记点总数超过该数量时只画折线（上千条重叠折线上的标记点无法分辨，只会拖慢绘制）
+MAX_MARKERS = 5000
+
+
+def plot_lines_batched(ax, x, values, colors, labels=None, marker='o', linewidth=2.5, markersize=6,
+                       alpha=1.0, max_legend=MAX_LEGEND_ENTRIES, max_markers=MAX_MARKERS):
+    """批量绘制多条折线 - 所有折线合并为一个LineCollection，所有标记点合并为一次scatter
+
+    x: 长度为n_x的横坐标；values: (n_series, n_x) 数值矩阵，缺失值为NaN时折线自动断开
+    返回图例句柄列表（序列数超过max_legend时返回空列表）
+    """
+    x = np.asarray(x, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if values.ndim == 1:
+        values = values[np.newaxis, :]
+    n_series, n_x = values.shape
+    colors = np.asarray(colors)
+    if len(colors) != n_series:
+        colors = colors[np.arange(n_series) % len(colors)]
+
+    # 构造 (n_series, n_x, 2) 的线段顶点数组，一次性交给LineCollection
+    segments = np.empty((n_series, n_x, 2))
+    segments[..., 0] = x
+    segments[..., 1] = values
+    lines = LineCollection(segments, colors=colors, linewidths=linewidth, alpha=alpha, zorder=2)
+    ax.add_collection(lines)
+
+    if marker is not None and n_series * n_x <= max_markers:
+        ax.scatter(np.tile(x, n_series), values.ravel(), c=np.repeat(colors, n_x, axis=0),
+                   marker=marker, s=markersize ** 2, alpha=alpha, zorder=3)
+    ax.autoscale_view()
+
+    handles = []
+    if labels is not None and n_series <= max_legend:
+        # 图例使用不加入坐标轴的代理对象，不参与绘制
+        handle_marker = marker if n_series * n_x <= max_markers else None
+        handles = [Line2D([], [], color=color, marker=handle_marker, linewidth=linewidth, markersize=markersize,
+                          label=label) for label, color in zip(labels, colors)]
+    return handles
+
+
+def bar_batched(ax, labels, heights, colors, width=0.8, alpha=0.8, edgecolor='black', linewidth=0.5,
+                fmt='{:.1f}', offset=0.5, neg_offset=None, max_labels=MAX_BAR_LABELS, **text_kwargs):
+    """批量绘制柱状图 - 所有柱子合并为一个PolyCollection，数值标签位置向量化计算
+
+    只有柱子几何是批量绘制的，数值标签仍为每个柱子一个Text对象，因此柱子超过max_labels时不加标签。
+    offset可以是标量或与heights等长的数组；非正值柱子的标签放在柱子下方，偏移量为neg_offset
+    返回 (PolyCollection, 数值标签列表)
+    """
+    heights = np.asarray(heights, dtype=float)
+    n_bars = len(heights)
+    x = np.arange(n_bars)
+    left = x - width / 2
+    right = x + width / 2
+    zeros = np.zeros(n_bars)
+
+    # 每个柱子是一个四边形：(n_bars, 4, 2)
+    verts = np.stack([
+        np.column_stack([left, zeros]),
+        np.column_stack([left, heights]),
+        np.column_stack([right, heights]),
+        np.column_stack([right, zeros]),
+    ], axis=1)
+    bars = PolyCollection(verts, facecolors=colors, edgecolors=edgecolor, linewidths=linewidth, alpha=alpha)
+    bars.sticky_edges.y.append(0)
+    ax.add_collection(bars)
+    ax.autoscale_view()
+    labels = list(labels)
+    step = int(np.ceil(n_bars / max_labels)) if n_bars > max_labels else 1
+    ax.set_xticks(x[::step])
+    ax.set_xticklabels(labels[::step])
+
+    texts = []
+    if fmt is not None and n_bars <= max_labels:
+        offset = np.asarray(offset, dtype=float)
+        neg_offset = offset if neg_offset is None else np.asarray(neg_offset, dtype=float)
+        positive = heights > 0
+        label_y = np.where(positive, heights + offset, heights - neg_offset)
+        label_va = np.where(positive, 'bottom', 'top')
+        texts = [ax.text(xi, yi, fmt.format(h), ha='center', va=va, **text_kwargs)
+                 for xi, yi, h, va in zip(x, label_y, heights, label_va)]
+    return bars, texts
@@ -0,0 +1,81 @@
+import numpy as np
+from matplotlib.colors import LogNorm
+
+# 每批参与分箱的观测数，限制中间数组的内存占用
+CHUNK_SIZE = 200_000
+
+
+def histogram2d_chunked(x, y, bins=(300, 300), value_range=None, chunk_size=CHUNK_SIZE):
+    """分块计算二维直方图，内存占用只与分箱数和分块大小有关
+
+    x, y 可以是内存映射数组；value_range为 ((xmin, xmax), (ymin, ymax))，缺省时先扫描一遍取范围
+    返回 (counts[n_y, n_x], x_edges, y_edges)，counts行对应y方向，可直接交给imshow
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    n_x, n_y = bins
+    if value_range is None:
+        value_range = ((np.nanmin(x), np.nanmax(x)), (np.nanmin(y), np.nanmax(y)))
+    (x_min, x_max), (y_min, y_max) = value_range
+    x_scale = n_x / ((x_max - x_min) or 1)
+    y_scale = n_y / ((y_max - y_min) or 1)
+
+    counts = np.zeros(n_x * n_y, dtype=np.int64)
+    for start in range(0, len(x), chunk_size):
+        x_block = x[start:start + chunk_size]
+        y_block = y[start:start + chunk_size]
+        valid = np.isfinite(x_block) & np.isfinite(y_block)
+        xi = np.clip(((x_block[valid] - x_min) * x_scale).astype(np.int64), 0, n_x - 1)
+        yi = np.clip(((y_block[valid] - y_min) * y_scale).astype(np.int64), 0, n_y - 1)
+        counts += np.bincount(yi * n_x + xi, minlength=n_x * n_y)
+
+    x_edges = np.linspace(x_min, x_max, n_x + 1)
+    y_edges = np.linspace(y_min, y_max, n_y + 1)
+    return counts.reshape(n_y, n_x), x_edges, y_edges
+
+
+def bin_parallel_segments(data, n_y=200, n_x=60, chunk_size=CHUNK_SIZE // 10):
+    """将平行坐标图中相邻坐标轴之间的线段分箱为密度图像
+
+    data: (n_obs, n_axes)，每列已归一化到[0, 1]；每段在n_x个列位置上对线段插值并计数
+    返回 (n_y, (n_axes - 1) * n_x) 的计数图像
+    """
+    data = np.asarray(data, dtype=float)
+    n_obs, n_axes = data.shape
+    t = np.linspace(0, 1, n_x)
+    column_offset = np.arange(n_x) * n_y
+    image = np.zeros((n_axes - 1, n_x * n_y), dtype=np.int64)
+
+    for start in range(0, n_obs, chunk_size):
+        block = data[start:start + chunk_size]
+        block = block[np.isfinite(block).all(axis=1)]
+        for k in range(n_axes - 1):
+            a = block[:, k, np.newaxis]
+            b = block[:, k + 1, np.newaxis]
+            # (chunk, n_x)：线段在每个列位置上的纵坐标
+            y = a + (b - a) * t
+            yi = np.clip((y * n_y).astype(np.int64), 0, n_y - 1)
+            image[k] += np.bincount((column_offset + yi).ravel(), minlength=n_x * n_y)
+
+    # (n_axes-1, n_x, n_y) -> (n_y, (n_axes-1) * n_x)
+    return image.reshape(n_axes - 1, n_x, n_y).transpose(2, 0, 1).reshape(n_y, -1)
+
+
+def draw_density(ax, counts, extent, cmap='viridis', log=True):
+    """把分箱后的计数图像画到坐标轴上，零计数显示为背景色"""
+    masked = np.ma.masked_equal(counts, 0)
+    norm = LogNorm(vmin=1, vmax=max(masked.max(), 1)) if log and masked.count() else None
+    return ax.imshow(masked, origin='lower', extent=extent, aspect='auto', cmap=cmap, norm=norm,
+                     interpolation='nearest')
+
+
+def draw_parallel_density(ax, image, axis_labels, cmap='viridis', log=True):
+    """绘制平行坐标密度图：密度图像铺满相邻坐标轴之间，再叠加竖直坐标轴"""
+    n_axes = len(axis_labels)
+    mappable = draw_density(ax, image, extent=(0, n_axes - 1, 0, 1), cmap=cmap, log=log)
+    for xi in range(n_axes):
+        ax.axvline(xi, color='black', linewidth=0.8)
+    ax.set_xticks(range(n_axes))
+    ax.set_xticklabels(axis_labels)
+    ax.set_xlim(0, n_axes - 1)
+    return mappable
@@ -0,0 +1,440 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import matplotlib as mpl
+from concurrent.futures import ProcessPoolExecutor
+from batch_drawing import plot_lines_batched
+from density_plots import histogram2d_chunked, bin_parallel_segments, draw_density, draw_parallel_density
+import warnings
+warnings.filterwarnings('ignore')
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data analysis'))
+from station_cube import load_city_data, load_station_data, SEASON_ORDER
+
+# 与Data visualization-2.py保持一致的样式
+mpl.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'DejaVu Sans', 'Arial Unicode MS', 'SimSun']
+mpl.rcParams['font.family'] = 'sans-serif'
+mpl.rcParams['mathtext.fontset'] = 'stix'
+mpl.rcParams['axes.unicode_minus'] = False
+plt.rcParams['axes.facecolor'] = 'white'
+
+FONT = 'Microsoft YaHei'
+DISTRIBUTION_METRICS = {
+    'PM2.5': ('PM2.5浓度 (μg/m³)', '#FF6B6B', 'lightblue'),
+    'PM10': ('PM10浓度 (μg/m³)', '#4ECDC4', 'lightgreen'),
+    'AQI达标率': ('AQI达标率 (%)', '#45B7D1', 'lightcoral'),
+}
+PARALLEL_POLLUTANTS = ['PM2.5', 'PM10', 'SO2', 'NO2', 'O3']
+POLLUTANT_LABELS = {'SO2': 'SO$_2$', 'NO2': 'NO$_2$', 'O3': 'O$_3$', 'CO_mg/m3': 'CO', 'PM10': 'PM10', 'PM2.5': 'PM2.5'}
+KDE_GRID_SIZE = 256
+# 观测级密度图的分箱分辨率（x, y）
+DENSITY_BINS = (200, 200)
+
+
+def kde_on_shared_grid(values, group_codes, n_groups, grid):
+    """在共享网格上一次性计算所有分组的高斯核密度（线性分箱 + FFT卷积）
+
+    带宽按Scott规则逐组计算（与violinplot默认一致），计算量与分组数×网格数成正比，与样本量基本无关
+    返回 (n_groups, len(grid)) 的密度矩阵
+    """
+    n_grid = len(grid)
+    dx = grid[1] - grid[0]
+    position = (values - grid[0]) / dx
+    left = np.clip(np.floor(position).astype(int), 0, n_grid - 2)
+    frac = np.clip(position - left, 0, 1)
+
+    # 线性分箱：每个样本按距离分配到相邻两个网格点，所有分组共用一次bincount
+    flat_index = group_codes * n_grid + left
+    size = n_groups * n_grid
+    counts = (np.bincount(flat_index, weights=1 - frac, minlength=size)
+              + np.bincount(flat_index + 1, weights=frac, minlength=size)).reshape(n_groups, n_grid)
+
+    n = np.bincount(group_codes, minlength=n_groups).astype(float)
+    sums = np.bincount(group_codes, weights=values, minlength=n_groups)
+    sq_sums = np.bincount(group_codes, weights=values ** 2, minlength=n_groups)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(np.maximum(sq_sums / n - (sums / n) ** 2, 0) * n / np.maximum(n - 1, 1))
+        bandwidth = np.maximum(std * n ** (-1 / 5), dx)
+
+    # 补零到两倍长度避免循环卷积首尾相接，高斯核直接使用解析傅里叶变换
+    padded = 2 * n_grid
+    freqs = np.fft.rfftfreq(padded, d=dx)
+    kernel_ft = np.exp(-2 * (np.pi * freqs[np.newaxis, :] * bandwidth[:, np.newaxis]) ** 2)
+    smoothed = np.fft.irfft(np.fft.rfft(counts, n=padded, axis=1) * kernel_ft, n=padded, axis=1)[:, :n_grid]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        density = np.maximum(smoothed, 0) / (n[:, np.newaxis] * dx)
+    return np.nan_to_num(density)
+
+
+def violin_stats(df, group_col, value_col, order):
+    """计算小提琴图所需统计量（ax.violin的vpstats格式），所有分组共用一个KDE网格"""
+    data = df[[group_col, value_col]].dropna()
+    codes = pd.Categorical(data[group_col], categories=order).codes.astype(np.int64)
+    keep = codes >= 0
+    values = data[value_col].to_numpy(dtype=float)[keep]
+    codes = codes[keep]
+
+    grid = np.linspace(values.min(), values.max(), KDE_GRID_SIZE)
+    density = kde_on_shared_grid(values, codes, len(order), grid)
+    grouped = pd.Series(values).groupby(codes)
+    summary = grouped.agg(['mean', 'median', 'min', 'max'])
+
+    stats = []
+    for code in range(len(order)):
+        row = summary.loc[code]
+        # 每组只显示自身取值范围内的密度，与violinplot外观一致
+        inside = (grid >= row['min']) & (grid <= row['max'])
+        stats.append({'coords': grid[inside], 'vals': density[code, inside], 'mean': row['mean'],
+                      'median': row['median'], 'min': row['min'], 'max': row['max']})
+    return stats
+
+
+def box_stats(df, group_col, value_col, order):
+    """向量化计算箱线图统计量（ax.bxp格式）：四分位数、1.5倍IQR须线、离群点、均值"""
+    data = df[[group_col, value_col]].dropna()
+    grouped = data.groupby(group_col)[value_col]
+    quartiles = grouped.quantile([0.25, 0.5, 0.75]).unstack()
+    quartiles.columns = ['q1', 'med', 'q3']
+    quartiles['mean'] = grouped.mean()
+    iqr = quartiles['q3'] - quartiles['q1']
+    quartiles['lo'] = quartiles['q1'] - 1.5 * iqr
+    quartiles['hi'] = quartiles['q3'] + 1.5 * iqr
+
+    bounds = quartiles.loc[data[group_col], ['lo', 'hi']].to_numpy()
+    values = data[value_col].to_numpy()
+    inside = (values >= bounds[:, 0]) & (values <= bounds[:, 1])
+    whiskers = data[inside].groupby(group_col)[value_col].agg(['min', 'max'])
+    fliers = data[~inside].groupby(group_col)[value_col].agg(list)
+
+    stats = []
+    for group in order:
+        row = quartiles.loc[group]
+        stats.append({'label': group, 'q1': row['q1'], 'med': row['med'], 'q3': row['q3'], 'mean': row['mean'],
+                      'whislo': whiskers.loc[group, 'min'], 'whishi': whiskers.loc[group, 'max'],
+                      'fliers': np.asarray(fliers.get(group, []))})
+    return stats
+
+
+def build_aggregates(city_data, station_data=None):
+    """一次性预计算Figures-pt.2全部图表所需的汇总数据，渲染阶段不再访问原始数据"""
+    city_data = city_data.copy()
+    city_data['AQI达标率'] = city_data['AQI达标率'] * 100
+    cities = sorted(city_data['城市'].unique())
+
+    aggregates = {'cities': cities}
+    aggregates['box'] = {metric: box_stats(city_data, '城市', metric, cities) for metric in DISTRIBUTION_METRICS}
+    aggregates['violin'] = {metric: violin_stats(city_data, '季节', metric, SEASON_ORDER)
+                            for metric in DISTRIBUTION_METRICS}
+
+    city_mean = city_data.groupby('城市')[list(DISTRIBUTION_METRICS)].mean().reindex(cities)
+    aggregates['city_mean'] = city_mean
+    annual = city_data.groupby(['城市', '年份'])[list(DISTRIBUTION_METRICS)].mean()
+    aggregates['annual'] = {metric: annual[metric].unstack('年份').reindex(cities) for metric in DISTRIBUTION_METRICS}
+
+    # 季节年际变化只比较完整覆盖四季的年份
+    full_years = city_data.groupby('年份')['季节'].nunique()
+    full_years = full_years[full_years == len(SEASON_ORDER)].index
+    seasonal = city_data[city_data['年份'].isin(full_years)].groupby(['季节', '城市', '年份'])['PM2.5'].mean()
+    aggregates['season_annual'] = {season: seasonal.loc[season].unstack('年份').reindex(cities)
+                                   for season in SEASON_ORDER}
+
+    latest_year = city_data['年份'].max()
+    aggregates['latest_year'] = latest_year
+    aggregates['latest'] = (city_data[city_data['年份'] == latest_year]
+                            .groupby('城市')[['PM2.5', 'PM10']].mean().reindex(cities))
+
+    if station_data is not None:
+        station_mean = station_data.groupby('城市')[PARALLEL_POLLUTANTS].mean()
+        aggregates['composition'] = station_mean.loc[station_mean.sum(axis=1).sort_values(ascending=False).index]
+        span = station_mean.max() - station_mean.min()
+        aggregates['parallel'] = (station_mean - station_mean.min()) / span.replace(0, 1)
+        corr_cols = ['SO2', 'NO2', 'O3', 'PM10', 'PM2.5', 'CO_mg/m3']
+        aggregates['corr'] = station_data[corr_cols].corr()
+
+        # 观测级密度图只保留分箱结果，渲染进程收到的数据量取决于分辨率而不是行数
+        aggregates['scatter_density'] = histogram2d_chunked(station_data['PM2.5'].to_numpy(dtype=float),
+                                                            station_data['PM10'].to_numpy(dtype=float),
+                                                            bins=DENSITY_BINS)
+        observations = station_data[PARALLEL_POLLUTANTS]
+        low, high = observations.min(), observations.max()
+        normalized = (observations - low) / (high - low).replace(0, 1)
+        aggregates['parallel_density'] = bin_parallel_segments(normalized.to_numpy(dtype=float),
+                                                               n_y=DENSITY_BINS[1])
+    return aggregates
+
+
+def _finish(ax, title, xlabel=None, ylabel=None):
+    ax.set_title(title, fontsize=16, fontweight='bold', fontname=FONT, pad=20)
+    if xlabel:
+        ax.set_xlabel(xlabel, fontsize=14, fontname=FONT)
+    if ylabel:
+        ax.set_ylabel(ylabel, fontsize=14, fontname=FONT)
+    ax.grid(False)
+
+
+def plot_box(agg, metric):
+    ylabel, _, box_color = DISTRIBUTION_METRICS[metric]
+    fig, ax = plt.subplots(figsize=(14, 8), facecolor='white')
+    ax.bxp(agg['box'][metric], showmeans=True, patch_artist=True,
+           boxprops={'facecolor': box_color, 'alpha': 0.7}, medianprops={'color': 'red', 'linewidth': 2},
+           whiskerprops={'linestyle': '--'})
+    ax.tick_params(axis='x', rotation=45)
+    _finish(ax, f'各城市{metric}{"分布" if metric == "AQI达标率" else "浓度分布"}箱线图', '城市', ylabel)
+    return fig
+
+
+def plot_violin(agg, metric):
+    ylabel, color, _ = DISTRIBUTION_METRICS[metric]
+    fig, ax = plt.subplots(figsize=(12, 8), facecolor='white')
+    parts = ax.violin(agg['violin'][metric], positions=np.arange(1, len(SEASON_ORDER) + 1),
+                      showmeans=True, showmedians=True)
+    for body in parts['bodies']:
+        body.set_facecolor(color)
+        body.set_alpha(0.7)
+    ax.set_xticks(np.arange(1, len(SEASON_ORDER) + 1))
+    ax.set_xticklabels(SEASON_ORDER, fontname=FONT)
+    _finish(ax, f'{metric}{"" if metric == "AQI达标率" else "浓度"}季节分布小提琴图', '季节', ylabel)
+    return fig
+
+
+def plot_ring(agg):
+    aqi = agg['city_mean']['AQI达标率'].sort_values(ascending=False)
+    colors = plt.cm.Greens(np.linspace(0.4, 0.9, len(aqi)))[::-1]
+    fig, ax = plt.subplots(figsize=(10, 10), facecolor='white')
+    ax.pie(aqi.values, labels=aqi.index, colors=colors, startangle=90, counterclock=False,
+           wedgeprops={'width': 0.3, 'edgecolor': 'white'}, textprops={'fontname': FONT, 'fontsize': 11})
+    ax.set_title('各城市AQI达标率分布环形图', fontsize=16, fontweight='bold', fontname=FONT, pad=20)
+    return fig
+
+
+def plot_stacked_area(agg):
+    annual = agg['annual']['AQI达标率']
+    colors = plt.cm.Greens(np.linspace(0.3, 0.8, len(annual)))
+    fig, ax = plt.subplots(figsize=(14, 8), facecolor='white')
+    ax.stackplot(annual.columns, annual.values, labels=annual.index, colors=colors, alpha=0.8, edgecolor='white')
+    ax.set_xticks(annual.columns)
+    ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': FONT, 'size': 10})
+    _finish(ax, f'各城市AQI达标率贡献变化 ({annual.columns.min()}-{annual.columns.max()})', '年份', 'AQI达标率 (%)')
+    return fig
+
+
+def plot_scatter(agg):
+    city_mean = agg['city_mean']
+    ratio = city_mean['PM2.5'] / city_mean['PM10']
+    fig, ax = plt.subplots(figsize=(12, 10), facecolor='white')
+    points = ax.scatter(city_mean['PM2.5'], city_mean['PM10'], c=ratio, cmap='coolwarm', s=150,
+                        alpha=0.8, edgecolors='white')
+    slope, intercept = np.polyfit(city_mean['PM2.5'], city_mean['PM10'], 1)
+    x_fit = np.linspace(city_mean['PM2.5'].min(), city_mean['PM2.5'].max(), 50)
+    ax.plot(x_fit, slope * x_fit + intercept, color='red', alpha=0.6)
+    for city, x, y in zip(city_mean.index, city_mean['PM2.5'], city_mean['PM10']):
+        ax.annotate(city, (x, y), xytext=(5, 5), textcoords='offset points', fontsize=10, fontname=FONT)
+    fig.colorbar(points, ax=ax).set_label('PM2.5/PM10 比值', fontname=FONT)
+    _finish(ax, 'PM2.5与PM10浓度关系散点图', 'PM2.5浓度 (μg/m³)', 'PM10浓度 (μg/m³)')
+    return fig
+
+
+def plot_bubble(agg):
+    city_mean = agg['city_mean']
+    sizes = (city_mean['PM10'] / city_mean['PM10'].max()) ** 2 * 400
+    fig, ax = plt.subplots(figsize=(12, 10), facecolor='white')
+    points = ax.scatter(city_mean['PM2.5'], city_mean['PM10'], s=sizes, c=city_mean['AQI达标率'] / 100,
+                        cmap='RdYlGn', alpha=0.8, edgecolors='black', linewidth=0.5)
+    ax.axvline(city_mean['PM2.5'].mean(), color='gray', linestyle='--', alpha=0.5)
+    ax.axhline(city_mean['PM10'].mean(), color='gray', linestyle='--', alpha=0.5)
+    for city, x, y in zip(city_mean.index, city_mean['PM2.5'], city_mean['PM10']):
+        ax.annotate(city, (x, y), xytext=(5, 5), textcoords='offset points', fontsize=10, fontname=FONT)
+    fig.colorbar(points, ax=ax).set_label('AQI达标率', fontname=FONT)
+    _finish(ax, '各城市多维度气泡图分析', 'PM2.5浓度 (μg/m³)', 'PM10浓度 (μg/m³)')
+    return fig
+
+
+def plot_parallel(agg):
+    parallel = agg['parallel']
+    x = np.arange(len(PARALLEL_POLLUTANTS))
+    fig, ax = plt.subplots(figsize=(14, 8), facecolor='white')
+    handles = plot_lines_batched(ax, x, parallel.values, plt.cm.tab10(np.linspace(0, 1, len(parallel))),
+                                 labels=parallel.index, marker=None, linewidth=1.5, alpha=0.7)
+    for xi in x:
+        ax.axvline(xi, color='black', linewidth=0.8)
+    ax.set_xticks(x)
+    ax.set_xticklabels([POLLUTANT_LABELS[p] for p in PARALLEL_POLLUTANTS])
+    ax.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': FONT, 'size': 9})
+    _finish(ax, '污染物浓度平行坐标图', '污染物', '归一化浓度')
+    return fig
+
+
+def plot_scatter_density(agg):
+    counts, x_edges, y_edges = agg['scatter_density']
+    fig, ax = plt.subplots(figsize=(12, 10), facecolor='white')
+    mappable = draw_density(ax, counts, extent=(x_edges[0], x_edges[-1], y_edges[0], y_edges[-1]))
+    fig.colorbar(mappable, ax=ax).set_label('子站-月份观测数', fontname=FONT)
+    _finish(ax, 'PM2.5与PM10浓度关系密度图（子站逐月观测）', 'PM2.5浓度 (μg/m³)', 'PM10浓度 (μg/m³)')
+    return fig
+
+
+def plot_parallel_density(agg):
+    fig, ax = plt.subplots(figsize=(14, 8), facecolor='white')
+    mappable = draw_parallel_density(ax, agg['parallel_density'], [POLLUTANT_LABELS[p] for p in PARALLEL_POLLUTANTS])
+    fig.colorbar(mappable, ax=ax).set_label('线段密度', fontname=FONT)
+    _finish(ax, '污染物浓度平行坐标密度图（子站逐月观测）', '污染物', '归一化浓度')
+    return fig
+
+
+def plot_annual_line(agg):
+    annual = agg['annual']['PM2.5']
+    fig, ax = plt.subplots(figsize=(14, 8), facecolor='white')
+    handles = plot_lines_batched(ax, annual.columns, annual.values, plt.cm.Set3(np.linspace(0, 1, len(annual))),
+                                 labels=annual.index, marker='D', linewidth=2.5, markersize=7)
+    ax.set_xticks(annual.columns)
+    ax.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': FONT, 'size': 10})
+    _finish(ax, f'PM2.5浓度年际变化趋势 ({annual.columns.min()}-{annual.columns.max()})', '年份', 'PM2.5浓度 (μg/m³)')
+    return fig
+
+
+def plot_season_annual(agg, season):
+    seasonal = agg['season_annual'][season]
+    fig, ax = plt.subplots(figsize=(12, 8), facecolor='white')
+    handles = plot_lines_batched(ax, seasonal.columns, seasonal.values, plt.cm.tab20(np.linspace(0, 1, len(seasonal))),
+                                 labels=seasonal.index, marker='o', linewidth=2, markersize=6)
+    ax.set_xticks(seasonal.columns)
+    ax.legend(handles=handles, bbox_to_anchor=(1.05, 1), loc='upper left', prop={'family': FONT, 'size': 10})
+    _finish(ax, f'{season}PM2.5浓度年际变化趋势', '年份', 'PM2.5浓度 (μg/m³)')
+    return fig
+
+
+def plot_grouped_bar(agg):
+    latest = agg['latest']
+    x = np.arange(len(latest))
+    width = 0.35
+    fig, ax = plt.subplots(figsize=(14, 8), facecolor='white')
+    ax.bar(x - width / 2, latest['PM2.5'], width, label='PM2.5', color='#FF6B6B', alpha=0.8)
+    ax.bar(x + width / 2, latest['PM10'], width, label='PM10', color='#4ECDC4', alpha=0.8)
+    ax.set_xticks(x)
+    ax.set_xticklabels(latest.index, rotation=45, fontname=FONT)
+    ax.legend(prop={'family': FONT, 'size': 11})
+    _finish(ax, f'各城市污染物浓度对比 ({agg["latest_year"]}年)', '城市', '浓度 (μg/m³)')
+    return fig
+
+
+def plot_concentration_heatmap(agg):
+    matrix = agg['city_mean'][['PM2.5', 'PM10']].T
+    fig, ax = plt.subplots(figsize=(14, 6), facecolor='white')
+    image = ax.imshow(matrix.values, cmap='YlOrRd', aspect='auto')
+    rows, cols = np.indices(matrix.shape)
+    for i, j, value in zip(rows.ravel(), cols.ravel(), matrix.values.ravel()):
+        ax.text(j, i, f'{value:.1f}', ha='center', va='center', fontweight='bold', fontsize=10)
+    ax.set_xticks(range(matrix.shape[1]))
+    ax.set_xticklabels(matrix.columns, rotation=45, fontname=FONT)
+    ax.set_yticks(range(matrix.shape[0]))
+    ax.set_yticklabels(matrix.index)
+    fig.colorbar(image, ax=ax).set_label('浓度 (μg/m³)', fontname=FONT)
+    _finish(ax, '各城市PM2.5和PM10浓度热力图', '城市', '污染物')
+    return fig
+
+
+def plot_corr_heatmap(agg):
+    corr = agg['corr']
+    masked = np.ma.masked_array(corr.values, mask=np.triu(np.ones_like(corr.values, dtype=bool)))
+    labels = [POLLUTANT_LABELS[c] for c in corr.columns]
+    fig, ax = plt.subplots(figsize=(10, 8), facecolor='white')
+    image = ax.imshow(masked, cmap='coolwarm', vmin=-1, vmax=1)
+    rows, cols = np.tril_indices(len(corr), k=-1)
+    for i, j in zip(rows, cols):
+        ax.text(j, i, f'{corr.values[i, j]:.2f}', ha='center', va='center', fontsize=10)
+    ax.set_xticks(range(len(labels)))
+    ax.set_xticklabels(labels, rotation=45)
+    ax.set_yticks(range(len(labels)))
+    ax.set_yticklabels(labels)
+    fig.colorbar(image, ax=ax, shrink=0.8)
+    ax.set_title('污染物相关性热力图', fontsize=16, fontweight='bold', fontname=FONT, pad=20)
+    return fig
+
+
+def plot_composition(agg):
+    composition = agg['composition']
+    colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4', '#FFEAA7']
+    fig, ax = plt.subplots(figsize=(14, 8), facecolor='white')
+    bottom = np.zeros(len(composition))
+    for pollutant, color in zip(PARALLEL_POLLUTANTS, colors):
+        ax.bar(composition.index, composition[pollutant], bottom=bottom, color=color, alpha=0.8,
+               edgecolor='black', linewidth=0.5, label=POLLUTANT_LABELS[pollutant])
+        bottom += composition[pollutant].to_numpy()
+    ax.tick_params(axis='x', rotation=45)
+    ax.legend(prop={'family': FONT, 'size': 10})
+    _finish(ax, '主要城市污染物组成堆叠图', '城市', '污染物浓度总和 (μg/m³)')
+    return fig
+
+
+# 文件名 -> (绘图函数, 额外参数, 是否需要子站数据)
+FIGURES = {
+    'AQI达标率分布_环形图.png': (plot_ring, (), False),
+    'AQI达标率分布_箱线图.png': (plot_box, ('AQI达标率',), False),
+    'PM10浓度分布_箱线图.png': (plot_box, ('PM10',), False),
+    'PM2.5浓度分布_箱线图.png': (plot_box, ('PM2.5',), False),
+    'AQI达标率季节分布_小提琴图.png': (plot_violin, ('AQI达标率',), False),
+    'PM10季节分布_小提琴图.png': (plot_violin, ('PM10',), False),
+    'PM2.5季节分布_小提琴图.png': (plot_violin, ('PM2.5',), False),
+    'AQI达标率贡献变化_堆叠面积图.png': (plot_stacked_area, (), False),
+    'PM2.5_PM10关系_散点图.png': (plot_scatter, (), False),
+    '多维度分析_气泡图.png': (plot_bubble, (), False),
+    'PM2.5_年际变化趋势_折线图.png': (plot_annual_line, (), False),
+    '春季PM2.5年际变化.png': (plot_season_annual, ('春季',), False),
+    '夏季PM2.5年际变化.png': (plot_season_annual, ('夏季',), False),
+    '秋季PM2.5年际变化.png': (plot_season_annual, ('秋季',), False),
+    '冬季PM2.5年际变化.png': (plot_season_annual, ('冬季',), False),
+    '各城市污染物对比_分组柱状图.png': (plot_grouped_bar, (), False),
+    '污染物浓度对比_热力图.png': (plot_concentration_heatmap, (), False),
+    '污染物分析_平行坐标图.png': (plot_parallel, (), True),
+    '污染物相关性_热力图.png': (plot_corr_heatmap, (), True),
+    '污染物组成_堆叠柱状图.png': (plot_composition, (), True),
+    'PM2.5_PM10关系_密度图.png': (plot_scatter_density, (), True),
+    '污染物分析_平行坐标密度图.png': (plot_parallel_density, (), True),
+}
+
+_worker_aggregates = None
+_worker_output_dir = None
+
+
+def _init_worker(aggregates, output_dir):
+    global _worker_aggregates, _worker_output_dir
+    _worker_aggregates = aggregates
+    _worker_output_dir = output_dir
+
+
+def _render(filename):
+    plot_func, args, _ = FIGURES[filename]
+    fig = plot_func(_worker_aggregates, *args)
+    fig.tight_layout()
+    fig.savefig(os.path.join(_worker_output_dir, filename), dpi=300, bbox_inches='tight', facecolor='white')
+    plt.close(fig)
+    return filename
+
+
+def generate_figures_pt2(data_dir=".", output_dir=".", workers=None):
+    """读取预处理数据，预计算汇总数据后并行渲染Figures-pt.2全部图表"""
+    city_data = load_city_data(data_dir)
+    if city_data is None:
+        print("❌ 城市数据不可用，无法生成图表")
+        return []
+    station_data = load_station_data(data_dir)
+    aggregates = build_aggregates(city_data, station_data)
+
+    tasks = [name for name, (_, _, needs_station) in FIGURES.items() if station_data is not None or not needs_station]
+    os.makedirs(output_dir, exist_ok=True)
+    # 每个进程只在初始化时接收一次汇总数据
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(aggregates, output_dir)) as pool:
+        generated = []
+        for filename in pool.map(_render, tasks):
+            print(f"✅ 已生成：{filename}")
+            generated.append(filename)
+    return generated
+
+
+if __name__ == "__main__":
+    generate_figures_pt2()
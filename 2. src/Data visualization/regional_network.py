@@ -0,0 +1,94 @@
+import os
+import sys
+import numpy as np
+import matplotlib as mpl
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+from matplotlib.patches import FancyArrowPatch
+import warnings
+warnings.filterwarnings('ignore')
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data analysis'))
+from station_cube import load_city_cube, load_station_cube
+from lagged_correlation import run_lagged_correlation, lead_lag_summary, MAX_LAG
+
+mpl.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'DejaVu Sans', 'Arial Unicode MS', 'SimSun']
+mpl.rcParams['font.family'] = 'sans-serif'
+mpl.rcParams['axes.unicode_minus'] = False
+
+FONT = 'Microsoft YaHei'
+# 网络图只画峰值相关不低于该值的实体对
+EDGE_THRESHOLD = 0.6
+
+
+def _circle_layout(n):
+    angle = np.pi / 2 - 2 * np.pi * np.arange(n) / n
+    return np.column_stack([np.cos(angle), np.sin(angle)])
+
+
+def plot_regional_network(cube, result, variable='PM2.5', level_name='城市', threshold=EDGE_THRESHOLD,
+                          filename=None):
+    """区域联动网络图：左为同期相关热力图，右为网络图
+
+    同期（滞后0）联动为灰色连线，存在领先-滞后关系的实体对用箭头从领先方指向滞后方，线宽与相关系数成正比
+    """
+    summary = lead_lag_summary(cube, result)
+    labels = [str(name).strip() for name in cube.entities]
+    n = len(labels)
+    zero_lag = result['corr'][list(result['lags']).index(0)]
+
+    fig, (ax_heat, ax_net) = plt.subplots(1, 2, figsize=(20, 9), facecolor='white')
+    image = ax_heat.imshow(zero_lag, cmap='RdYlBu_r', vmin=-1, vmax=1)
+    ax_heat.set_xticks(range(n))
+    ax_heat.set_yticks(range(n))
+    ax_heat.set_xticklabels(labels, rotation=45, ha='right', fontname=FONT, fontsize=10)
+    ax_heat.set_yticklabels(labels, fontname=FONT, fontsize=10)
+    ax_heat.set_title(f'{level_name}{variable}月度距平同期相关', fontsize=14, fontweight='bold', fontname=FONT)
+    fig.colorbar(image, ax=ax_heat, shrink=0.8).set_label('相关系数', fontname=FONT)
+
+    position = _circle_layout(n)
+    index = {name: i for i, name in enumerate(cube.entities)}
+    edges = summary[summary['显著'] & (summary['峰值相关'].abs() >= threshold)]
+    synchronous = edges[edges['最佳滞后(月)'] == 0]
+    lagged = edges[edges['最佳滞后(月)'] != 0]
+
+    # 同期联动：一个LineCollection画完全部连线
+    segments = [position[[index[a], index[b]]] for a, b in zip(synchronous['实体1'], synchronous['实体2'])]
+    widths = 1 + 4 * (synchronous['峰值相关'].abs().to_numpy() - threshold) / (1 - threshold)
+    ax_net.add_collection(LineCollection(segments, colors='gray', linewidths=widths, alpha=0.5, zorder=1))
+    for (_, row), width in zip(lagged.iterrows(), 1 + 4 * (lagged['峰值相关'].abs() - threshold) / (1 - threshold)):
+        # 最佳滞后>0时实体1领先
+        source, target = (row['实体1'], row['实体2']) if row['最佳滞后(月)'] > 0 else (row['实体2'], row['实体1'])
+        ax_net.add_patch(FancyArrowPatch(position[index[source]], position[index[target]], arrowstyle='-|>',
+                                         mutation_scale=18, linewidth=width, color='#CD5C5C', alpha=0.8,
+                                         shrinkA=18, shrinkB=18, zorder=2))
+
+    strength = np.nansum(np.where(np.eye(n, dtype=bool), 0, np.abs(zero_lag)), axis=1)
+    ax_net.scatter(position[:, 0], position[:, 1], s=600 + 300 * strength / max(strength.max(), 1e-9),
+                   c=strength, cmap='YlOrRd', edgecolors='black', zorder=3)
+    for (x, y), label in zip(position * 1.16, labels):
+        ax_net.text(x, y, label, ha='center', va='center', fontsize=11, fontname=FONT, fontweight='bold')
+    ax_net.set_xlim(-1.35, 1.35)
+    ax_net.set_ylim(-1.35, 1.35)
+    ax_net.set_aspect('equal')
+    ax_net.axis('off')
+    ax_net.set_title(f'{level_name}{variable}区域联动网络（|r|≥{threshold}，箭头由领先方指向滞后方，最大滞后{MAX_LAG}个月）',
+                     fontsize=14, fontweight='bold', fontname=FONT)
+
+    fig.suptitle(f'珠三角{level_name}{variable}跨区域滞后相关分析', fontsize=16, fontweight='bold', fontname=FONT)
+    fig.tight_layout()
+    filename = filename or f'{level_name}{variable}_区域联动网络图.png'
+    fig.savefig(filename, dpi=300, bbox_inches='tight', facecolor='white')
+    plt.close(fig)
+    print(f"✅ 已生成：{filename}")
+    return summary
+
+
+if __name__ == "__main__":
+    city_cube = load_city_cube()
+    if city_cube is not None:
+        plot_regional_network(city_cube, run_lagged_correlation(city_cube, 'PM2.5'), 'PM2.5', '城市')
+    station_cube = load_station_cube()
+    if station_cube is not None:
+        plot_regional_network(station_cube, run_lagged_correlation(station_cube, 'PM2.5'), 'PM2.5', '子站',
+                              threshold=0.8)
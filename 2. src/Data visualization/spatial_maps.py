@@ -0,0 +1,157 @@
+import os
+import sys
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import matplotlib as mpl
+from scipy import sparse
+from scipy.spatial import cKDTree
+import warnings
+warnings.filterwarnings('ignore')
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Data analysis'))
+from station_cube import (load_station_cube, load_station_coordinates, normalize_station_name, project_to_km,
+                          SEASON_ORDER, COORDINATE_PATH)
+
+mpl.rcParams['font.sans-serif'] = ['Microsoft YaHei', 'SimHei', 'DejaVu Sans', 'Arial Unicode MS', 'SimSun']
+mpl.rcParams['font.family'] = 'sans-serif'
+mpl.rcParams['mathtext.fontset'] = 'stix'
+mpl.rcParams['axes.unicode_minus'] = False
+
+FONT = 'Microsoft YaHei'
+# 珠三角范围：经度最小值、经度最大值、纬度最小值、纬度最大值
+PRD_BOUNDS = (111.9, 115.5, 21.5, 24.5)
+GRID_RESOLUTION = 0.02
+# 污染物 -> (显示名称, 单位, 显示换算系数)
+POLLUTANT_DISPLAY = {
+    'SO2': ('$\\mathregular{SO_2}$', 'μg/m³', 1),
+    'NO2': ('$\\mathregular{NO_2}$', 'μg/m³', 1),
+    'O3': ('$\\mathregular{O_3}$', 'μg/m³', 1),
+    'CO_μg/m3': ('CO', 'mg/m³', 0.001),
+    'PM10': ('PM10', 'μg/m³', 1),
+    'PM2.5': ('PM2.5', 'μg/m³', 1),
+}
+
+
+def make_grid(bounds=PRD_BOUNDS, resolution=GRID_RESOLUTION):
+    lon = np.arange(bounds[0], bounds[1] + resolution / 2, resolution)
+    lat = np.arange(bounds[2], bounds[3] + resolution / 2, resolution)
+    return lon, lat
+
+
+def idw_weights(station_lon, station_lat, grid_lon, grid_lat, k=8, power=2, max_distance_km=40):
+    """反距离权重矩阵 - KD树查询每个网格点的k个最近子站，返回 (网格点数, 子站数) 稀疏矩阵
+
+    距离超过max_distance_km的子站权重为0，远离所有子站的网格点（如外海）插值结果为NaN
+    权重只依赖坐标和网格，计算一次后可复用于所有月份和污染物
+    """
+    n_station = len(station_lon)
+    k = min(k, n_station)
+    lat0 = np.deg2rad(np.mean(station_lat))
+    tree = cKDTree(project_to_km(np.asarray(station_lon), np.asarray(station_lat), lat0))
+    grid_lon2d, grid_lat2d = np.meshgrid(grid_lon, grid_lat)
+    distance, index = tree.query(project_to_km(grid_lon2d.ravel(), grid_lat2d.ravel(), lat0), k=k)
+    distance = distance.reshape(-1, k)
+    index = index.reshape(-1, k)
+
+    weights = 1 / np.maximum(distance, 1e-6) ** power
+    weights[distance > max_distance_km] = 0
+    rows = np.repeat(np.arange(len(distance)), k)
+    return sparse.csr_matrix((weights.ravel(), (rows, index.ravel())), shape=(len(distance), n_station))
+
+
+def interpolate_layers(weights, station_values):
+    """一次稀疏矩阵乘法插值全部图层
+
+    station_values: (子站数, 图层数)，缺测为NaN；缺测子站同时从分子和分母中剔除，权重自动重新归一化
+    返回 (网格点数, 图层数)
+    """
+    observed = np.isfinite(station_values)
+    numerator = weights @ np.where(observed, station_values, 0)
+    denominator = weights @ observed.astype(float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return numerator / denominator
+
+
+def build_surfaces(cube, coords, grid_lon, grid_lat, **idw_kwargs):
+    """计算逐月与季节平均的插值浓度面
+
+    返回 (monthly[n_lat, n_lon, n_month, n_var], seasonal[n_lat, n_lon, 4, n_var], 子站坐标)
+    """
+    station_keys = [normalize_station_name(name) for name in cube.entities]
+    located = np.array([key in coords.index for key in station_keys])
+    if not located.all():
+        missing = [name for name, ok in zip(cube.entities, located) if not ok]
+        print(f"警告：以下子站缺少坐标，不参与插值：{missing}")
+    station_coords = coords.loc[[key for key, ok in zip(station_keys, located) if ok]]
+    values = cube.values[located]
+    n_station, n_month, n_var = values.shape
+
+    # 季节平均（跨年份）作为额外图层，与逐月图层一起做同一次矩阵乘法
+    seasons = cube.seasons
+    seasonal_values = np.stack([np.nanmean(values[:, seasons == season, :], axis=1) for season in SEASON_ORDER],
+                               axis=1)
+    layers = np.concatenate([values.reshape(n_station, -1), seasonal_values.reshape(n_station, -1)], axis=1)
+
+    weights = idw_weights(station_coords['经度'].to_numpy(), station_coords['纬度'].to_numpy(),
+                          grid_lon, grid_lat, **idw_kwargs)
+    surfaces = interpolate_layers(weights, layers).reshape(len(grid_lat), len(grid_lon), -1)
+    monthly = surfaces[:, :, :n_month * n_var].reshape(len(grid_lat), len(grid_lon), n_month, n_var)
+    seasonal = surfaces[:, :, n_month * n_var:].reshape(len(grid_lat), len(grid_lon), len(SEASON_ORDER), n_var)
+    return monthly, seasonal, station_coords
+
+
+def _draw_panels(panels, titles, suptitle, grid_lon, grid_lat, station_coords, unit, ncols, filename):
+    n_panels = len(panels)
+    nrows = int(np.ceil(n_panels / ncols))
+    fig, axes = plt.subplots(nrows, ncols, figsize=(4.5 * ncols, 4 * nrows), facecolor='white', squeeze=False)
+    vmin = np.nanmin(panels)
+    vmax = np.nanmax(panels)
+    extent = (grid_lon[0], grid_lon[-1], grid_lat[0], grid_lat[-1])
+    for ax, panel, title in zip(axes.ravel(), panels, titles):
+        image = ax.imshow(panel, origin='lower', extent=extent, cmap='YlOrRd', vmin=vmin, vmax=vmax, aspect='auto')
+        ax.scatter(station_coords['经度'], station_coords['纬度'], s=8, c='black', marker='^')
+        ax.set_title(title, fontsize=12, fontname=FONT)
+        ax.tick_params(labelsize=8)
+    for ax in axes.ravel()[n_panels:]:
+        ax.axis('off')
+    fig.suptitle(suptitle, fontsize=16, fontweight='bold', fontname=FONT)
+    fig.colorbar(image, ax=axes.ravel().tolist(), shrink=0.8).set_label(f'浓度 ({unit})', fontname=FONT)
+    fig.savefig(filename, dpi=200, bbox_inches='tight', facecolor='white')
+    plt.close(fig)
+    print(f"✅ 已生成：{filename}")
+
+
+def plot_spatial_interpolation_maps(data_dir=".", info_path="监测子站资料.xlsx", coords_path=COORDINATE_PATH,
+                                    output_dir=".", resolution=GRID_RESOLUTION):
+    """批量绘制各污染物逐月（每年一张3×4组图）与季节平均的IDW空间插值图"""
+    cube = load_station_cube(data_dir)
+    coords = load_station_coordinates(info_path, coords_path)
+    if cube is None or coords is None:
+        print("❌ 子站数据或坐标不可用，跳过空间插值分析")
+        return None
+
+    grid_lon, grid_lat = make_grid(resolution=resolution)
+    monthly, seasonal, station_coords = build_surfaces(cube, coords, grid_lon, grid_lat)
+    os.makedirs(output_dir, exist_ok=True)
+    years = cube.years
+
+    for v, variable in enumerate(cube.variables):
+        label, unit, scale = POLLUTANT_DISPLAY.get(variable, (variable, '', 1))
+        safe_name = variable.replace('/', '_')
+        for year in np.unique(years):
+            in_year = np.flatnonzero(years == year)
+            panels = np.moveaxis(monthly[:, :, in_year, v], 2, 0) * scale
+            titles = [cube.months[i] for i in in_year]
+            _draw_panels(panels, titles, f'子站{label}浓度逐月空间插值 ({year}年)', grid_lon, grid_lat,
+                         station_coords, unit, 4, os.path.join(output_dir, f'子站_{safe_name}_{year}年逐月空间插值.png'))
+
+        panels = np.moveaxis(seasonal[:, :, :, v], 2, 0) * scale
+        _draw_panels(panels, SEASON_ORDER, f'子站{label}浓度季节平均空间插值', grid_lon, grid_lat,
+                     station_coords, unit, 4, os.path.join(output_dir, f'子站_{safe_name}_季节空间插值.png'))
+    return monthly, seasonal
+
+
+if __name__ == "__main__":
+    plot_spatial_interpolation_maps()